@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+try:
+    import numpy as np
+    from PIL import Image, ImageDraw
+except ImportError:
+    print("合成对比需要安装依赖，请运行: pip install -r requirements.txt")
+    sys.exit(1)
+
+plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if plugin_dir not in sys.path:
+    sys.path.insert(0, plugin_dir)
+
+from core.touchi import (
+    load_items, choose_safe_region, place_items, render_safe_layout_gif, safe_cell_size, build_safe_timeline,
+    warm_up_render_caches, _draw_hatch, _search_orbit, _entrance_block, _entrance_scale, _scaled,
+    BACKGROUND_COLORS, DEFAULT_BACKGROUND_COLOR, ITEM_BORDER_COLOR, BORDER_WIDTH, SEARCH_ICON_SIZE, sousuo_path
+)
+from core.loot_table import get_drop_table
+from core.sprite_cache import get_sprite
+
+
+def render_with_pil(placed_items, grid_size, cell_size):
+    """原来的逐帧渲染方式：每帧新建底图和透明层，用 ImageDraw 绘制后 alpha_composite，作为对比基准"""
+    img_size = grid_size * cell_size
+    windows, frame_ops = build_safe_timeline(placed_items)
+    icon_size = _scaled(SEARCH_ICON_SIZE, cell_size)
+    icon = get_sprite(sousuo_path, (icon_size, icon_size), fit="stretch") if os.path.exists(sousuo_path) else None
+
+    frames = []
+    for ops in frame_ops:
+        safe_img = Image.new("RGB", (img_size, img_size), (50, 50, 50))
+        draw = ImageDraw.Draw(safe_img)
+        for i in range(1, grid_size):
+            draw.line([(i * cell_size, 0), (i * cell_size, img_size)], fill=(80, 80, 80), width=1)
+            draw.line([(0, i * cell_size), (img_size, i * cell_size)], fill=(80, 80, 80), width=1)
+
+        overlay = Image.new("RGBA", safe_img.size, (0, 0, 0, 0))
+        overlay_draw = ImageDraw.Draw(overlay)
+        for op in ops:
+            kind, i = op[0], op[1]
+            placed = placed_items[i]
+            item = placed["item"]
+            x0, y0 = placed["x"] * cell_size, placed["y"] * cell_size
+            x1, y1 = x0 + placed["width"] * cell_size, y0 + placed["height"] * cell_size
+
+            if kind in ("hidden", "search"):
+                _draw_hatch(overlay_draw, x0, y0, x1, y1, cell_size)
+                if kind == "search":
+                    search_start, search_end, _ = windows[i]
+                    angle, dx, dy = _search_orbit(search_end - search_start, cell_size, icon_size)[op[2]]
+                    center_x, center_y = (x0 + x1) // 2, (y0 + y1) // 2
+                    if icon is not None:
+                        overlay.paste(icon, (center_x + dx, center_y + dy), icon)
+                    else:
+                        radius = cell_size // 14
+                        overlay_draw.arc([center_x - radius, center_y - radius, center_x + radius, center_y + radius],
+                                         angle, angle + 150, fill=(255, 255, 255, 220), width=_scaled(3, cell_size))
+                continue
+
+            bg_color = BACKGROUND_COLORS.get(item["level"], DEFAULT_BACKGROUND_COLOR)
+            inner_box = (x1 - x0, y1 - y0)
+            if kind == "entrance":
+                dx, dy, block_width, block_height, block_color = _entrance_block(bg_color, x1 - x0, y1 - y0, op[2])
+                overlay_draw.rectangle([x0 + dx, y0 + dy, x0 + dx + block_width, y0 + dy + block_height],
+                                       fill=block_color)
+                scale = _entrance_scale(op[2])
+            else:
+                overlay_draw.rectangle([x0, y0, x1, y1], fill=bg_color)
+                scale = 1.0
+
+            try:
+                item_img = get_sprite(item["path"], inner_box, placed["rotated"], scale=scale)
+                paste_x = x0 + (inner_box[0] - item_img.width) // 2
+                paste_y = y0 + (inner_box[1] - item_img.height) // 2
+                overlay.paste(item_img, (int(paste_x), int(paste_y)), item_img)
+            except Exception:
+                pass
+            draw.rectangle([x0, y0, x1, y1], outline=ITEM_BORDER_COLOR, width=BORDER_WIDTH)
+
+        frames.append(Image.alpha_composite(safe_img.convert("RGBA"), overlay).convert("RGB"))
+    return frames
+
+
+def build_layout(items, grid_size, seed):
+    random.seed(seed)
+    selected = get_drop_table(items).roll(np.random.default_rng(seed))
+    region_width, region_height = choose_safe_region(grid_size)
+    return place_items(selected, region_width, region_height, grid_size), region_width, region_height
+
+
+def timed(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def benchmark(grid_sizes, seeds, repeat, gif_scale):
+    items = load_items()
+    if not items:
+        print("缺少物品图片资源")
+        return
+
+    cell_size = safe_cell_size(gif_scale)
+    warm_up_render_caches(cell_size)
+    print(f"\n{'格子':<8}{'帧数':>8}{'原方式(ms)':>14}{'合成器(ms)':>14}{'每帧(ms)':>16}{'加速':>8}{'结果':>8}")
+    for grid_size in grid_sizes:
+        frame_count = 0
+        before = after = 0.0
+        identical = True
+        for seed in seeds:
+            placed_items, region_width, region_height = build_layout(items, grid_size, seed)
+            reference, elapsed_before = timed(lambda: render_with_pil(placed_items, grid_size, cell_size), repeat)
+            (frames, total_frames), elapsed_after = timed(
+                lambda: render_safe_layout_gif(placed_items, 0, 0, region_width, region_height, grid_size, cell_size),
+                repeat)
+            identical = identical and all(a.tobytes() == b.tobytes() for a, b in zip(reference, frames))
+            frame_count += total_frames
+            before += elapsed_before
+            after += elapsed_after
+
+        per_frame = f"{before / frame_count:.2f} -> {after / frame_count:.2f}"
+        print(f"{f'{grid_size}x{grid_size}':<8}{frame_count:>8}{before:>14.0f}{after:>14.0f}{per_frame:>16}"
+              f"{before / after:>7.1f}x{'一致' if identical else '不一致':>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比保险箱动画帧在逐帧 PIL 绘制和 NumPy 合成器下的渲染耗时")
+    parser.add_argument("--grids", nargs="+", type=int, default=[2, 3, 4, 5, 6, 7], help="保险箱格子数（默认 2 到 7）")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1, 2, 3], help="随机种子，每个种子生成一个保险箱")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复渲染次数，取中位数")
+    parser.add_argument("--gif-scale", type=float, default=0.7, help="输出缩放比例（默认 0.7，即 70 像素格子）")
+    args = parser.parse_args()
+    benchmark(args.grids, args.seeds, max(1, args.repeat), args.gif_scale)
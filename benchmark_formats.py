@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+try:
+    import numpy as np
+except ImportError:
+    print("格式对比需要安装依赖，请运行: pip install -r requirements.txt")
+    sys.exit(1)
+
+plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if plugin_dir not in sys.path:
+    sys.path.insert(0, plugin_dir)
+
+from core.touchi import (
+    load_items, load_expressions, choose_safe_region, place_items, render_safe_layout_gif,
+    compose_safe_frames, safe_cell_size
+)
+from core.loot_table import get_drop_table
+from core.sprite_cache import load_frames
+from core.animation_output import AnimationOptions, encode_animation, format_supported
+
+# 对比的格式和参数组合：(名称, 格式, 参数)
+VARIANTS = [
+    ("gif", "gif", AnimationOptions()),
+    ("gif 128色", "gif", AnimationOptions(gif_colors=128)),
+    ("webp q80 m4", "webp", AnimationOptions(webp_quality=80, webp_method=4)),
+    ("webp q80 m0", "webp", AnimationOptions(webp_quality=80, webp_method=0)),
+    ("webp 无损", "webp", AnimationOptions(webp_lossless=True, webp_quality=50, webp_method=4)),
+    ("apng 6", "apng", AnimationOptions(apng_compress_level=6)),
+    ("apng 1", "apng", AnimationOptions(apng_compress_level=1)),
+]
+
+
+def build_box(items, expressions, grid_size, seed, gif_scale=0.7, menggong_mode=False):
+    """按固定随机种子生成一个保险箱的最终动画帧（与偷吃时的合成方式相同）"""
+    random.seed(seed)
+    selected = get_drop_table(items, menggong_mode).roll(np.random.default_rng(seed))
+    region_width, region_height = choose_safe_region(grid_size)
+    placed_items = place_items(selected, region_width, region_height, grid_size)
+
+    cell_size = safe_cell_size(gif_scale)
+    safe_frames, _ = render_safe_layout_gif(placed_items, 0, 0, region_width, region_height, grid_size, cell_size)
+    expression_size = grid_size * cell_size
+    box = (expression_size, expression_size)
+    eating_frames = load_frames(expressions["eating"], box)
+    final_expr_img = load_frames(expressions["happy"], box)[0]
+    return compose_safe_frames(safe_frames, eating_frames, final_expr_img, expression_size), len(placed_items)
+
+
+def benchmark(grid_sizes, seeds, repeat):
+    items = load_items()
+    expressions = load_expressions()
+    if not items or "eating" not in expressions or "happy" not in expressions:
+        print("缺少物品或表情图片资源")
+        return
+
+    variants = [v for v in VARIANTS if format_supported(v[1])]
+    skipped = [v[0] for v in VARIANTS if not format_supported(v[1])]
+    if skipped:
+        print(f"当前 PIL 不支持，已跳过: {', '.join(skipped)}")
+
+    totals = {name: [0, 0.0] for name, _, _ in variants}
+    for grid_size in grid_sizes:
+        for seed in seeds:
+            frames, item_count = build_box(items, expressions, grid_size, seed)
+            width, height = frames[0].size
+            print(f"\n保险箱 {grid_size}x{grid_size}（种子 {seed}，{item_count}个物品，{len(frames)}帧，{width}x{height}）")
+            print(f"  {'格式':<14}{'大小(KB)':>10}{'编码(ms)':>10}")
+            for name, fmt, options in variants:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    data, _ = encode_animation(frames, fmt, duration=150, loop=0, options=options)
+                    timings.append((time.perf_counter() - start) * 1000)
+                elapsed = statistics.median(timings)
+                totals[name][0] += len(data)
+                totals[name][1] += elapsed
+                print(f"  {name:<14}{len(data) / 1024:>10.1f}{elapsed:>10.0f}")
+
+    print("\n合计")
+    print(f"  {'格式':<14}{'大小(KB)':>10}{'编码(ms)':>10}")
+    for name, (size, elapsed) in totals.items():
+        print(f"  {name:<14}{size / 1024:>10.1f}{elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比保险箱动图在 GIF / WebP / APNG 格式下的体积和编码耗时")
+    parser.add_argument("--grids", nargs="+", type=int, default=[2, 4, 7], help="保险箱格子数（默认 2 4 7）")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1, 2], help="随机种子，每个种子生成一个保险箱")
+    parser.add_argument("--repeat", type=int, default=3, help="每种格式重复编码次数，取中位数")
+    args = parser.parse_args()
+    benchmark(args.grids, args.seeds, max(1, args.repeat))
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+try:
+    from PIL import Image
+except ImportError:
+    print("资源构建需要安装PIL依赖，请运行: pip install Pillow>=8.0.0")
+    sys.exit(1)
+
+plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if plugin_dir not in sys.path:
+    sys.path.insert(0, plugin_dir)
+
+from core.item_catalog import ItemCatalog, items_dir, xinwuzi_dir
+from core.sprite_cache import (
+    SpriteCache, render_frames, sprite_key, asset_key, source_signature,
+    prebuilt_dir, MANIFEST_NAME, MANIFEST_VERSION
+)
+
+core_dir = os.path.join(plugin_dir, "core")
+expressions_dir = os.path.join(core_dir, "expressions")
+biaoqing_dir = os.path.join(core_dir, "biaoqing")
+
+# 渲染器实际使用的尺寸
+SAFE_CELL_SIZES = (100, 70)     # 保险箱格子：原始尺寸和 70% GIF 缩放
+TUJIAN_CELL_SIZE = 100          # 图鉴格子
+TUJIAN_MARGIN = 20              # 图鉴物品内边距
+ZHOU_ITEM_SIZE = (64, 64)       # 洲了个洲卡牌中的物品（80px 卡牌减去边距）
+ZHOU_SIZES = ('1x1', '2x2', '3x3')
+GRID_SIZES = range(2, 8)        # 保险箱格子数（特勤处 0-5 级）
+SOUSUO_SIZE = 60                # 搜索图标
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+# 独立运行的日志配置
+class Logger:
+    def __init__(self):
+        self.logger = logging.getLogger('build_assets')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('[%(levelname)s] %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def info(self, msg):
+        self.logger.info(msg)
+
+    def error(self, msg):
+        self.logger.error(msg)
+
+    def warning(self, msg):
+        self.logger.warning(msg)
+
+
+logger = Logger()
+
+
+class AssetBuilder:
+    """离线资源构建器：把源图片缩放成渲染器直接使用的尺寸并写入清单"""
+
+    def __init__(self, output_dir=prebuilt_dir):
+        self.output_dir = output_dir
+        self.manifest = {
+            "version": MANIFEST_VERSION,
+            "built_at": int(time.time()),
+            "sources": {},
+            "sprites": {},
+            "frames": {},
+            "files": {}
+        }
+        self.written = 0
+        self.bytes_written = 0
+
+    def _output_name(self, key, suffix=""):
+        # 清单键中包含路径分隔符和尺寸，转换成平铺的文件名
+        source, options = key.split("|", 1)
+        source = os.path.splitext(source)[0].replace("/", "__")
+        return f"{source}_{options.replace('|', '_')}{suffix}.png"
+
+    def _save(self, image, name):
+        path = os.path.join(self.output_dir, name)
+        # 不携带任何元数据块，只保存像素
+        image.save(path, "PNG", optimize=True)
+        self.written += 1
+        self.bytes_written += os.path.getsize(path)
+        return name
+
+    def _track_source(self, path):
+        self.manifest["sources"][asset_key(path)] = source_signature(path)
+
+    def add_sprite(self, path, box, rotated=False, fit="fit"):
+        key = sprite_key(path, box, rotated, fit)
+        if key in self.manifest["sprites"]:
+            return
+        sprite = SpriteCache.render(path, box, rotated, fit)
+        self.manifest["sprites"][key] = self._save(sprite, self._output_name(key))
+        self._track_source(path)
+
+    def add_frames(self, path, box):
+        key = sprite_key(path, box, False, "stretch")
+        if key in self.manifest["frames"]:
+            return
+        files = []
+        for idx, frame in enumerate(render_frames(path, box)):
+            files.append(self._save(frame, self._output_name(key, f"_f{idx:03d}")))
+        self.manifest["frames"][key] = files
+        self._track_source(path)
+
+    def add_stripped_file(self, path):
+        """去除元数据后重新保存，只有体积变小时才写入清单
+
+        动图保持原样：用 PIL 重新编码 GIF 会改变调色板和帧处理方式。
+        """
+        name = asset_key(path).replace("/", "__")
+        out_path = os.path.join(self.output_dir, name)
+        with Image.open(path) as img:
+            if getattr(img, "is_animated", False):
+                return
+            img.save(out_path, optimize=True)
+        if os.path.getsize(out_path) >= os.path.getsize(path):
+            os.remove(out_path)
+            return
+        self.written += 1
+        self.bytes_written += os.path.getsize(out_path)
+        self.manifest["files"][asset_key(path)] = name
+        self._track_source(path)
+
+    def build_items(self):
+        catalog = ItemCatalog([("items", items_dir), ("xinwuzi", xinwuzi_dir)])
+        catalog.refresh()
+        zhou_dir = os.path.abspath(items_dir)
+        for item in catalog.items:
+            w, h = item["grid_width"], item["grid_height"]
+            orientations = [(w, h, False)]
+            if w != h:
+                orientations.append((h, w, True))
+            try:
+                for width, height, rotated in orientations:
+                    for cell_size in SAFE_CELL_SIZES:
+                        self.add_sprite(item["path"], (width * cell_size, height * cell_size), rotated)
+                    self.add_sprite(item["path"], (width * TUJIAN_CELL_SIZE - TUJIAN_MARGIN,
+                                                   height * TUJIAN_CELL_SIZE - TUJIAN_MARGIN), rotated)
+                if (item["size"] in ZHOU_SIZES and item["path"].endswith(".png")
+                        and os.path.dirname(item["path"]) == zhou_dir):
+                    self.add_sprite(item["path"], ZHOU_ITEM_SIZE, fit="stretch")
+            except Exception as e:
+                logger.error(f"处理物品图片失败: {item['path']}, 错误: {e}")
+        logger.info(f"物品图片处理完成，共{len(catalog.items)}个物品")
+
+    def build_expressions(self):
+        if not os.path.exists(expressions_dir):
+            logger.warning(f"表情文件夹不存在: {expressions_dir}")
+            return
+        for filename in sorted(os.listdir(expressions_dir)):
+            path = os.path.join(expressions_dir, filename)
+            if not filename.lower().endswith(VALID_EXTENSIONS):
+                continue
+            try:
+                if os.path.splitext(filename)[0] == "sousuo":
+                    for cell_size in SAFE_CELL_SIZES:
+                        size = SOUSUO_SIZE * cell_size // 100
+                        self.add_sprite(path, (size, size), fit="stretch")
+                    continue
+                for cell_size in SAFE_CELL_SIZES:
+                    for grid_size in GRID_SIZES:
+                        size = grid_size * cell_size
+                        self.add_frames(path, (size, size))
+            except Exception as e:
+                logger.error(f"处理表情图片失败: {path}, 错误: {e}")
+        logger.info("表情图片处理完成")
+
+    def build_biaoqing(self):
+        if not os.path.exists(biaoqing_dir):
+            logger.warning(f"表情包文件夹不存在: {biaoqing_dir}")
+            return
+        for filename in sorted(os.listdir(biaoqing_dir)):
+            path = os.path.join(biaoqing_dir, filename)
+            if not filename.lower().endswith(VALID_EXTENSIONS):
+                continue
+            try:
+                self.add_stripped_file(path)
+            except Exception as e:
+                logger.error(f"处理表情包失败: {path}, 错误: {e}")
+        logger.info("表情包处理完成")
+
+    def clean(self):
+        """清空旧的构建产物"""
+        if not os.path.exists(self.output_dir):
+            return
+        for filename in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, filename)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def write_manifest(self):
+        manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        return manifest_path
+
+    def build(self, targets=("items", "expressions", "biaoqing")):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.clean()
+        start = time.time()
+        if "items" in targets:
+            self.build_items()
+        if "expressions" in targets:
+            self.build_expressions()
+        if "biaoqing" in targets:
+            self.build_biaoqing()
+        manifest_path = self.write_manifest()
+        logger.info(
+            f"资源构建完成：{self.written}个文件，{self.bytes_written / 1024 / 1024:.1f} MB，"
+            f"耗时 {time.time() - start:.1f}s，清单: {manifest_path}"
+        )
+        return manifest_path
+
+
+def build_assets(output_dir=prebuilt_dir, targets=("items", "expressions", "biaoqing")):
+    """构建渲染用资源，返回清单路径"""
+    return AssetBuilder(output_dir).build(targets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预处理偷吃插件图片资源，生成渲染器直接使用的缩放图片和清单")
+    parser.add_argument("--output", default=prebuilt_dir, help="输出目录（默认 core/prebuilt）")
+    parser.add_argument("--only", nargs="+", choices=["items", "expressions", "biaoqing"],
+                        default=["items", "expressions", "biaoqing"], help="只构建指定类别（会替换已有的构建产物和清单）")
+    args = parser.parse_args()
+    build_assets(args.output, tuple(args.only))
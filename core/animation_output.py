@@ -0,0 +1,144 @@
+import io
+from PIL import Image
+from .gif_encoder import encode_gif, merge_duplicate_frames, MAX_COLORS
+
+# 可选的动图格式及对应的文件扩展名
+SUPPORTED_FORMATS = ("gif", "webp", "apng")
+FORMAT_EXTENSIONS = {"gif": ".gif", "webp": ".webp", "apng": ".png"}
+# 各格式在 PIL 中的保存插件名称，用于检查当前环境能否写出多帧动图
+_PIL_FORMATS = {"gif": "GIF", "webp": "WEBP", "apng": "PNG"}
+
+DEFAULT_FORMAT = "gif"
+# 默认认为支持 webp/apng 动图的平台适配器
+DEFAULT_PLATFORMS = ["aiocqhttp"]
+
+
+def format_supported(fmt):
+    """当前 PIL 是否能编码该格式的多帧动图"""
+    if fmt == "gif":
+        return True
+    if fmt not in _PIL_FORMATS:
+        return False
+    Image.init()
+    return _PIL_FORMATS[fmt] in Image.SAVE_ALL
+
+
+class AnimationOptions:
+    """各动图格式的质量/速度参数（对应 _conf_schema.json 中的配置项）"""
+
+    def __init__(self, gif_colors=MAX_COLORS, webp_quality=80, webp_method=4, webp_lossless=False,
+                 apng_compress_level=6):
+        self.gif_colors = max(2, min(int(gif_colors), MAX_COLORS))
+        self.webp_quality = max(0, min(int(webp_quality), 100))
+        self.webp_method = max(0, min(int(webp_method), 6))
+        self.webp_lossless = bool(webp_lossless)
+        self.apng_compress_level = max(0, min(int(apng_compress_level), 9))
+
+    def to_dict(self):
+        """转换为基本类型，便于传给渲染子进程"""
+        return dict(vars(self))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            gif_colors=config.get("gif_colors", MAX_COLORS),
+            webp_quality=config.get("webp_quality", 80),
+            webp_method=config.get("webp_method", 4),
+            webp_lossless=config.get("webp_lossless", False),
+            apng_compress_level=config.get("apng_compress_level", 6)
+        )
+
+
+class AnimationFormatSelector:
+    """按群选择动图格式：群单独配置 > 全局默认；平台或 PIL 不支持时回退为 gif"""
+
+    def __init__(self, default_format=DEFAULT_FORMAT, group_formats=None, platforms=None):
+        self.default_format = self._normalize(default_format) or DEFAULT_FORMAT
+        self.platforms = set(DEFAULT_PLATFORMS if platforms is None else platforms)
+        self.group_formats = {}
+        for entry in group_formats or []:
+            # 格式: 群号:格式，如 123456:webp
+            group_id, sep, fmt = str(entry).partition(":")
+            fmt = self._normalize(fmt)
+            if not sep or not group_id.strip() or not fmt:
+                print(f"[Touchi] 忽略无效的群动图格式配置: {entry}")
+                continue
+            self.group_formats[group_id.strip()] = fmt
+
+    @staticmethod
+    def _normalize(fmt):
+        fmt = str(fmt or "").strip().lower()
+        return fmt if fmt in SUPPORTED_FORMATS else None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            default_format=config.get("animation_format", DEFAULT_FORMAT),
+            group_formats=config.get("animation_format_groups", []),
+            platforms=config.get("animation_format_platforms", DEFAULT_PLATFORMS)
+        )
+
+    def format_for(self, event):
+        """返回该消息所在群应使用的动图格式"""
+        fmt = self.default_format
+        try:
+            group_id = event.get_group_id()
+        except Exception:
+            group_id = None
+        if group_id:
+            fmt = self.group_formats.get(str(group_id), fmt)
+
+        if fmt == "gif":
+            return fmt
+        try:
+            platform = event.get_platform_name()
+        except Exception:
+            platform = None
+        if platform not in self.platforms or not format_supported(fmt):
+            return "gif"
+        return fmt
+
+
+def encode_animation(frames, fmt=DEFAULT_FORMAT, duration=150, loop=0, options=None):
+    """
+    把 RGB 帧编码为动图，格式不可用时回退为 gif。
+
+    Returns:
+        tuple: (bytes, 实际使用的格式)
+    """
+    options = options or AnimationOptions()
+    if fmt not in SUPPORTED_FORMATS or not format_supported(fmt):
+        fmt = "gif"
+    if fmt == "gif":
+        return encode_gif(frames, duration, loop, options.gif_colors), fmt
+
+    durations = list(duration) if isinstance(duration, (list, tuple)) else [duration] * len(frames)
+    frames, durations = merge_duplicate_frames(frames, durations)
+    buffer = io.BytesIO()
+    save_kwargs = {
+        "save_all": True,
+        "append_images": frames[1:],
+        "duration": durations if len(durations) > 1 else durations[0],
+        "loop": loop
+    }
+    if fmt == "webp":
+        save_kwargs.update({
+            "quality": options.webp_quality,
+            "method": options.webp_method,
+            "lossless": options.webp_lossless
+        })
+        frames[0].save(buffer, "WEBP", **save_kwargs)
+    else:
+        # APNG：PIL 会自动只写入相邻帧之间变化的区域
+        save_kwargs.update({"compress_level": options.apng_compress_level})
+        frames[0].save(buffer, "PNG", **save_kwargs)
+    return buffer.getvalue(), fmt
+
+
+def save_animation(frames, output_base, fmt=DEFAULT_FORMAT, duration=150, loop=0, options=None):
+    """编码并写入文件，output_base 不带扩展名，返回实际写入的文件路径"""
+    data, fmt = encode_animation(frames, fmt, duration, loop, options)
+    output_path = output_base + FORMAT_EXTENSIONS[fmt]
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
@@ -0,0 +1,61 @@
+import uuid
+import threading
+
+
+class ArtifactStore:
+    """
+    渲染结果的内存存储：每张图片分配唯一句柄，数据只保存在内存中，不再写入 core/output。
+
+    put 之后引用计数为 1；需要在多处发送时先 acquire，每处发送完成后 release，计数归零即释放。
+    """
+
+    def __init__(self):
+        self._artifacts = {}  # handle -> [data, extension, refs]
+        self._lock = threading.Lock()
+
+    def put(self, data, extension):
+        """保存图片数据，返回句柄"""
+        handle = f"{uuid.uuid4().hex}{extension}"
+        with self._lock:
+            self._artifacts[handle] = [data, extension, 1]
+        return handle
+
+    def get(self, handle):
+        """获取图片数据，句柄不存在（已释放）时返回 None"""
+        artifact = self._artifacts.get(handle)
+        return artifact[0] if artifact else None
+
+    def extension(self, handle):
+        artifact = self._artifacts.get(handle)
+        return artifact[1] if artifact else None
+
+    def acquire(self, handle):
+        with self._lock:
+            artifact = self._artifacts.get(handle)
+            if artifact is None:
+                return False
+            artifact[2] += 1
+            return True
+
+    def release(self, handle):
+        """释放一次引用，计数归零时删除数据"""
+        if not handle:
+            return
+        with self._lock:
+            artifact = self._artifacts.get(handle)
+            if artifact is None:
+                return
+            artifact[2] -= 1
+            if artifact[2] <= 0:
+                del self._artifacts[handle]
+
+    @property
+    def total_bytes(self):
+        return sum(len(artifact[0]) for artifact in list(self._artifacts.values()))
+
+    def __len__(self):
+        return len(self._artifacts)
+
+
+# 全局产物存储
+artifact_store = ArtifactStore()
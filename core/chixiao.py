@@ -1,13 +1,15 @@
 import random
-import aiosqlite
 import os
 from datetime import datetime
+from .sprite_cache import resolve_asset_path
+from .database import get_database
 
 class ChixiaoSystem:
     """赤枭巡猎PVP系统"""
 
     def __init__(self, db_path, biaoqing_dir):
         self.db_path = db_path
+        self.db = get_database(db_path)
         self.biaoqing_dir = biaoqing_dir
 
         # 赤枭配置
@@ -21,7 +23,7 @@ class ChixiaoSystem:
     async def initialize_database(self):
         """初始化赤枭相关数据表"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 # 赤枭状态表
                 await db.execute("""
 
@@ -67,7 +69,7 @@ class ChixiaoSystem:
             if value < self.base_requirement:
                 return False, f"❌ 装备价值不足！\n📦 最低要求: {self.base_requirement:,}\n💰 你的价值: {value:,}"
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute("BEGIN IMMEDIATE")
                 cursor = await db.execute(
                     "SELECT warehouse_value FROM user_economy WHERE user_id = ?",
@@ -131,7 +133,7 @@ class ChixiaoSystem:
             tuple: (success, message)
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 # 获取当前赤枭状态
                 cursor = await db.execute(
                     "SELECT equipment_value, total_kills FROM chixiao_status WHERE user_id = ?",
@@ -168,7 +170,7 @@ class ChixiaoSystem:
             dict or None: 赤枭信息字典，如果不是赤枭则返回None
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 cursor = await db.execute(
                     "SELECT is_chixiao, equipment_value, total_kills, start_time FROM chixiao_status WHERE user_id = ?",
                     (user_id,)
@@ -196,7 +198,7 @@ class ChixiaoSystem:
             list: 赤枭玩家列表，每个元素是包含user_id和equipment_value的字典
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 cursor = await db.execute(
                     "SELECT user_id, equipment_value, total_kills FROM chixiao_status WHERE is_chixiao = 1 ORDER BY equipment_value DESC",
                 )
@@ -242,13 +244,14 @@ class ChixiaoSystem:
 
         return total_chance
 
-    async def check_and_trigger_battle(self, victim_id, stolen_value, is_menggong_active=False):
+    async def check_and_trigger_battle(self, victim_id, stolen_value, is_menggong_active=False, settlement=None):
         """检查并触发赤枭对抗事件
 
         Args:
             victim_id: 偷吃的玩家ID
             stolen_value: 偷吃获得的价值
             is_menggong_active: 受害者是否在猛攻状态
+            settlement: 偷吃结算（传入时对抗结果随本次偷吃一起提交，否则立即提交）
 
         Returns:
             tuple: (是否触发, 对战结果, 赤枭ID, 偷走的金额, 赤枭击杀次数)
@@ -291,50 +294,62 @@ class ChixiaoSystem:
                 stolen_amount = stolen_value
 
                 # 更新赤枭装备价值
-                async with aiosqlite.connect(self.db_path) as db:
-                    await db.execute(
-                        "UPDATE chixiao_status SET equipment_value = equipment_value + ?, total_kills = total_kills + 1 WHERE user_id = ?",
-                        (stolen_amount, chixiao_id)
-                    )
+                own_settlement = settlement is None
+                if own_settlement:
+                    settlement = self.db.settlement()
+                settlement.add(
+                    "UPDATE chixiao_status SET equipment_value = equipment_value + ?, total_kills = total_kills + 1 WHERE user_id = ?",
+                    (stolen_amount, chixiao_id)
+                )
 
-                    # 记录战斗
-                    await db.execute(
-                        """INSERT INTO chixiao_battles
-                        (chixiao_id, victim_id, stolen_value, chixiao_won, battle_result)
-                        VALUES (?, ?, ?, 1, ?)""",
-                        (chixiao_id, victim_id, stolen_amount, 'chixiao_won')
-                    )
+                # 记录战斗
+                settlement.add(
+                    """INSERT INTO chixiao_battles
+                    (chixiao_id, victim_id, stolen_value, chixiao_won, battle_result)
+                    VALUES (?, ?, ?, 1, ?)""",
+                    (chixiao_id, victim_id, stolen_amount, 'chixiao_won')
+                )
 
-                    await db.commit()
+                if own_settlement:
+                    await settlement.commit()
 
                 # 返回赤枭获胜结果
                 return True, "chixiao_won", chixiao_id, stolen_amount, chixiao_kills + 1
             else:
                 # 玩家获胜，获得赤枭所有价值
-                async with aiosqlite.connect(self.db_path) as db:
-                    # 获取赤枭当前价值
-                    cursor = await db.execute(
-                        "SELECT equipment_value FROM chixiao_status WHERE user_id = ?",
+                own_settlement = settlement is None
+                if own_settlement:
+                    settlement = self.db.settlement()
+                try:
+                    # 在结算的写事务中获取赤枭当前价值，提交前其他结算不能同时结算同一个赤枭
+                    result = await settlement.fetchone(
+                        "SELECT equipment_value, is_chixiao FROM chixiao_status WHERE user_id = ?",
                         (chixiao_id,)
                     )
-                    result = await cursor.fetchone()
-                    chixao_current_value = result[0] if result else 0
+                    if not result or not result[1]:
+                        # 赤枭已经被其他玩家击败
+                        return False, None, None, 0, 0
+                    chixao_current_value = result[0]
 
                     # 取消赤枭状态
-                    await db.execute(
+                    settlement.add(
                         "UPDATE chixiao_status SET is_chixiao = 0, equipment_value = 0 WHERE user_id = ?",
                         (chixiao_id,)
                     )
 
                     # 记录战斗
-                    await db.execute(
+                    settlement.add(
                         """INSERT INTO chixiao_battles
                         (chixiao_id, victim_id, stolen_value, chixiao_won, battle_result)
                         VALUES (?, ?, ?, 0, ?)""",
                         (chixiao_id, victim_id, chixao_current_value, 'victim_won')
                     )
 
-                    await db.commit()
+                    if own_settlement:
+                        await settlement.commit()
+                finally:
+                    if own_settlement:
+                        await settlement.close()
 
                 # 返回玩家获胜结果
                 return True, "victim_won", chixiao_id, chixao_current_value, chixiao_kills
@@ -360,7 +375,7 @@ class ChixiaoSystem:
             else:
                 return None
 
-            emoji_path = os.path.join(self.biaoqing_dir, emoji_filename)
+            emoji_path = resolve_asset_path(os.path.join(self.biaoqing_dir, emoji_filename))
 
             if os.path.exists(emoji_path):
                 return emoji_path
@@ -379,7 +394,7 @@ class ChixiaoSystem:
             list: 赤枭排行榜列表，按击杀次数降序排列
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 cursor = await db.execute(
                     "SELECT user_id, equipment_value, total_kills FROM chixiao_status WHERE is_chixiao = 1 ORDER BY total_kills DESC, equipment_value DESC LIMIT 10",
                 )
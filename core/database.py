@@ -0,0 +1,242 @@
+import asyncio
+import aiosqlite
+from contextlib import asynccontextmanager
+from astrbot.api import logger
+
+# 默认读连接数、锁等待超时（毫秒）和每个连接缓存的预编译语句数
+DEFAULT_READERS = 3
+DEFAULT_BUSY_TIMEOUT = 5000
+CACHED_STATEMENTS = 256
+
+
+class Database:
+    """
+    插件共用的数据库服务：一个写连接 + 少量读连接，全部长期保持打开，不再每次操作都新建连接。
+
+    - WAL 模式下读写互不阻塞，synchronous=NORMAL 每次提交不再单独 fsync
+    - write() 同一时刻只有一个协程使用写连接，多个写操作排队执行而不是抢锁报 database is locked；
+      同一任务内可以嵌套使用。离开时没有提交的修改会被回滚（与原来关闭连接时一致）
+    - 结算（Settlement）占用写连接期间，同一任务内嵌套的 write() 拿到的连接不能单独提交，
+      修改随结算一起提交或回滚
+    - read() 从读连接池中取出一个连接，只能执行查询
+    - 长期连接上的 SQL 语句由 sqlite3 缓存预编译结果，重复执行时不再重新解析
+    """
+
+    def __init__(self, db_path, readers=DEFAULT_READERS, busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.readers = max(1, int(readers))
+        self.busy_timeout = max(0, int(busy_timeout))
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._write_owner = None
+        self._settlement = None  # 正在占用写连接的结算
+        self._idle_readers = []
+        self._reader_slots = asyncio.Semaphore(self.readers)
+        self._closed = False
+
+    def configure(self, readers=None, busy_timeout=None):
+        """调整读连接数和锁等待超时（在第一次使用数据库之前调用）"""
+        if readers is not None:
+            self.readers = max(1, int(readers))
+            self._reader_slots = asyncio.Semaphore(self.readers)
+        if busy_timeout is not None:
+            self.busy_timeout = max(0, int(busy_timeout))
+
+    async def _connect(self):
+        db = await aiosqlite.connect(self.db_path, timeout=self.busy_timeout / 1000,
+                                     cached_statements=CACHED_STATEMENTS)
+        await db.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+        await db.execute("PRAGMA synchronous = NORMAL")
+        return db
+
+    async def _get_writer(self):
+        if self._writer is None:
+            db = await self._connect()
+            # WAL 模式记录在数据库文件中，之后打开的读连接自动使用
+            await db.execute("PRAGMA journal_mode = WAL")
+            self._writer = db
+            logger.info(f"数据库连接已建立（WAL，读连接上限 {self.readers}）: {self.db_path}")
+        return self._writer
+
+    @staticmethod
+    async def _discard(db):
+        """回滚没有提交的修改"""
+        try:
+            if db.in_transaction:
+                await db.rollback()
+        except Exception as e:
+            logger.warning(f"回滚数据库事务时出错: {e}")
+
+    @asynccontextmanager
+    async def write(self):
+        """获取写连接，修改后需要调用 commit"""
+        task = asyncio.current_task()
+        if self._write_owner is not None and self._write_owner is task:
+            # 写操作中又调用了其他写方法，直接共用外层的连接和事务
+            if self._settlement is not None:
+                yield _SettlementConnection(self._settlement)
+            else:
+                yield self._writer
+            return
+
+        async with self._write_lock:
+            db = await self._get_writer()
+            self._write_owner = task
+            try:
+                yield db
+            finally:
+                self._write_owner = None
+                await self._discard(db)
+
+    @asynccontextmanager
+    async def read(self):
+        """从读连接池获取一个只读连接"""
+        async with self._reader_slots:
+            db = self._idle_readers.pop() if self._idle_readers else await self._connect()
+            try:
+                yield db
+            finally:
+                db.row_factory = None
+                await self._discard(db)
+                if self._closed:
+                    await db.close()
+                else:
+                    self._idle_readers.append(db)
+
+    async def fetchone(self, sql, parameters=None):
+        async with self.read() as db:
+            cursor = await db.execute(sql, parameters)
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql, parameters=None):
+        async with self.read() as db:
+            cursor = await db.execute(sql, parameters)
+            return await cursor.fetchall()
+
+    async def execute(self, sql, parameters=None):
+        """执行一条修改语句并立即提交"""
+        async with self.write() as db:
+            await db.execute(sql, parameters)
+            await db.commit()
+
+    def settlement(self):
+        """创建一个结算工作单元（见 Settlement）"""
+        return Settlement(self)
+
+    async def close(self):
+        """插件卸载时关闭全部连接"""
+        self._closed = True
+        readers, self._idle_readers = self._idle_readers, []
+        for db in readers:
+            await db.close()
+        async with self._write_lock:
+            writer, self._writer = self._writer, None
+            if writer is not None:
+                await writer.close()
+
+
+class Settlement:
+    """
+    一次偷吃结算的工作单元：物品入库、仓库价值、概率事件、赤枭对抗和洲了个洲触发记录产生的写操作
+    先通过 add 收集起来，最后由 commit 在同一个事务中一次性写入。
+
+    - 整个保险箱只提交一次（一次 fsync），写连接只在真正写入时占用
+    - 任何一条语句失败时整个结算回滚，不会出现物品入库了但事件没有结算的情况
+    - 需要读取当前数据的步骤在收集阶段从读连接查询，写入时尽量使用相对更新（value = value + ?）
+    - 读到的数据决定写入内容、不能用相对更新时使用 fetchone：从读取开始占用写连接直到 commit 或 close，
+      读取和写入在同一个事务中，其他结算不能在中间修改这些数据
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._statements = []
+        self._transaction = None
+        self._db = None
+        self._aborted = False
+
+    def add(self, sql, parameters=()):
+        self._statements.append((sql, parameters))
+
+    def __len__(self):
+        return len(self._statements)
+
+    async def _begin(self):
+        """获取写连接并开始事务（已经开始时直接返回）"""
+        if self._db is None:
+            transaction = self.database.write()
+            db = await transaction.__aenter__()
+            self._transaction, self._db = transaction, db
+            if self.database._settlement is None:
+                self.database._settlement = self
+            if not db.in_transaction:
+                await db.execute("BEGIN IMMEDIATE")
+        return self._db
+
+    async def fetchone(self, sql, parameters=None):
+        """在结算的写事务中读取一行，之后必须调用 commit 或 close 释放写连接"""
+        db = await self._begin()
+        cursor = await db.execute(sql, parameters)
+        return await cursor.fetchone()
+
+    async def commit(self):
+        """在一个事务中执行收集到的全部语句，失败时全部回滚并抛出异常"""
+        statements, self._statements = self._statements, []
+        if not statements and self._db is None:
+            return
+        try:
+            db = await self._begin()
+            if self._aborted:
+                raise RuntimeError("结算中嵌套的写操作已回滚，整个结算放弃")
+            for sql, parameters in statements:
+                await db.execute(sql, parameters)
+            await db.commit()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """放弃没有提交的语句，回滚已经开始的事务并释放写连接（之后仍可继续使用）"""
+        self._statements = []
+        self._aborted = False
+        if self.database._settlement is self:
+            self.database._settlement = None
+        transaction, self._transaction, self._db = self._transaction, None, None
+        if transaction is not None:
+            await transaction.__aexit__(None, None, None)
+
+
+
+class _SettlementConnection:
+    """
+    结算占用写连接期间，同一任务内嵌套 write() 拿到的连接：
+    commit 推迟到结算提交，rollback 回滚整个事务并让结算提交失败，保证结算全部写入或全部不写入
+    """
+
+    def __init__(self, settlement):
+        self._settlement = settlement
+
+    def __getattr__(self, name):
+        return getattr(self._settlement._db, name)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        self._settlement._aborted = True
+        await self._settlement._db.rollback()
+
+
+_databases = {}
+
+
+def get_database(db_path):
+    """按数据库文件获取共用的数据库服务（偷吃、事件、赤枢、图鉴、洲了个洲共用同一组连接）"""
+    database = _databases.get(db_path)
+    if database is None:
+        database = _databases[db_path] = Database(db_path)
+    return database
+
+
+async def close_database(db_path):
+    database = _databases.pop(db_path, None)
+    if database is not None:
+        await database.close()
@@ -0,0 +1,89 @@
+import os
+import threading
+from PIL import Image
+from .sprite_cache import load_frames
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+expressions_dir = os.path.join(script_dir, "expressions")
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# 保险箱左侧面板用到的表情：搜索过程中循环 eating，第一帧和静态图使用最终表情
+PANEL_EXPRESSIONS = ("eating", "eat", "happy", "cry")
+# 保险箱格子范围（特勤处 0-5 级对应 2x2 到 7x7）
+GRID_SIZES = range(2, 8)
+# 面板背景色，与 compose_safe_frames 的画布颜色一致
+PANEL_COLOR = (50, 50, 50)
+
+
+def _flatten(frame):
+    """把 RGBA 表情预先合成到面板背景上，合成每帧时直接粘贴，不再需要透明度蒙版"""
+    if frame.mode != "RGBA":
+        return frame.convert("RGB")
+    panel = Image.new("RGB", frame.size, PANEL_COLOR)
+    panel.paste(frame, (0, 0), frame)
+    return panel
+
+
+class ExpressionBank:
+    """
+    表情帧常驻缓存：按 (grid_size, cell_size) 保存缩放并合成好背景的表情帧。
+
+    表情只和格子数、输出缩放有关，预热时一次性解码和缩放，渲染时不再读取 eating.gif。
+    默认 70 像素格子下 2x2 到 7x7 全部预热约占用 39MB。
+    """
+
+    def __init__(self, directory=expressions_dir):
+        self.directory = directory
+        self._paths = None
+        self._banks = {}
+        self._lock = threading.Lock()
+
+    def paths(self):
+        """表情名称 -> 文件路径（只扫描一次目录）"""
+        if self._paths is None:
+            paths = {}
+            if os.path.isdir(self.directory):
+                for filename in os.listdir(self.directory):
+                    file_path = os.path.join(self.directory, filename)
+                    if os.path.isfile(file_path) and filename.lower().endswith(VALID_EXTENSIONS):
+                        paths[os.path.splitext(filename)[0]] = file_path
+            self._paths = paths
+        return self._paths
+
+    def _build(self, expression_size):
+        box = (expression_size, expression_size)
+        bank = {}
+        for name in PANEL_EXPRESSIONS:
+            path = self.paths().get(name)
+            if path:
+                bank[name] = tuple(_flatten(frame) for frame in load_frames(path, box))
+        return bank
+
+    def get(self, grid_size, cell_size):
+        """获取该格子大小的全部表情帧 {名称: (帧, ...)}，未预热时当场构建"""
+        key = (grid_size, cell_size)
+        bank = self._banks.get(key)
+        if bank is None:
+            # 构建放在锁外，多个渲染线程可以并行处理；重复构建时保留先完成的那份
+            bank = self._build(grid_size * cell_size)
+            with self._lock:
+                bank = self._banks.setdefault(key, bank)
+        return bank
+
+    def frames(self, name, grid_size, cell_size):
+        """获取某个表情的帧，表情不存在时返回 None"""
+        return self.get(grid_size, cell_size).get(name)
+
+    def warm_up(self, cell_size, grid_sizes=GRID_SIZES):
+        for grid_size in grid_sizes:
+            self.get(grid_size, cell_size)
+        print(f"[Touchi] 表情帧预热完成，共{len(self._banks)}种格子大小")
+
+    def clear(self):
+        with self._lock:
+            self._banks.clear()
+            self._paths = None
+
+
+expression_bank = ExpressionBank()
@@ -0,0 +1,194 @@
+import io
+import struct
+import numpy as np
+from PIL import Image
+
+# Pillow 9.1 之后常量移到了枚举里，旧版本仍在 Image 模块上
+_FASTOCTREE = getattr(getattr(Image, "Quantize", Image), "FASTOCTREE")
+_DITHER_NONE = getattr(getattr(Image, "Dither", Image), "NONE")
+_NEAREST = getattr(getattr(Image, "Resampling", Image), "NEAREST")
+
+# 调色板固定为 256 项，最后一项保留为透明色（增量帧中未变化的像素）
+PALETTE_SIZE = 256
+TRANSPARENT_INDEX = PALETTE_SIZE - 1
+MAX_COLORS = PALETTE_SIZE - 1
+
+# 构建全局调色板时最多采样的帧数（首帧、末帧和中间均匀采样）
+PALETTE_SAMPLE_FRAMES = 8
+
+# 图形控制扩展中的处置方式：1 = 保留上一帧内容，增量帧叠加在上面
+DISPOSAL_KEEP = 1
+
+
+def merge_duplicate_frames(frames, durations):
+    """合并连续的相同帧，时长累加"""
+    merged_frames = []
+    merged_durations = []
+    previous = None
+    for frame, duration in zip(frames, durations):
+        data = frame.tobytes()
+        if previous is not None and data == previous:
+            merged_durations[-1] += duration
+            continue
+        merged_frames.append(frame)
+        merged_durations.append(duration)
+        previous = data
+    return merged_frames, merged_durations
+
+
+def build_palette(frames, colors=MAX_COLORS):
+    """
+    从整段动画中采样帧并量化出一个全局调色板。
+
+    返回:
+        PIL.Image  # 只用于提供调色板的 P 模式图片，共 256 项，透明色那一项不会被任何像素选中
+    """
+    colors = max(2, min(colors, MAX_COLORS))
+    if len(frames) <= PALETTE_SAMPLE_FRAMES:
+        samples = list(frames)
+    else:
+        step = (len(frames) - 1) / (PALETTE_SAMPLE_FRAMES - 1)
+        samples = [frames[round(i * step)] for i in range(PALETTE_SAMPLE_FRAMES)]
+
+    # 隔行隔列取样后竖向拼接，最近邻缩小不会产生新的混合颜色
+    width, height = samples[0].size
+    sample_size = (max(1, width // 2), max(1, height // 2))
+    mosaic = Image.new("RGB", (sample_size[0], sample_size[1] * len(samples)))
+    for idx, frame in enumerate(samples):
+        mosaic.paste(frame.convert("RGB").resize(sample_size, _NEAREST), (0, idx * sample_size[1]))
+
+    quantized = mosaic.quantize(colors=colors, method=_FASTOCTREE)
+    palette = quantized.getpalette()[:colors * 3]
+    used = len(palette) // 3
+    # 补齐到 256 项：用第一种颜色填充，映射时相同距离取编号最小的一项，
+    # 所以补充项（包括透明色）不会被选中
+    palette += palette[:3] * (PALETTE_SIZE - used)
+
+    palette_img = Image.new("P", (1, 1))
+    palette_img.putpalette(palette)
+    return palette_img
+
+
+def _lzw_data(indices, palette_img):
+    """用 PIL 编码一块索引图像，返回图像描述符之后的 LZW 数据（最小码长 + 数据子块）"""
+    block = Image.fromarray(np.ascontiguousarray(indices), "P")
+    block.putpalette(palette_img.getpalette())
+    buffer = io.BytesIO()
+    # optimize=False 保证 PIL 不会重新排列调色板，索引原样写入；
+    # 图像描述符由这里重新生成（不隔行），所以也要关闭隔行扫描
+    block.save(buffer, "GIF", optimize=False, interlace=False)
+    data = buffer.getvalue()
+
+    pos = 13
+    if data[10] & 0x80:
+        pos += 3 * (2 << (data[10] & 0x07))
+    while pos < len(data):
+        marker = data[pos]
+        if marker == 0x21:
+            # 跳过扩展块
+            pos += 2
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        elif marker == 0x2C:
+            packed = data[pos + 9]
+            pos += 10
+            if packed & 0x80:
+                pos += 3 * (2 << (packed & 0x07))
+            start = pos
+            pos += 1
+            while data[pos]:
+                pos += data[pos] + 1
+            return data[start:pos + 1]
+        else:
+            break
+    raise ValueError("无法解析 PIL 输出的 GIF 数据")
+
+
+def _graphic_control(duration, transparent):
+    packed = (DISPOSAL_KEEP << 2) | (1 if transparent else 0)
+    delay = max(1, int(round(duration / 10)))
+    return struct.pack("<BBBBHBB", 0x21, 0xF9, 4, packed, delay, TRANSPARENT_INDEX if transparent else 0, 0)
+
+
+def encode_gif(frames, duration=150, loop=0, colors=MAX_COLORS):
+    """
+    把 RGB 帧编码为 GIF 动画。
+
+    - 相同的连续帧合并为一帧，时长累加
+    - 整段动画共用一个全局调色板（不抖动，静止区域在每帧中的索引完全一致）
+    - 第一帧之后只写入变化区域的矩形，矩形内未变化的像素写成透明色
+
+    Args:
+        frames (List[PIL.Image]): 同尺寸的帧
+        duration (int | List[int]): 每帧时长（毫秒）
+        loop (int): 循环次数，0 为无限循环
+        colors (int): 调色板颜色数（最多 255）
+
+    Returns:
+        bytes: GIF 文件内容
+    """
+    if not frames:
+        raise ValueError("没有可编码的帧")
+    durations = list(duration) if isinstance(duration, (list, tuple)) else [duration] * len(frames)
+    frames, durations = merge_duplicate_frames(frames, durations)
+
+    palette_img = build_palette(frames, colors)
+    width, height = frames[0].size
+
+    out = io.BytesIO()
+    out.write(b"GIF89a")
+    # 逻辑屏幕描述符：256 项全局颜色表
+    out.write(struct.pack("<HHBBB", width, height, 0xF7, 0, 0))
+    out.write(bytes(palette_img.getpalette()[:PALETTE_SIZE * 3]))
+    # NETSCAPE 循环扩展
+    out.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    previous = None
+    previous_block = None
+    previous_transparent = False
+    pending_duration = 0
+    for frame, frame_duration in zip(frames, durations):
+        indices = np.asarray(frame.convert("RGB").quantize(palette=palette_img, dither=_DITHER_NONE))
+
+        if previous is None:
+            left, top = 0, 0
+            block = indices
+            transparent = False
+        else:
+            changed = indices != previous
+            rows = np.flatnonzero(changed.any(axis=1))
+            if not len(rows):
+                # 量化后与上一帧相同，并入上一帧的时长
+                pending_duration += frame_duration
+                continue
+            cols = np.flatnonzero(changed.any(axis=0))
+            top, bottom = rows[0], rows[-1] + 1
+            left, right = cols[0], cols[-1] + 1
+            block = np.where(changed[top:bottom, left:right],
+                             indices[top:bottom, left:right], TRANSPARENT_INDEX).astype(np.uint8)
+            transparent = True
+
+        if previous_block is not None:
+            out.write(_graphic_control(pending_duration, previous_transparent))
+            out.write(previous_block)
+        block_height, block_width = block.shape
+        previous_block = (struct.pack("<BHHHHB", 0x2C, int(left), int(top), block_width, block_height, 0)
+                          + _lzw_data(block, palette_img))
+        previous_transparent = transparent
+        pending_duration = frame_duration
+        previous = indices
+
+    if previous_block is not None:
+        out.write(_graphic_control(pending_duration, previous_transparent))
+        out.write(previous_block)
+    out.write(b"\x3B")
+    return out.getvalue()
+
+
+def save_gif(frames, output_path, duration=150, loop=0, colors=MAX_COLORS):
+    """编码并写入 GIF 文件"""
+    data = encode_gif(frames, duration, loop, colors)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
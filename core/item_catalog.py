@@ -0,0 +1,247 @@
+import os
+import time
+import asyncio
+import threading
+from typing import TypedDict
+
+# 物资目录路径
+script_dir = os.path.dirname(os.path.abspath(__file__))
+items_dir = os.path.join(script_dir, "items")
+xinwuzi_dir = os.path.join(script_dir, "xinwuzi")
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# 文件名不带价格时按稀有度使用的默认价格
+DEFAULT_PRICES = {
+    "blue": 10000,
+    "purple": 50000,
+    "gold": 100000,
+    "red": 500000
+}
+
+# 查询不到物品时的兜底价值
+FALLBACK_VALUE = 1000
+
+# 两次目录指纹检查之间的最小间隔（秒），检查本身只是几次 stat
+CHECK_INTERVAL = 1.0
+
+
+class ItemRecord(TypedDict):
+    """物资记录（保持 dict 形式，方便直接放进布局和 JSON）"""
+    path: str          # 图片完整路径
+    stem: str          # 不带扩展名的文件名（数据库中记录的名称）
+    source: str        # 来源文件夹：items / xinwuzi
+    level: str         # 稀有度：blue / purple / gold / red
+    size: str          # 尺寸字符串，如 "2x1"
+    grid_width: int
+    grid_height: int
+    base_name: str     # 等级_尺寸_名称（不含价格）
+    value: int
+    name: str          # 展示名称
+
+
+def get_size(size_str):
+    if 'x' in size_str:
+        parts = size_str.split('x')
+        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+            return int(parts[0]), int(parts[1])
+    return 1, 1
+
+
+def parse_item_filename(file_path, source):
+    """解析 等级_尺寸_名称_价格 格式的文件名，返回物资记录"""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    parts = stem.split('_')
+
+    # 判断是否为新物资格式（等级_大小_名称_价格）
+    if len(parts) >= 4 and parts[-1].isdigit():
+        level = parts[0].lower()
+        size = parts[1]
+        # 构建基础名称（用于查找价值和与数据库记录匹配）
+        base_name = f"{level}_{size}_{'_'.join(parts[2:-1])}"
+        value = int(parts[-1])
+    else:
+        # 原有格式：等级_大小_名称
+        level = parts[0].lower() if len(parts) >= 2 else "purple"
+        size = parts[1] if len(parts) >= 2 else "1x1"
+        base_name = stem
+        value = DEFAULT_PRICES.get(level, 10000)
+
+    width, height = get_size(size)
+    return ItemRecord(
+        path=file_path, stem=stem, source=source,
+        level=level, size=size,
+        grid_width=width, grid_height=height,
+        base_name=base_name, value=value,
+        name=f"{base_name} (价值: {value:,})"
+    )
+
+
+def _stat_dir(path):
+    """目录指纹：修改时间 + inode，目录不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_ino
+
+
+class ItemCatalog:
+    """进程内共享的物资目录，偷吃、图鉴、洲了个洲和事件都从这里取物资"""
+
+    def __init__(self, directories):
+        # directories: [(来源名, 文件夹路径), ...]
+        self.directories = directories
+        self._lock = threading.Lock()
+        self._roots = {directory for _, directory in directories}
+        self._dir_sources = {directory: source for source, directory in directories}
+        self._dir_stats = {}   # 已扫描目录 -> 指纹
+        self._records = {}     # 文件路径 -> 物资记录
+        self._checked_at = 0
+        self._refreshing = False  # 后台检查是否正在进行
+        self.version = 0       # 每次目录内容变化后递增
+        self.items = []
+        self.by_base_name = {}
+        self.by_stem = {}
+        self.by_level = {}
+        self.by_size = {}
+        self.by_footprint = {}
+
+    def _forget_dir(self, directory):
+        """移除已删除目录（及其子目录）下的所有物资"""
+        prefix = directory + os.sep
+        for path in [p for p in self._records if p.startswith(prefix)]:
+            del self._records[path]
+        for sub_dir in [d for d in self._dir_stats if d == directory or d.startswith(prefix)]:
+            del self._dir_stats[sub_dir]
+            if sub_dir not in self._roots:
+                self._dir_sources.pop(sub_dir, None)
+
+    def _rescan_dir(self, directory, source):
+        """只重新解析该目录中新增或删除的文件"""
+        stat = _stat_dir(directory)
+        if stat is None:
+            self._forget_dir(directory)
+            return
+
+        current_files, current_dirs = set(), set()
+        for entry in os.scandir(directory):
+            if entry.is_dir():
+                current_dirs.add(entry.path)
+            elif entry.name.lower().endswith(VALID_EXTENSIONS) and entry.is_file():
+                current_files.add(entry.path)
+        self._dir_stats[directory] = stat
+
+        known_files = {p for p in self._records if os.path.dirname(p) == directory}
+        known_dirs = {d for d in self._dir_stats if os.path.dirname(d) == directory}
+
+        for path in known_files - current_files:
+            del self._records[path]
+        for path in current_files - known_files:
+            try:
+                self._records[path] = parse_item_filename(path, source)
+            except (ValueError, IndexError) as e:
+                print(f"[Touchi] 跳过无效文件名: {os.path.basename(path)}, 错误: {e}")
+
+        for sub_dir in known_dirs - current_dirs:
+            self._forget_dir(sub_dir)
+        for sub_dir in current_dirs - known_dirs:
+            # 新出现的子目录（例如新赛季物资）整体扫描
+            self._dir_sources[sub_dir] = source
+            self._rescan_dir(sub_dir, source)
+
+    def _changed_dirs(self):
+        return [d for d in self._dir_sources if _stat_dir(d) != self._dir_stats.get(d)]
+
+    def _index(self, records):
+        by_base_name, by_stem, by_level, by_size, by_footprint = {}, {}, {}, {}, {}
+        for record in records:
+            by_base_name[record["base_name"]] = record
+            by_stem[record["stem"]] = record
+            by_level.setdefault(record["level"], []).append(record)
+            by_size.setdefault(record["size"], []).append(record)
+            footprint = tuple(sorted((record["grid_width"], record["grid_height"])))
+            by_footprint.setdefault(footprint, []).append(record)
+
+        self.items = records
+        self.by_base_name = by_base_name
+        self.by_stem = by_stem
+        self.by_level = by_level
+        self.by_size = by_size
+        self.by_footprint = by_footprint
+
+    def refresh(self):
+        """根据目录指纹增量更新，返回目录内容是否发生变化"""
+        with self._lock:
+            changed = self._changed_dirs()
+            if not changed and self.version:
+                return False
+            for directory in changed:
+                # 父目录重扫时可能已经处理过或移除了该子目录
+                if directory in self._dir_sources and _stat_dir(directory) != self._dir_stats.get(directory):
+                    self._rescan_dir(directory, self._dir_sources[directory])
+            self._index(sorted(self._records.values(), key=lambda r: r["path"]))
+            self.version += 1
+        print(f"[Touchi] 物资目录已更新，共{len(self.items)}个物品")
+        return True
+
+    def ensure_loaded(self):
+        """
+        确保目录已加载；目录指纹未变化时不做任何扫描。
+
+        已经加载过时，在事件循环中调用只安排后台线程检查目录指纹（stat），查询始终只读内存中的目录
+        """
+        now = time.monotonic()
+        if self.version and (now - self._checked_at) < CHECK_INTERVAL:
+            return self
+        self._checked_at = now
+        if self.version:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                if not self._refreshing:
+                    self._refreshing = True
+                    loop.run_in_executor(None, self._refresh_quietly)
+                return self
+        self._refresh_quietly()
+        return self
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[Touchi] 加载物资目录时出错: {e}")
+        finally:
+            self._refreshing = False
+
+    def get(self, name):
+        """按基础名称或文件名查找物资"""
+        return self.by_base_name.get(name) or self.by_stem.get(name)
+
+    def get_value(self, name):
+        record = self.get(name)
+        return record["value"] if record else FALLBACK_VALUE
+
+    def get_by_level(self, level, source=None):
+        records = self.by_level.get(level, [])
+        if source is not None:
+            records = [r for r in records if r["source"] == source]
+        return records
+
+    def get_by_sizes(self, sizes, source=None):
+        records = []
+        for size in sizes:
+            records.extend(self.by_size.get(size, []))
+        if source is not None:
+            records = [r for r in records if r["source"] == source]
+        return records
+
+
+_catalog = ItemCatalog([("items", items_dir), ("xinwuzi", xinwuzi_dir)])
+
+
+def get_catalog():
+    """获取全局物资目录"""
+    return _catalog.ensure_loaded()
@@ -0,0 +1,172 @@
+import threading
+import numpy as np
+
+# 手动设置的稀有物品概率映射 - 保持不变
+RARE_ITEMS = {
+    "gold_1x1_1", "gold_1x1_2", "red_1x1_1", "red_1x1_2", "red_1x1_3",  "red_3x3_ecmo",
+    "red_3x3_huxiji", "gold_3x2_bendishoushi", "purple_1x1_2", "purple_1x1_4","purple_1x1_3", "purple_1x1_1","red_4x3_cipanzhenlie","red_4x3_dongdidianchi","red_3x4_daopian","red_3x3_wanjinleiguan","red_3x3_tanke"
+}
+
+# 超稀有物品列表 - 保持不变
+ULTRA_RARE_ITEMS = {
+    "red_1x1_xin","red_1x1_lei"
+}
+
+# 各模式默认爆率
+AUTO_MENGGONG_CHANCES = {"purple": 0.55, "blue": 0.0, "gold": 0.15, "red": 0.033}
+AUTO_NORMAL_CHANCES = {"purple": 0.52, "blue": 0.35, "gold": 0.093, "red": 0.017}
+MENGGONG_CHANCES = {"purple": 0.45, "blue": 0.0, "gold": 0.45, "red": 0.10}
+NORMAL_CHANCES = {"purple": 0.42, "blue": 0.25, "gold": 0.28, "red": 0.05}
+
+# 时间倍率按 0.05 分档编译爆率表（0.6-1.4 共 17 档）
+TIME_MULTIPLIER_STEP = 0.05
+
+# 每个保险箱的物品数量范围
+MIN_ITEMS = 2
+MAX_ITEMS = 6
+
+# 批量抽取时每次生成的随机矩阵行数，避免一次占用过多内存
+BATCH_CHUNK = 1024
+
+
+def time_multiplier_bucket(time_multiplier):
+    return round(round(time_multiplier / TIME_MULTIPLIER_STEP) * TIME_MULTIPLIER_STEP, 4)
+
+
+def resolve_level_chances(menggong_mode=False, auto_mode=False, time_multiplier=1.0,
+                          custom_normal_rates=None, custom_menggong_rates=None):
+    """根据模式、自定义概率和时间倍率计算各等级的基础爆率"""
+    # 根据模式调整概率
+    if auto_mode:
+        # 自动模式：金红概率降低
+        level_chances = dict(AUTO_MENGGONG_CHANCES if menggong_mode else AUTO_NORMAL_CHANCES)
+    elif menggong_mode:
+        # 猛攻模式：优先使用自定义概率，否则使用默认概率
+        if custom_menggong_rates:
+            level_chances = dict(custom_menggong_rates)
+            # 猛攻模式应该没有蓝色物品
+            level_chances["blue"] = 0.0
+        else:
+            level_chances = dict(MENGGONG_CHANCES)
+    else:
+        # 正常模式：优先使用自定义概率，否则使用默认概率
+        if custom_normal_rates:
+            level_chances = dict(custom_normal_rates)
+        else:
+            level_chances = dict(NORMAL_CHANCES)
+
+    # 根据时间倍率调整爆率
+    # time_multiplier范围0.6-1.4，1.0为基准
+    # 时间倍率越大（>1.0）略微提高red和gold爆率
+    # 时间倍率越小（<1.0）下调red和gold爆率
+    if not auto_mode:  # 只在非自动模式下应用时间倍率影响
+        rate_adjustment = (time_multiplier - 1.0) * 0.05  # 调整幅度为±10%
+
+        # 调整red和gold概率
+        original_red = level_chances["red"]
+        original_gold = level_chances["gold"]
+
+        level_chances["red"] = max(0.01, original_red + original_red * rate_adjustment)
+        level_chances["gold"] = max(0.05, original_gold + original_gold * rate_adjustment)
+
+        # 为了保持总概率平衡，相应调整purple概率
+        red_diff = level_chances["red"] - original_red
+        gold_diff = level_chances["gold"] - original_gold
+        level_chances["purple"] = max(0.1, level_chances["purple"] - red_diff - gold_diff)
+
+    return level_chances
+
+
+class DropTable:
+    """编译好的掉落表：每个物品的最终爆率数组 + 预先筛好的紫色补充池"""
+
+    def __init__(self, items, level_chances):
+        self.items = items
+        chances = []
+        for item in items:
+            item_name = item["base_name"]
+            # 调整稀有物品概率
+            if item_name in ULTRA_RARE_ITEMS:
+                # 超稀有物品：红色物资的百分之一概率
+                chances.append(level_chances.get("red", 0.05) / 100)
+            elif item_name in RARE_ITEMS:
+                # 稀有物品：原概率的三分之一
+                chances.append(level_chances.get(item["level"], 0) / 3)
+            else:
+                chances.append(level_chances.get(item["level"], 0))
+        self.chances = np.asarray(chances, dtype=np.float64)
+
+        # 补充用的紫色物品（排除稀有物品）
+        self.filler = np.asarray([
+            idx for idx, item in enumerate(items)
+            if item["level"] == "purple" and item["base_name"] not in RARE_ITEMS
+        ], dtype=np.intp)
+
+    def _finish(self, selected, rng):
+        """限制数量、补充紫色物品并打乱顺序"""
+        num_items = int(rng.integers(MIN_ITEMS, MAX_ITEMS + 1))
+        if len(selected) > num_items:
+            selected = rng.choice(selected, num_items, replace=False)
+        elif len(selected) < num_items and len(self.filler):
+            needed = min(num_items - len(selected), len(self.filler))
+            selected = np.concatenate([selected, rng.choice(self.filler, needed, replace=False)])
+        selected = rng.permutation(selected)
+        return [self.items[idx] for idx in selected]
+
+    def roll(self, rng=None):
+        """抽取一个保险箱的物品"""
+        rng = rng or _rng()
+        selected = np.flatnonzero(rng.random(len(self.chances)) <= self.chances)
+        return self._finish(selected, rng)
+
+    def roll_many(self, count, rng=None):
+        """一次抽取多个保险箱（自动偷吃、概率模拟），返回物品列表的列表"""
+        rng = rng or _rng()
+        boxes = []
+        for start in range(0, count, BATCH_CHUNK):
+            rows = min(BATCH_CHUNK, count - start)
+            hits = rng.random((rows, len(self.chances))) <= self.chances
+            for row in hits:
+                boxes.append(self._finish(np.flatnonzero(row), rng))
+        return boxes
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+_local = threading.local()
+
+
+def _rng():
+    # 每个线程使用独立的随机数生成器
+    rng = getattr(_local, "rng", None)
+    if rng is None:
+        rng = _local.rng = np.random.default_rng()
+    return rng
+
+
+def get_drop_table(items, menggong_mode=False, auto_mode=False, time_multiplier=1.0,
+                   custom_normal_rates=None, custom_menggong_rates=None):
+    """获取（必要时编译）对应模式的掉落表；物资列表变化后自动重新编译"""
+    bucket = 1.0 if auto_mode else time_multiplier_bucket(time_multiplier)
+    custom = None
+    if not auto_mode:
+        rates = custom_menggong_rates if menggong_mode else custom_normal_rates
+        custom = tuple(sorted(rates.items())) if rates else None
+    key = (bool(menggong_mode), bool(auto_mode), custom, bucket)
+
+    table = _tables.get(key)
+    if table is not None and table.items is items:
+        return table
+
+    level_chances = resolve_level_chances(
+        menggong_mode, auto_mode, bucket,
+        custom_normal_rates=custom_normal_rates, custom_menggong_rates=custom_menggong_rates
+    )
+    table = DropTable(items, level_chances)
+    with _tables_lock:
+        # 物资目录更新后旧表全部作废
+        stale = [k for k, t in _tables.items() if t.items is not items]
+        for k in stale:
+            del _tables[k]
+        _tables[key] = table
+    return table
@@ -0,0 +1,171 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(script_dir, "output")
+
+# 默认清理策略：发送完成后保留 10 分钟，目录总大小不超过 64MB，每分钟检查一次
+DEFAULT_TTL = 600
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SWEEP_INTERVAL = 60
+# 一直没有释放的文件（调用方忘记 release）最多保留的时间
+MAX_HOLD = 3600
+
+
+class OutputSpool:
+    """
+    core/output 目录的统一管理（保险箱、图鉴、洲了个洲、转盘共用）。
+
+    - allocate 分配唯一文件名，并记为一次引用（正在生成或发送）
+    - 发送完成后 release，引用归零的文件由后台任务按存放时间和目录总大小清理
+    - 请求处理过程中不再扫描整个目录
+    """
+
+    def __init__(self, directory=output_dir, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._files = {}  # path -> [refs, size, released_at, allocated_at]
+        self._lock = threading.Lock()
+        self._task = None
+        self._adopted = False
+
+    def configure(self, ttl=None, max_bytes=None, sweep_interval=None):
+        if ttl is not None:
+            self.ttl = max(0, float(ttl))
+        if max_bytes is not None:
+            self.max_bytes = max(0, int(max_bytes))
+        if sweep_interval is not None:
+            self.sweep_interval = max(1, float(sweep_interval))
+
+    def allocate(self, prefix, extension):
+        """分配一个唯一的输出路径，调用方发送完成后需要 release"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.directory, f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}{extension}")
+        now = time.time()
+        with self._lock:
+            self._files[path] = [1, 0, None, now]
+        return path
+
+    def acquire(self, path):
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                return False
+            entry[0] += 1
+            return True
+
+    def release(self, path):
+        """释放一次引用，归零后文件进入待清理状态"""
+        if not path:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                return
+            entry[0] = max(0, entry[0] - 1)
+            entry[1] = size
+            if entry[0] == 0:
+                entry[2] = time.time()
+
+    def _adopt_existing(self):
+        """启动后第一次清理时接管目录中已有的文件（上次运行留下的），按修改时间计算存放时间"""
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return
+        with self._lock:
+            for filename in filenames:
+                path = os.path.join(self.directory, filename)
+                if path in self._files or not os.path.isfile(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self._files[path] = [0, stat.st_size, stat.st_mtime, stat.st_mtime]
+
+    def sweep(self):
+        """删除超过存放时间的文件，目录总大小超出上限时从最早释放的文件开始删除，返回删除数量"""
+        if not self._adopted:
+            self._adopt_existing()
+            self._adopted = True
+
+        now = time.time()
+        expired = []
+        with self._lock:
+            released = []
+            total_bytes = 0
+            for path, (refs, size, released_at, allocated_at) in self._files.items():
+                total_bytes += size
+                if refs > 0 and now - allocated_at < MAX_HOLD:
+                    continue
+                if released_at is None:
+                    released_at = allocated_at
+                if now - released_at >= self.ttl:
+                    expired.append(path)
+                    total_bytes -= size
+                else:
+                    released.append((released_at, size, path))
+
+            released.sort()
+            for _, size, path in released:
+                if total_bytes <= self.max_bytes:
+                    break
+                expired.append(path)
+                total_bytes -= size
+
+            for path in expired:
+                del self._files[path]
+
+        removed = 0
+        for path in expired:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[Touchi] 删除输出文件失败: {path}, 错误: {e}")
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"[Touchi] 清理输出目录时出错: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        """启动后台清理任务（需要在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def total_bytes(self):
+        return sum(entry[1] for entry in list(self._files.values()))
+
+    def __len__(self):
+        return len(self._files)
+
+
+# 全局输出目录管理
+output_spool = OutputSpool()
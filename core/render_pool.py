@@ -0,0 +1,161 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from astrbot.api import logger
+
+# 默认渲染进程数、排队上限和单次渲染超时（秒）
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_LIMIT = 8
+DEFAULT_TIMEOUT = 60
+# 进程池不可用时最多同时在本进程中渲染的任务数
+FALLBACK_LIMIT = 1
+
+
+class RenderQueueFull(Exception):
+    """渲染队列已满"""
+
+
+class RenderPool:
+    """
+    保险箱渲染进程池：绘图和动图编码都在子进程中完成，不占用事件循环所在进程的 GIL。
+
+    - workers 为 0 时退回默认线程池（与原来的 asyncio.to_thread 相同）
+    - 同时运行和排队的任务总数不超过 workers + queue_limit，超出时直接拒绝
+    - 单次渲染超时时停用当前进程池：新任务交给新的进程池，旧进程池中其他正在进行的渲染照常完成后，
+      再结束仍卡住的进程
+    - 子进程崩溃时重建进程池，受影响的任务各自重试一次；仍然失败时可以用 run_in_process 在本进程中渲染，
+      同时最多 FALLBACK_LIMIT 个
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_limit=DEFAULT_QUEUE_LIMIT, timeout=DEFAULT_TIMEOUT,
+                 initializer=None):
+        self.workers = max(0, int(workers))
+        self.queue_limit = max(0, int(queue_limit))
+        self.timeout = max(1, float(timeout))
+        self.initializer = initializer
+        self._executor = None
+        self._running = {}     # 进程池 -> 正在使用它的任务数
+        self._retired = set()  # 已停用、等待其他任务完成后结束的进程池
+        self._slots = asyncio.Semaphore(max(1, self.workers) + self.queue_limit)
+        self._fallback_slots = asyncio.Semaphore(FALLBACK_LIMIT)
+
+    @classmethod
+    def from_config(cls, config, initializer=None):
+        return cls(
+            workers=config.get("render_workers", DEFAULT_WORKERS),
+            queue_limit=config.get("render_queue_limit", DEFAULT_QUEUE_LIMIT),
+            timeout=config.get("render_timeout", DEFAULT_TIMEOUT),
+            initializer=initializer
+        )
+
+    def _get_executor(self):
+        if self.workers == 0:
+            return None
+        if self._executor is None:
+            try:
+                # 使用 spawn 启动子进程，避免 fork 时复制事件循环和数据库连接等状态
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer
+                )
+            except Exception as e:
+                logger.warning(f"渲染进程池启动失败，改用线程池渲染: {e}")
+                self.workers = 0
+                return None
+        return self._executor
+
+    @staticmethod
+    def _terminate(executor):
+        """关闭进程池并结束其中的进程（卡住的任务仍在子进程中运行）"""
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+
+    def _recycle(self):
+        """丢弃当前进程池（崩溃后），下次渲染时重新创建"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            self._terminate(executor)
+
+    def _retire(self, executor):
+        """停用超时任务所在的进程池，新任务交给新的进程池"""
+        if executor is self._executor:
+            self._executor = None
+            # 不取消已经提交的任务，让它们在旧进程池中完成
+            executor.shutdown(wait=False)
+        self._retired.add(executor)
+        self._reap(executor)
+
+    def _reap(self, executor):
+        """已停用的进程池中没有其他任务时结束其进程"""
+        if executor in self._retired and not self._running.get(executor):
+            self._retired.discard(executor)
+            self._running.pop(executor, None)
+            self._terminate(executor)
+
+    async def _submit(self, loop, executor, func, args):
+        self._running[executor] = self._running.get(executor, 0) + 1
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), self.timeout)
+        finally:
+            self._running[executor] -= 1
+            self._reap(executor)
+
+    async def run(self, func, *args):
+        """
+        在渲染进程中执行 func(*args)，func 和参数都必须可以被 pickle。
+
+        Raises:
+            RenderQueueFull: 排队任务过多
+            asyncio.TimeoutError: 渲染超时
+        """
+        if self._slots.locked():
+            raise RenderQueueFull("渲染队列已满")
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                return await self._submit(loop, executor, func, args)
+            except asyncio.TimeoutError:
+                if executor is not None:
+                    logger.warning(f"渲染超时（{self.timeout:.0f}秒），停用当前渲染进程池，其他渲染完成后结束卡住的进程")
+                    self._retire(executor)
+                else:
+                    logger.warning(f"渲染超时（{self.timeout:.0f}秒）")
+                raise
+            except BrokenProcessPool:
+                # 同一进程池中的其他任务也会失败，各自重试一次
+                logger.warning("渲染进程异常退出，重建进程池后重试")
+                if executor is self._executor:
+                    self._recycle()
+                executor = self._get_executor()
+                return await self._submit(loop, executor, func, args)
+
+    async def run_in_process(self, func, *args):
+        """
+        进程池崩溃后在本进程的线程中执行 func(*args)。
+
+        Raises:
+            RenderQueueFull: 本进程中的渲染已达上限
+        """
+        if self._fallback_slots.locked():
+            raise RenderQueueFull("本进程渲染已达上限")
+
+        async with self._fallback_slots:
+            return await asyncio.to_thread(func, *args)
+
+    def shutdown(self):
+        """插件卸载时关闭进程池"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for retired in list(self._retired):
+            self._terminate(retired)
+        self._retired.clear()
+        self._running.clear()
@@ -0,0 +1,166 @@
+import numpy as np
+from functools import lru_cache
+from PIL import Image, ImageDraw
+
+# 保险箱底色和网格线颜色
+SAFE_BACKGROUND_COLOR = (50, 50, 50)
+GRID_LINE_COLOR = (80, 80, 80)
+
+
+def _div255(values):
+    """整数除以 255 并四舍五入，与 PIL 混合粘贴、alpha_composite 的取整方式相同"""
+    values = values + 128
+    return (values + (values >> 8)) >> 8
+
+
+class BlendTile:
+    """
+    预乘贴片：按自身透明度混合粘贴，与 PIL 的 paste(img, pos, img) 结果逐像素一致。
+
+    out = (dst * (255 - a) + src * a) / 255，其中 src * a 和 255 - a 在创建时算好。
+    """
+    __slots__ = ("premultiplied", "inverse", "width", "height")
+
+    def __init__(self, image):
+        rgba = np.asarray(image.convert("RGBA"), dtype=np.uint16)
+        alpha = rgba[..., 3:4]
+        self.premultiplied = rgba * alpha
+        self.inverse = 255 - alpha
+        self.height, self.width = rgba.shape[:2]
+
+
+class MaskTile:
+    """覆盖贴片：掩码内的像素直接替换（阴影遮罩、弧线）"""
+    __slots__ = ("pixels", "mask", "width", "height")
+
+    def __init__(self, image, mask):
+        self.pixels = np.array(image.convert("RGBA"), dtype=np.uint8)
+        self.mask = np.asarray(mask)[..., None] > 0
+        self.height, self.width = self.pixels.shape[:2]
+
+
+@lru_cache(maxsize=32)
+def grid_background(grid_size, cell_size):
+    """保险箱背景（底色 + 网格线），每种格子数和格子大小只绘制一次，返回只读的 RGB 数组"""
+    img_size = grid_size * cell_size
+    background = Image.new("RGB", (img_size, img_size), SAFE_BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(background)
+    for i in range(1, grid_size):
+        draw.line([(i * cell_size, 0), (i * cell_size, img_size)], fill=GRID_LINE_COLOR, width=1)
+        draw.line([(0, i * cell_size), (img_size, i * cell_size)], fill=GRID_LINE_COLOR, width=1)
+    pixels = np.array(background, dtype=np.uint8)
+    pixels.flags.writeable = False
+    return pixels
+
+
+def draw_bounds(draw):
+    """绘制命令影响的像素范围 (x0, y0, x1, y1)，右下角不包含"""
+    kind = draw[0]
+    if kind in ("fill", "outline"):
+        # 与 ImageDraw.rectangle 相同，右下角坐标包含在矩形内
+        return draw[1], draw[2], draw[3] + 1, draw[4] + 1
+    tile, x, y = draw[1], draw[2], draw[3]
+    return x, y, x + tile.width, y + tile.height
+
+
+def union_bounds(bounds):
+    bounds = list(bounds)
+    if not bounds:
+        return None
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+
+def _intersect(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+class SafeCompositor:
+    """
+    保险箱帧合成器：背景只绘制一次，缓冲区在各帧之间复用。
+
+    每帧只重新合成状态发生变化的物品所在区域：区域内先复制背景并画物品边框，
+    再在透明层上按顺序执行绘制命令，最后混合到输出缓冲区。绘制命令：
+        ("fill", x0, y0, x1, y1, color)     # 填充矩形（覆盖），坐标含右下角
+        ("outline", x0, y0, x1, y1, color, width)  # 矩形边框（覆盖），坐标含右下角
+        ("mask", MaskTile, x, y)            # 覆盖贴片
+        ("blend", BlendTile, x, y)          # 按透明度混合的贴片
+    """
+
+    def __init__(self, background):
+        self.background = background
+        self.height, self.width = background.shape[:2]
+        self.bounds = (0, 0, self.width, self.height)
+        self.base = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.overlay = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        self.output = np.array(background, dtype=np.uint8)
+        # 混合用的中间缓冲区，避免每帧分配临时数组
+        self._alpha = np.empty((self.height, self.width, 1), dtype=np.uint16)
+        self._blend = np.empty((self.height, self.width, 3), dtype=np.uint16)
+        self._scratch = np.empty((self.height, self.width, 3), dtype=np.uint16)
+
+    def _apply(self, target, region, draw):
+        kind = draw[0]
+        if kind == "outline":
+            # 与 ImageDraw.rectangle(outline=..., width=...) 相同，边框向内加粗
+            x0, y0, x1, y1, color, width = draw[1:]
+            for k in range(width):
+                left, top, right, bottom = x0 + k, y0 + k, x1 - k, y1 - k
+                for edge in ((left, top, right, top), (left, bottom, right, bottom),
+                             (left, top, left, bottom), (right, top, right, bottom)):
+                    self._apply(target, region, ("fill",) + edge + (color,))
+            return
+
+        clipped = _intersect(draw_bounds(draw), region)
+        if clipped is None:
+            return
+        x0, y0, x1, y1 = clipped
+        dst = target[y0 - region[1]:y1 - region[1], x0 - region[0]:x1 - region[0]]
+        if kind == "fill":
+            dst[...] = draw[5][:dst.shape[2]]
+            return
+
+        tile, tx, ty = draw[1], draw[2], draw[3]
+        tile_slice = (slice(y0 - ty, y1 - ty), slice(x0 - tx, x1 - tx))
+        if kind == "mask":
+            np.copyto(dst, tile.pixels[tile_slice], where=tile.mask[tile_slice])
+        else:
+            dst[...] = _div255(dst * tile.inverse[tile_slice] + tile.premultiplied[tile_slice])
+
+    def render(self, region, base_draws, overlay_draws):
+        """重新合成一个区域 (x0, y0, x1, y1)，右下角不包含"""
+        region = _intersect(region, self.bounds)
+        if region is None:
+            return
+        area = (slice(region[1], region[3]), slice(region[0], region[2]))
+
+        base = self.base[area]
+        np.copyto(base, self.background[area])
+        for draw in base_draws:
+            self._apply(base, region, draw)
+
+        overlay = self.overlay[area]
+        overlay.fill(0)
+        for draw in overlay_draws:
+            self._apply(overlay, region, draw)
+
+        # 透明层叠加到背景上（与 Image.alpha_composite 的结果一致）
+        alpha, blend, scratch = self._alpha[area], self._blend[area], self._scratch[area]
+        np.copyto(alpha, overlay[..., 3:4])
+        np.multiply(overlay[..., :3], alpha, out=blend)
+        np.subtract(255, alpha, out=alpha)
+        np.multiply(base, alpha, out=scratch)
+        blend += scratch
+        blend += 128
+        np.right_shift(blend, 8, out=scratch)
+        blend += scratch
+        blend >>= 8
+        np.copyto(self.output[area], blend, casting="unsafe")
+
+    def frame(self):
+        """当前输出缓冲区的拷贝（PIL 图片）"""
+        return Image.fromarray(self.output, "RGB")
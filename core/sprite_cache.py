@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# 离线构建的渲染用图片（由插件根目录下的 build_assets.py 生成）
+prebuilt_dir = os.path.join(script_dir, "prebuilt")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# 两次检查清单是否重新构建之间的最小间隔（秒）
+MANIFEST_CHECK_INTERVAL = 1.0
+
+# 解码后图片占用内存上限（按 RGBA 每像素 4 字节计算）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def asset_key(path):
+    """资源相对于 core 目录的路径，作为清单中的来源标识"""
+    return os.path.relpath(os.path.abspath(path), script_dir).replace(os.sep, "/")
+
+
+def sprite_key(path, box, rotated=False, fit="fit"):
+    return f"{asset_key(path)}|{box[0]}x{box[1]}|{'r' if rotated else 'n'}|{fit}"
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class PrebuiltAssets:
+    """读取离线构建清单；源文件在构建之后被修改过的条目会被忽略，重新构建后自动读取新清单"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._manifest = None
+        self._signature = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _manifest_signature(self, manifest_path):
+        try:
+            stat = os.stat(manifest_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_manifest(self):
+        now = time.monotonic()
+        if self._manifest is not None and (now - self._checked_at) < MANIFEST_CHECK_INTERVAL:
+            return self._manifest
+        with self._lock:
+            self._checked_at = now
+            manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+            signature = self._manifest_signature(manifest_path)
+            if self._manifest is None or signature != self._signature:
+                manifest = {}
+                if signature is not None:
+                    try:
+                        with open(manifest_path, "r", encoding="utf-8") as f:
+                            manifest = json.load(f)
+                        if manifest.get("version") != MANIFEST_VERSION:
+                            print(f"[Touchi] 预构建资源清单版本不匹配，忽略: {manifest_path}")
+                            manifest = {}
+                    except Exception as e:
+                        print(f"[Touchi] 读取预构建资源清单失败: {e}")
+                        manifest = {}
+                self._manifest = manifest
+                self._signature = signature
+        return self._manifest
+
+    def reload(self):
+        with self._lock:
+            self._manifest = None
+
+    def _resolve(self, source_path, files):
+        """检查源文件未变化且构建产物都存在，返回产物完整路径"""
+        manifest = self._load_manifest()
+        if not files:
+            return None
+        try:
+            if manifest.get("sources", {}).get(asset_key(source_path)) != source_signature(source_path):
+                return None
+        except OSError:
+            return None
+        paths = [os.path.join(self.directory, f) for f in files]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        return paths
+
+    def sprite(self, path, box, rotated=False, fit="fit"):
+        files = self._load_manifest().get("sprites", {}).get(sprite_key(path, box, rotated, fit))
+        paths = self._resolve(path, [files] if files else None)
+        return paths[0] if paths else None
+
+    def frames(self, path, box):
+        """动图按帧拆分后的图片列表"""
+        files = self._load_manifest().get("frames", {}).get(sprite_key(path, box, False, "stretch"))
+        return self._resolve(path, files)
+
+    def file(self, path):
+        """去除元数据后的原尺寸文件（表情包等直接发送的图片）"""
+        files = self._load_manifest().get("files", {}).get(asset_key(path))
+        paths = self._resolve(path, [files] if files else None)
+        return paths[0] if paths else None
+
+
+prebuilt_assets = PrebuiltAssets(prebuilt_dir)
+
+
+def resolve_asset_path(path):
+    """优先使用预构建的文件，不存在时返回原路径"""
+    return prebuilt_assets.file(path) or path
+
+
+class SpriteCache:
+    """进程内共享的物品图片缓存，按 (图片, 目标像素框, 是否旋转, 缩放方式, 额外缩放) 缓存缩放好的 RGBA 图片
+
+    返回的图片在多个渲染线程之间共享，调用方只能读取（粘贴、缩放），不能原地修改。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._sprites = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def render(path, box, rotated=False, fit="fit"):
+        """从源图片解码并缩放（离线构建和缓存未命中时使用）"""
+        with Image.open(path) as img:
+            sprite = img.convert("RGBA")
+        if rotated:
+            sprite = sprite.rotate(90, expand=True)
+        if fit == "stretch":
+            # 拉伸到目标大小（洲了个洲卡牌）
+            sprite = sprite.resize(box, Image.LANCZOS)
+        else:
+            # 等比缩放到目标框内，不放大
+            sprite.thumbnail(box, Image.LANCZOS)
+        return sprite
+
+    @classmethod
+    def _load(cls, path, box, rotated, fit):
+        prebuilt = prebuilt_assets.sprite(path, box, rotated, fit)
+        if prebuilt:
+            with Image.open(prebuilt) as img:
+                return img.convert("RGBA")
+        return cls.render(path, box, rotated, fit)
+
+    def get(self, path, box, rotated=False, fit="fit", scale=1.0):
+        """获取缩放好的物品图片，加载失败时抛出异常
+
+        scale 不为 1 时在缩放好的图片基础上再整体缩放（保险箱进场动画的放大效果）。
+        """
+        key = (path, tuple(box), bool(rotated), fit, scale)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+
+        # 解码和缩放放在锁外，多个渲染线程可以并行处理
+        if scale != 1.0:
+            base = self.get(path, box, rotated, fit)
+            sprite = base.resize((int(base.width * scale), int(base.height * scale)), Image.LANCZOS)
+        else:
+            sprite = self._load(path, tuple(box), rotated, fit)
+        size = sprite.width * sprite.height * 4
+
+        with self._lock:
+            self.misses += 1
+            if key not in self._sprites:
+                self._sprites[key] = sprite
+                self._bytes += size
+                # 按最近最少使用淘汰，直到总占用回到上限以内
+                while self._bytes > self.max_bytes and len(self._sprites) > 1:
+                    _, old = self._sprites.popitem(last=False)
+                    self._bytes -= old.width * old.height * 4
+            else:
+                sprite = self._sprites[key]
+        return sprite
+
+    def clear(self):
+        with self._lock:
+            self._sprites.clear()
+            self._bytes = 0
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._sprites)
+
+
+sprite_cache = SpriteCache()
+
+
+def get_sprite(path, box, rotated=False, fit="fit", scale=1.0):
+    """从全局缓存获取物品图片"""
+    return sprite_cache.get(path, box, rotated, fit, scale)
+
+
+def render_frames(path, box):
+    """解码动图的每一帧并拉伸到目标大小"""
+    frames = []
+    with Image.open(path) as img:
+        for idx in range(getattr(img, "n_frames", 1)):
+            img.seek(idx)
+            frames.append(img.convert("RGBA").resize(box, Image.LANCZOS))
+    return frames
+
+
+def load_frames(path, box):
+    """获取动图（或静态图）缩放后的帧，优先使用预构建的帧"""
+    prebuilt = prebuilt_assets.frames(path, box)
+    if prebuilt:
+        frames = []
+        for frame_path in prebuilt:
+            with Image.open(frame_path) as img:
+                frames.append(img.convert("RGBA"))
+        return frames
+    return render_frames(path, box)
@@ -1,15 +1,44 @@
 import random
-import asyncio
-import aiosqlite
 import time
-from datetime import datetime
 import os
+from .item_catalog import get_catalog
+from .sprite_cache import resolve_asset_path
+from .database import get_database
+
+# 普通事件的判定顺序（累计概率依次判断）
+EVENT_ORDER = (
+    "broken_liutao", "genius_kick", "genius_fine", "noob_teammate",
+    "hunted_escape", "passerby_mouse", "system_compensation"
+)
+
+# 丢包撤离时可以保留的物品尺寸
+HUNTED_ESCAPE_SIZES = ('1x1', '1x2', '2x1', '1x3', '3x1')
+
+# 路人鼠鼠送出金色物品后使用的格子大小（最大格子）
+PASSERBY_GRID_SIZE = 7
+
+# 赤枭对抗要求的最低偷吃价值
+CHIXIAO_MIN_VALUE = 50000
+
+# 需要在渲染前改动保险箱的事件（赤枭对抗可能抢先触发时暂缓）
+LAYOUT_EVENTS = ("hunted_escape", "passerby_mouse", "system_compensation")
+
+class EventRoll:
+    """偷吃开始时提前抽取的事件结果，会改动保险箱的事件可以在渲染前就确定下来"""
+
+    def __init__(self, chixiao_rand, event_rand, event_type=None, golden_item=None):
+        self.chixiao_rand = chixiao_rand    # 赤枭对抗判定用的随机数
+        self.event_rand = event_rand        # 普通事件判定用的随机数
+        self.event_type = event_type        # 将要触发的普通事件（不含赤枭对抗），无事件时为 None
+        self.golden_item = golden_item      # 路人鼠鼠送出的金色物品（物资记录）
+        self.chixiao_eligible = None        # 赤枭对抗能否参与判定，物品抽出后按原始总价值确定一次
 
 class TouchiEvents:
     """偷吃概率事件处理类"""
     
     def __init__(self, db_path, biaoqing_dir, chixiao_system=None):
         self.db_path = db_path
+        self.db = get_database(db_path)
         self.biaoqing_dir = biaoqing_dir
         self.chixiao_system = chixiao_system  # 赤枢系统
         
@@ -55,7 +84,7 @@ class TouchiEvents:
                 return None
             
             emoji_filename = self.event_emoji_mapping[event_type]
-            emoji_path = os.path.join(self.biaoqing_dir, emoji_filename)
+            emoji_path = resolve_asset_path(os.path.join(self.biaoqing_dir, emoji_filename))
             
             # 检查文件是否存在
             if os.path.exists(emoji_path):
@@ -71,7 +100,115 @@ class TouchiEvents:
             traceback.print_exc()
             return None
     
-    async def check_random_events(self, event, user_id, placed_items, total_value, is_menggong_active=False):
+    def roll_event(self):
+        """提前抽取事件结果（随机数、事件类型和路人鼠鼠送出的金色物品），返回 EventRoll"""
+        chixiao_rand, event_rand = random.random(), random.random()
+        event_type = None
+        cumulative_prob = 0
+        for candidate in EVENT_ORDER:
+            cumulative_prob += self.event_probabilities[candidate]
+            if event_rand < cumulative_prob:
+                event_type = candidate
+                break
+
+        golden_item = None
+        if event_type == "passerby_mouse":
+            gold_items = [
+                item for item in get_catalog().get_by_level("gold", source="items")
+                if item["path"].endswith(".png")
+            ]
+            if gold_items:
+                # 随机选择一个金色物品
+                golden_item = random.choice(gold_items)
+        return EventRoll(chixiao_rand, event_rand, event_type, golden_item)
+
+    def chixiao_may_preempt(self, event_roll):
+        """赤枭对抗第一段判定：只看随机数，物品抽出前就能确定"""
+        return bool(self.chixiao_system) and event_roll.chixiao_rand < self.event_probabilities["chixiao_battle"]
+
+    def settle_chixiao_precedence(self, event_roll, total_value):
+        """
+        赤枭对抗第二段判定：按改动保险箱之前的总价值确定赤枭对抗能否参与判定。
+
+        只确定一次，之后改写布局或重新抽取物品都不再影响赤枭对抗是否可能触发。
+        """
+        if event_roll.chixiao_eligible is None:
+            event_roll.chixiao_eligible = self.chixiao_may_preempt(event_roll) and total_value >= CHIXIAO_MIN_VALUE
+        return event_roll.chixiao_eligible
+
+    @staticmethod
+    def layout_event(event_roll):
+        """渲染前需要应用的事件；赤枭对抗可能抢先触发时先不改动保险箱，返回 None"""
+        if event_roll is None or event_roll.chixiao_eligible or event_roll.event_type not in LAYOUT_EVENTS:
+            return None
+        return event_roll.event_type
+
+    @staticmethod
+    def layout_deferred(event_roll):
+        """保险箱是否因为赤枭对抗可能抢先触发而暂缓了事件改动"""
+        return bool(event_roll and event_roll.chixiao_eligible and event_roll.event_type in LAYOUT_EVENTS)
+
+    @staticmethod
+    def filter_small_items(placed_items):
+        """丢包撤离：只保留小尺寸物品"""
+        return [
+            placed_item for placed_item in placed_items
+            if placed_item["item"].get("size") in HUNTED_ESCAPE_SIZES
+        ]
+
+    def rewrite_layout(self, event_roll, placed_items, grid_size):
+        """
+        按提前抽取的事件在渲染前改写保险箱布局，保证每个保险箱只渲染一次
+
+        Returns:
+            tuple: (placed_items, grid_size)
+        """
+        from .touchi import get_items_value
+
+        if event_roll is not None:
+            # 先按抽出的原始物品确定赤枭对抗能否参与判定，赤枭对抗可能抢先触发时不改写布局
+            self.settle_chixiao_precedence(event_roll, get_items_value(placed_items))
+        return self.apply_layout_event(self.layout_event(event_roll), event_roll, placed_items, grid_size)
+
+    def apply_layout_event(self, event_type, event_roll, placed_items, grid_size):
+        """
+        把丢包撤离或路人鼠鼠应用到布局上（系统补偿局改变的是抽取概率，布局不变）
+
+        Returns:
+            tuple: (placed_items, grid_size)
+        """
+        from .touchi import place_items
+
+        if event_type == "hunted_escape":
+            # 丢包撤离：只保留小物品，并按当前格子大小重新布局
+            kept_items = [placed_item["item"] for placed_item in self.filter_small_items(placed_items)]
+            return place_items(kept_items, grid_size, grid_size, grid_size), grid_size
+        if event_type == "passerby_mouse" and event_roll.golden_item:
+            # 路人鼠鼠：金色物品放在最前面，使用最大格子重新布局
+            items = [event_roll.golden_item] + [placed_item["item"] for placed_item in placed_items]
+            return place_items(items, PASSERBY_GRID_SIZE, PASSERBY_GRID_SIZE, PASSERBY_GRID_SIZE), PASSERBY_GRID_SIZE
+        return placed_items, grid_size
+
+    async def check_chixiao_event(self, event, user_id, total_value, is_menggong_active=False,
+                                  event_roll=None, settlement=None):
+        """检查赤枭对抗（优先级最高），未触发时返回 None，触发时返回与 check_random_events 相同的结果"""
+        event_roll = event_roll or self.roll_event()
+        # 仅在价值>=50000时参与判定（提前抽取的事件已按改动保险箱之前的价值确定）
+        if not self.settle_chixiao_precedence(event_roll, total_value):
+            return None
+
+        print(f"[TouchiEvents] 赤枢对抗检查: user_id={user_id}, total_value={total_value:,}, rand={event_roll.chixiao_rand:.4f}, prob={self.event_probabilities['chixiao_battle']:.2f}, is_menggong_active={is_menggong_active}")
+        print(f"[TouchiEvents] ✅ 概率检查通过，调用chixiao_system")
+        # 触发赤枢对抗
+        result = await self._handle_chixiao_battle_event(event, user_id, total_value, is_menggong_active,
+                                                         settlement=settlement)
+        print(f"[TouchiEvents] chixiao_system返回结果: triggered={result[0]}, result_type={result[1]}")
+        if not result[0]:
+            return None
+        return result[0], result[1], result[2], result[3], result[4], None, None, result[5]
+
+    async def check_random_events(self, event, user_id, placed_items, total_value, is_menggong_active=False,
+                                  event_roll=None, settlement=None, include_chixiao=True):
         """检查是否触发随机事件
         
         Args:
@@ -80,33 +217,32 @@ class TouchiEvents:
             placed_items: 偷吃获得的物品列表
             total_value: 物品总价值
             is_menggong_active: 是否在猛攻状态
+            event_roll: roll_event 提前抽取的事件结果（可选，不传时当场抽取）
+            settlement: 偷吃结算（可选，传入时事件产生的修改随本次偷吃一起提交）
+            include_chixiao: 是否检查赤枭对抗（已经单独调用 check_chixiao_event 时传 False）
             
         Returns:
             tuple: (是否触发事件, 事件类型, 修改后的物品列表, 修改后的总价值, 事件消息, 冷却时间倍率, 金色物品路径, 表情路径)
         """
         
-        # 优先检查赤枢对抗（仅在价值>=50000时）
-        if self.chixiao_system and total_value >= 50000:
-            rand = random.random()
-            print(f"[TouchiEvents] 赤枢对抗检查: user_id={user_id}, total_value={total_value:,}, rand={rand:.4f}, prob={self.event_probabilities['chixiao_battle']:.2f}, is_menggong_active={is_menggong_active}")
-            if rand < self.event_probabilities["chixiao_battle"]:
-                print(f"[TouchiEvents] ✅ 概率检查通过，调用chixiao_system")
-                # 触发赤枢对抗
-                result = await self._handle_chixiao_battle_event(event, user_id, total_value, is_menggong_active)
-                print(f"[TouchiEvents] chixiao_system返回结果: triggered={result[0]}, result_type={result[1]}")
-                if result[0]:  # 如果成功触发
-                    return result[0], result[1], result[2], result[3], result[4], None, None, result[5]
-            else:
-                print(f"[TouchiEvents] ❌ 概率检查未通过")
+        event_roll = event_roll or self.roll_event()
+
+        # 优先检查赤枢对抗
+        if include_chixiao:
+            result = await self.check_chixiao_event(event, user_id, total_value, is_menggong_active,
+                                                    event_roll, settlement)
+            if result:
+                return result
         
         # 随机检查其他事件
-        rand = random.random()
+        rand = event_roll.event_rand
         cumulative_prob = 0
         
         # 事件1: 获得残缺刘涛 
         cumulative_prob += self.event_probabilities["broken_liutao"]
         if rand < cumulative_prob:
-            result = await self._handle_broken_liutao_event(event, user_id, placed_items, total_value)
+            result = await self._handle_broken_liutao_event(event, user_id, placed_items, total_value,
+                                                           settlement=settlement)
             # result 包含: (triggered, type, items, value, message, emoji_path)
             return result[0], result[1], result[2], result[3], result[4], None, None, result[5]
         
@@ -120,7 +256,8 @@ class TouchiEvents:
         # 事件3: 排到天才少年被追缴 
         cumulative_prob += self.event_probabilities["genius_fine"]
         if rand < cumulative_prob:
-            result = await self._handle_genius_fine_event(event, user_id, placed_items, total_value)
+            result = await self._handle_genius_fine_event(event, user_id, placed_items, total_value,
+                                                         settlement=settlement)
             # result 包含: (triggered, type, items, value, message, emoji_path)
             return result[0], result[1], result[2], result[3], result[4], None, None, result[5]
         
@@ -141,7 +278,7 @@ class TouchiEvents:
         # 事件6: 遇到路人鼠鼠 
         cumulative_prob += self.event_probabilities["passerby_mouse"]
         if rand < cumulative_prob:
-            result = await self._handle_passerby_mouse_event(event, user_id, placed_items, total_value)
+            result = await self._handle_passerby_mouse_event(event, user_id, placed_items, total_value, event_roll.golden_item)
             if len(result) == 7:  # 路人鼠鼠事件返回7个值
                 return result[0], result[1], result[2], result[3], result[4], None, result[5], result[6]
             else:
@@ -157,7 +294,7 @@ class TouchiEvents:
         # 无事件触发
         return False, None, placed_items, total_value, None, None, None, None
     
-    async def _handle_broken_liutao_event(self, event, user_id, placed_items, total_value):
+    async def _handle_broken_liutao_event(self, event, user_id, placed_items, total_value, settlement=None):
         """处理获得残缺刘涛事件"""
         try:
             # 获取时间倍率
@@ -169,12 +306,11 @@ class TouchiEvents:
             actual_duration = int(base_duration * time_multiplier)
             menggong_end_time = current_time + actual_duration
             
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "UPDATE user_economy SET menggong_active = 1, menggong_end_time = ? WHERE user_id = ?",
-                    (menggong_end_time, user_id)
-                )
-                await db.commit()
+            sql = "UPDATE user_economy SET menggong_active = 1, menggong_end_time = ? WHERE user_id = ?"
+            if settlement is not None:
+                settlement.add(sql, (menggong_end_time, user_id))
+            else:
+                await self.db.execute(sql, (menggong_end_time, user_id))
             
             # 创建事件消息
             duration_text = f"{actual_duration//60}分{actual_duration%60}秒" if actual_duration >= 60 else f"{actual_duration}秒"
@@ -212,31 +348,33 @@ class TouchiEvents:
             print(f"处理天才少年踢死事件时出错: {e}")
             return False, None, placed_items, total_value, None, None
     
-    async def _handle_genius_fine_event(self, event, user_id, placed_items, total_value):
+    async def _handle_genius_fine_event(self, event, user_id, placed_items, total_value, settlement=None):
         """处理排到天才少年被追缴事件"""
         try:
             # 追缴金额为偷吃价值的60%
             fine_amount = int(total_value * 0.6)
             
-            async with aiosqlite.connect(self.db_path) as db:
-                # 检查当前仓库价值（本次偷吃前的价值）
-                cursor = await db.execute(
-                    "SELECT warehouse_value FROM user_economy WHERE user_id = ?",
-                    (user_id,)
-                )
-                result = await cursor.fetchone()
-                current_value = result[0] if result else 0
-                
-                # 计算净收益：本次偷吃价值 - 追缴金额
-                net_profit = total_value - fine_amount
-                
-                # 更新仓库价值：原有价值 + 净收益
-                new_value = current_value + net_profit
-                await db.execute(
-                    "UPDATE user_economy SET warehouse_value = ? WHERE user_id = ?",
-                    (new_value, user_id)
-                )
-                await db.commit()
+            # 检查当前仓库价值（本次偷吃前的价值）
+            result = await self.db.fetchone(
+                "SELECT warehouse_value FROM user_economy WHERE user_id = ?",
+                (user_id,)
+            )
+            current_value = result[0] if result else 0
+            
+            # 计算净收益：本次偷吃价值 - 追缴金额
+            net_profit = total_value - fine_amount
+            
+            # 更新仓库价值：原有价值 + 净收益（相对更新，不覆盖结算前其他操作的修改）
+            new_value = current_value + net_profit
+            own_settlement = settlement is None
+            if own_settlement:
+                settlement = self.db.settlement()
+            settlement.add(
+                "UPDATE user_economy SET warehouse_value = warehouse_value + ? WHERE user_id = ?",
+                (net_profit, user_id)
+            )
+            if own_settlement:
+                await settlement.commit()
             
             # 创建事件消息
             if net_profit >= 0:
@@ -284,23 +422,8 @@ class TouchiEvents:
         """处理被追杀丢包撤离事件"""
         try:
             # 不删除数据库中的物品，只是不保留本次大物品记录到库中
-            allowed_sizes = ['1x1', '1x2', '2x1', '1x3', '3x1']
-            
-            # 过滤当前偷吃的物品，只保留小尺寸物品
-            filtered_items = []
-            current_items_removed = 0
-            
-            for placed_item in placed_items:
-                item = placed_item["item"]
-                item_base_name = item["base_name"]
-                item_size = self._extract_size_from_name(item_base_name)
-                
-                if item_size and item_size in allowed_sizes:
-                    # 保留小尺寸物品
-                    filtered_items.append(placed_item)
-                else:
-                    # 丢弃大尺寸物品（不记录到数据库）
-                    current_items_removed += 1
+            # 过滤当前偷吃的物品，只保留小尺寸物品（大尺寸物品不记录到数据库）
+            filtered_items = self.filter_small_items(placed_items)
             
             # 重新计算当前偷吃的总价值
             filtered_value = 0
@@ -325,17 +448,6 @@ class TouchiEvents:
             print(f"处理被追杀丢包撤离事件时出错: {e}")
             return False, None, placed_items, total_value, None, None
     
-    def _extract_size_from_name(self, item_name):
-        """从物品名称中提取尺寸信息"""
-        # 物品名称格式通常是: 等级_尺寸_物品名
-        # 例如: "1_1x1_物品名" 或 "2_2x1_物品名"
-        parts = item_name.split('_')
-        if len(parts) >= 2:
-            potential_size = parts[1]
-            if 'x' in potential_size:
-                return potential_size
-        return None
-    
     async def _recalculate_warehouse_value(self, db, user_id):
         """重新计算用户仓库价值"""
         from .touchi import get_item_value
@@ -359,21 +471,11 @@ class TouchiEvents:
             (total_value, user_id)
          )
     
-    async def _handle_passerby_mouse_event(self, event, user_id, placed_items, total_value):
-        """处理遇到路人鼠鼠事件"""
+    async def _handle_passerby_mouse_event(self, event, user_id, placed_items, total_value, golden_item=None):
+        """处理遇到路人鼠鼠事件（金色物品在 roll_event 中选出，渲染前已经放进保险箱布局）"""
         try:
-            import os
-            import glob
-            import random
-            
-            # 获取所有金色物品
-            items_dir = os.path.join(os.path.dirname(__file__), "items")
-            gold_items = glob.glob(os.path.join(items_dir, "gold_*.png"))
-            
-            if gold_items:
-                # 随机选择一个金色物品
-                selected_gold_item = random.choice(gold_items)
-                item_name = os.path.splitext(os.path.basename(selected_gold_item))[0]
+            if golden_item:
+                selected_gold_item = golden_item["path"]
                 
                 # 创建事件消息
                 event_message = (
@@ -384,7 +486,7 @@ class TouchiEvents:
                 
                 # 获取表情路径
                 emoji_path = self.get_event_emoji_path("passerby_mouse")
-                # 返回原始物品和价值，金色物品将在重新生成时添加
+                # 物品列表和总价值中已经包含金色物品
                 return True, "passerby_mouse", placed_items, total_value, event_message, selected_gold_item, emoji_path
             else:
                 # 如果没有金色物品，返回正常结果
@@ -433,7 +535,7 @@ class TouchiEvents:
     async def _get_menggong_time_multiplier(self):
         """获取当前六套时间倍率"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 cursor = await db.execute(
                     "SELECT config_value FROM system_config WHERE config_key = 'menggong_time_multiplier'"
                 )
@@ -446,7 +548,7 @@ class TouchiEvents:
             print(f"获取六套时间倍率时出错: {e}")
             return 1.0  # 默认倍率
 
-    async def _handle_chixiao_battle_event(self, event, user_id, total_value, is_menggong_active):
+    async def _handle_chixiao_battle_event(self, event, user_id, total_value, is_menggong_active, settlement=None):
         """处理赤枭对抗事件"""
         if not self.chixiao_system:
             print(f"[TouchiEvents] ❌ chixiao_system 为 None")
@@ -462,7 +564,7 @@ class TouchiEvents:
             print(f"[TouchiEvents] 调用 check_and_trigger_battle: user_id={user_id}, total_value={total_value:,}, is_menggong_active={is_menggong_active}, 赤枢数量={len(chixiao_players)}")
             # 调用赤枢系统的检查方法
             triggered, result_type, chixiao_id, amount, kills = await self.chixiao_system.check_and_trigger_battle(
-                user_id, total_value, is_menggong_active
+                user_id, total_value, is_menggong_active, settlement=settlement
             )
             print(f"[TouchiEvents] check_and_trigger_battle 返回: triggered={triggered}, result_type={result_type}, chixiao_id={chixiao_id}, amount={amount}, kills={kills}")
             
@@ -4,23 +4,33 @@ import json
 import random
 import os
 import time
+import math
 import httpx
-import aiosqlite  # Import the standard SQLite library
+from concurrent.futures.process import BrokenProcessPool
 from astrbot.api.message_components import At, Plain, Image
 from astrbot.api.event import MessageChain
 from astrbot.api import logger
 
-from .touchi import generate_safe_image, get_item_value
+from .touchi import create_safe_render, build_layout_render_spec, render_safe_spec, get_item_value, get_items_value
+from .sprite_cache import resolve_asset_path
+from .animation_output import AnimationOptions, AnimationFormatSelector
+from .render_pool import RenderPool, RenderQueueFull
+from .artifact_store import artifact_store
+from .database import get_database
 
 class TouchiTools:
     def __init__(self, enable_touchi=True, enable_beauty_pic=True, cd=5, db_path=None, enable_static_image=False,
                  experimental_custom_drop_rates=False, normal_mode_drop_rates=None, menggong_mode_drop_rates=None,
-                 chixiao_system=None):
+                 chixiao_system=None, animation_options=None, animation_formats=None, render_pool=None):
         self.enable_touchi = enable_touchi
         self.enable_beauty_pic = enable_beauty_pic
         self.cd = cd
         self.db_path = db_path # Path to the database file
+        self.db = get_database(db_path)  # 共用的数据库连接
         self.enable_static_image = enable_static_image
+        self.animation_options = animation_options or AnimationOptions()
+        self.animation_formats = animation_formats or AnimationFormatSelector()
+        self.render_pool = render_pool or RenderPool(workers=0)
         self.experimental_custom_drop_rates = experimental_custom_drop_rates
         self.normal_mode_drop_rates = normal_mode_drop_rates or {"blue": 0.25, "purple": 0.42, "gold": 0.28, "red": 0.05}
         self.menggong_mode_drop_rates = menggong_mode_drop_rates or {"purple": 0.45, "gold": 0.45, "red": 0.10}
@@ -75,25 +85,17 @@ class TouchiTools:
     async def _clear_stale_auto_touchi_state(self, user_id):
         self.auto_touchi_tasks.pop(user_id, None)
         self.auto_touchi_data.pop(user_id, None)
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.write() as db:
             await db.execute(
                 "UPDATE user_economy SET auto_touchi_active = 0, auto_touchi_start_time = 0 WHERE user_id = ?",
                 (user_id,)
             )
             await db.commit()
 
-    @staticmethod
-    def _split_item_filename(filename_or_path):
-        stem = os.path.splitext(os.path.basename(filename_or_path))[0]
-        parts = stem.split('_')
-        if len(parts) >= 4 and parts[-1].isdigit():
-            return '_'.join(parts[:-1]), int(parts[-1]), stem
-        return stem, None, stem
-
     async def _load_multiplier(self):
         """从数据库加载冷却倍率"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 cursor = await db.execute(
                     "SELECT config_value FROM system_config WHERE config_key = 'touchi_cooldown_multiplier'"
                 )
@@ -118,7 +120,7 @@ class TouchiTools:
 
         try:
             # 保存到数据库
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute(
                     "INSERT OR REPLACE INTO system_config (config_key, config_value) VALUES ('touchi_cooldown_multiplier', ?)",
                     (str(multiplier),)
@@ -136,7 +138,7 @@ class TouchiTools:
     async def clear_user_data(self, user_id=None):
         """清除用户数据（管理员功能）"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 if user_id:
                     # 清除指定用户数据
                     await db.execute("DELETE FROM user_touchi_collection WHERE user_id = ?", (user_id,))
@@ -192,144 +194,129 @@ class TouchiTools:
             resp.raise_for_status()
             return resp.json()
 
-    async def add_items_to_collection(self, user_id, placed_items):
-        """将获得的物品添加到用户收藏中并更新仓库价值"""
+    def _queue_collection_items(self, settlement, user_id, placed_items):
+        """把物品入库和检视记录加入结算，返回物品总价值"""
+        total_value = 0
+        items_for_jianshi = []
+
+        # 添加物品到收藏
+        for placed in placed_items:
+            item = placed["item"]
+            item_name = os.path.splitext(os.path.basename(item["path"]))[0]
+            item_level = item["level"]
+            total_value += item.get("value", get_item_value(item_name))
+
+            # 提取物品的唯一标识（最后一个下划线后的部分）
+            parts = item_name.split('_')
+            if len(parts) >= 3:
+                unique_id = parts[-1]  # 获取最后一部分作为唯一标识
+                items_for_jianshi.append({
+                    'item_name': item_name,
+                    'unique_id': unique_id,
+                    'item_level': item_level
+                })
+
+            settlement.add(
+                "INSERT OR IGNORE INTO user_touchi_collection (user_id, item_name, item_level) VALUES (?, ?, ?)",
+                (user_id, item_name, item_level)
+            )
+
+        # 记录最后一次偷吃的物品（用于检视功能）
+        if items_for_jianshi:
+            settlement.add(
+                "INSERT OR REPLACE INTO user_last_touchi (user_id, items_json, jianshi_index) VALUES (?, ?, 0)",
+                (user_id, json.dumps(items_for_jianshi))
+            )
+        return total_value
+
+    async def add_items_to_collection(self, user_id, placed_items, settlement=None):
+        """将获得的物品添加到用户收藏中并更新仓库价值
+
+        传入 settlement 时只把写操作加入结算，由调用方统一提交；否则立即提交。
+        """
         if not self.db_path or not placed_items:
             return
 
         try:
-            total_value = 0
-            items_for_jianshi = []
-
-            async with aiosqlite.connect(self.db_path) as db:
-                # 添加物品到收藏
-                for placed in placed_items:
-                    item = placed["item"]
-                    item_name = os.path.splitext(os.path.basename(item["path"]))[0]
-                    item_level = item["level"]
-                    item_value = item.get("value", get_item_value(item_name))
-                    total_value += item_value
-
-                    # 提取物品的唯一标识（最后一个下划线后的部分）
-                    parts = item_name.split('_')
-                    if len(parts) >= 3:
-                        unique_id = parts[-1]  # 获取最后一部分作为唯一标识
-                        items_for_jianshi.append({
-                            'item_name': item_name,
-                            'unique_id': unique_id,
-                            'item_level': item_level
-                        })
-
-                    await db.execute(
-                        "INSERT OR IGNORE INTO user_touchi_collection (user_id, item_name, item_level) VALUES (?, ?, ?)",
-                        (user_id, item_name, item_level)
-                    )
-
-                # 更新用户经济数据
-                await db.execute(
-                    "INSERT OR IGNORE INTO user_economy (user_id) VALUES (?)",
-                    (user_id,)
-                )
-                await db.execute(
-                    "UPDATE user_economy SET warehouse_value = warehouse_value + ? WHERE user_id = ?",
-                    (total_value, user_id)
-                )
+            own_settlement = settlement is None
+            if own_settlement:
+                settlement = self.db.settlement()
 
-                # 记录最后一次偷吃的物品（用于检视功能）
-                if items_for_jianshi:
-                    import json
-                    items_json = json.dumps(items_for_jianshi)
-                    await db.execute(
-                        "INSERT OR REPLACE INTO user_last_touchi (user_id, items_json, jianshi_index) VALUES (?, ?, 0)",
-                        (user_id, items_json)
-                    )
+            total_value = self._queue_collection_items(settlement, user_id, placed_items)
+            self._queue_warehouse_value(settlement, user_id, total_value)
 
-                await db.commit()
-            logger.info(f"用户 {user_id} 成功记录了 {len(placed_items)} 个物品到[collection.db]，总价值: {total_value}。")
+            if own_settlement:
+                await settlement.commit()
+                logger.info(f"用户 {user_id} 成功记录了 {len(placed_items)} 个物品到[collection.db]，总价值: {total_value}。")
         except Exception as e:
             logger.error(f"为用户 {user_id} 添加物品到数据库[collection.db]时出错: {e}")
+            if not own_settlement:
+                raise
 
-    async def add_items_to_collection_without_value_update(self, user_id, placed_items):
+    async def add_items_to_collection_without_value_update(self, user_id, placed_items, settlement=None):
         """将获得的物品添加到用户收藏中但不更新仓库价值（用于追缴事件）"""
         if not self.db_path or not placed_items:
             return
 
         try:
-            items_for_jianshi = []
-
-            async with aiosqlite.connect(self.db_path) as db:
-                # 添加物品到收藏
-                for placed in placed_items:
-                    item = placed["item"]
-                    item_name = os.path.splitext(os.path.basename(item["path"]))[0]
-                    item_level = item["level"]
-
-                    # 提取物品的唯一标识（最后一个下划线后的部分）
-                    parts = item_name.split('_')
-                    if len(parts) >= 3:
-                        unique_id = parts[-1]  # 获取最后一部分作为唯一标识
-                        items_for_jianshi.append({
-                            'item_name': item_name,
-                            'unique_id': unique_id,
-                            'item_level': item_level
-                        })
-
-                    await db.execute(
-                        "INSERT OR IGNORE INTO user_touchi_collection (user_id, item_name, item_level) VALUES (?, ?, ?)",
-                        (user_id, item_name, item_level)
-                    )
+            own_settlement = settlement is None
+            if own_settlement:
+                settlement = self.db.settlement()
 
-                # 记录最后一次偷吃的物品（用于检视功能）
-                if items_for_jianshi:
-                    import json
-                    items_json = json.dumps(items_for_jianshi)
-                    await db.execute(
-                        "INSERT OR REPLACE INTO user_last_touchi (user_id, items_json, jianshi_index) VALUES (?, ?, 0)",
-                        (user_id, items_json)
-                    )
+            self._queue_collection_items(settlement, user_id, placed_items)
 
-                await db.commit()
-            logger.info(f"用户 {user_id} 成功记录了 {len(placed_items)} 个物品到[collection.db]（追缴事件，不更新价值）。")
+            if own_settlement:
+                await settlement.commit()
+                logger.info(f"用户 {user_id} 成功记录了 {len(placed_items)} 个物品到[collection.db]（追缴事件，不更新价值）。")
         except Exception as e:
             logger.error(f"为用户 {user_id} 添加物品到数据库[collection.db]时出错: {e}")
+            if not own_settlement:
+                raise
+
+    @staticmethod
+    def _queue_warehouse_value(settlement, user_id, amount):
+        """把仓库价值变化加入结算（用户不存在时先创建记录）"""
+        settlement.add(
+            "INSERT OR IGNORE INTO user_economy (user_id) VALUES (?)",
+            (user_id,)
+        )
+        settlement.add(
+            "UPDATE user_economy SET warehouse_value = warehouse_value + ? WHERE user_id = ?",
+            (amount, user_id)
+        )
 
-    async def _add_warehouse_value(self, user_id, amount):
+    async def _add_warehouse_value(self, user_id, amount, settlement=None):
         if not self.db_path or not user_id or amount <= 0:
             return
 
+        if settlement is not None:
+            self._queue_warehouse_value(settlement, user_id, amount)
+            return
+
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "INSERT OR IGNORE INTO user_economy (user_id) VALUES (?)",
-                    (user_id,)
-                )
-                await db.execute(
-                    "UPDATE user_economy SET warehouse_value = warehouse_value + ? WHERE user_id = ?",
-                    (amount, user_id)
-                )
-                await db.commit()
+            settlement = self.db.settlement()
+            self._queue_warehouse_value(settlement, user_id, amount)
+            await settlement.commit()
         except Exception as e:
             logger.error(f"Failed to add warehouse value for user {user_id}: {e}")
 
     async def get_user_economy_data(self, user_id):
         """获取用户经济数据"""
+        select_sql = "SELECT warehouse_value, teqin_level, grid_size, menggong_active, menggong_end_time, auto_touchi_active, auto_touchi_start_time FROM user_economy WHERE user_id = ?"
+        fields = ("warehouse_value", "teqin_level", "grid_size", "menggong_active", "menggong_end_time",
+                  "auto_touchi_active", "auto_touchi_start_time")
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                cursor = await db.execute(
-                    "SELECT warehouse_value, teqin_level, grid_size, menggong_active, menggong_end_time, auto_touchi_active, auto_touchi_start_time FROM user_economy WHERE user_id = ?",
-                    (user_id,)
-                )
+            # 老用户直接从读连接查询，不占用写连接
+            result = await self.db.fetchone(select_sql, (user_id,))
+            if result:
+                return dict(zip(fields, result))
+
+            async with self.db.write() as db:
+                # 拿到写连接后再确认一次，避免并发请求重复创建记录
+                cursor = await db.execute(select_sql, (user_id,))
                 result = await cursor.fetchone()
                 if result:
-                    return {
-                        "warehouse_value": result[0],
-                        "teqin_level": result[1],
-                        "grid_size": result[2],
-                        "menggong_active": result[3],
-                        "menggong_end_time": result[4],
-                        "auto_touchi_active": result[5],
-                        "auto_touchi_start_time": result[6]
-                    }
+                    return dict(zip(fields, result))
                 else:
                     # 获取系统配置的基础等级
                     config_cursor = await db.execute(
@@ -462,13 +449,21 @@ class TouchiTools:
             # 将时间倍率传递给后续处理，用于影响爆率
             setattr(event, '_time_multiplier', time_multiplier)
 
+            # 等待开始时就在后台抽取并渲染保险箱，计时结束时只需发送
+            prepared_box = None
+            if economy_data:
+                prepared_box = self._start_safe_box_render(
+                    menggong_active_at_start, economy_data["grid_size"], time_multiplier,
+                    self.animation_formats.format_for(event)
+                )
+
             # 处理图片名称，如果是列表则随机选择一个
             if isinstance(image_name, list):
                 selected_image = random.choice(image_name)
             else:
                 selected_image = image_name
 
-            image_path = os.path.join(self.biaoqing_dir, selected_image)
+            image_path = resolve_asset_path(os.path.join(self.biaoqing_dir, selected_image))
 
             if not os.path.exists(image_path):
                 logger.warning(f"表情图片不存在: {image_path}")
@@ -488,7 +483,8 @@ class TouchiTools:
                 actual_wait_time,
                 user_id,
                 menggong_mode=menggong_active_at_start,
-                time_multiplier=time_multiplier
+                time_multiplier=time_multiplier,
+                prepared_box=prepared_box
             )
             if result:
 
@@ -498,13 +494,19 @@ class TouchiTools:
 
                 # 发送偷吃结果
                 if result['success']:
-                    if result['image_path']:
+                    image_handle = result.get('image_handle')
+                    image_data = artifact_store.get(image_handle) if image_handle else None
+                    if image_data:
                         chain = [
                             At(qq=event.get_sender_id()),
                             Plain(f"\n{result['message']}"),
-                            Image.fromFileSystem(result['image_path']),
+                            Image.fromBytes(image_data),
                         ]
-                        yield event.chain_result(chain)
+                        try:
+                            yield event.chain_result(chain)
+                        finally:
+                            # 消息发送完成（或生成器被关闭）后释放图片数据
+                            artifact_store.release(image_handle)
                     else:
                         chain = [
                             At(qq=event.get_sender_id()),
@@ -518,8 +520,144 @@ class TouchiTools:
                     ]
                     yield event.chain_result(chain)
 
-    async def send_delayed_safe_box(self, event, wait_time, user_id=None, menggong_mode=False, time_multiplier=1.0):
-        """异步生成保险箱图片，发送并记录到数据库"""
+    def _start_safe_box_render(self, menggong_mode, grid_size, time_multiplier, output_format):
+        """偷吃开始时提前抽取事件和物品，并在后台开始渲染，返回 asyncio.Task"""
+        event_roll = self.events.roll_event()
+        return asyncio.create_task(
+            self._prepare_safe_box(menggong_mode, grid_size, time_multiplier, output_format, event_roll)
+        )
+
+    @staticmethod
+    def _new_prepared(menggong_mode, grid_size, event_roll):
+        return {
+            "menggong_mode": menggong_mode,
+            "grid_size": grid_size,
+            "event_roll": event_roll,
+            "placed_items": [],
+            "spec": None,
+            "empty": False,
+            "data": None,
+            "extension": None,
+            "error": None,
+            "deferred": None
+        }
+
+    async def _prepare_safe_box(self, menggong_mode, grid_size, time_multiplier, output_format, event_roll):
+        """
+        抽取并放置物品后交给渲染进程池绘制，图片数据先保存在内存中，计时结束后再写入文件发送。
+
+        会改动保险箱的事件按提前抽取的结果在渲染前确定：系统补偿局直接使用六套模式概率抽取，
+        丢包撤离和路人鼠鼠由 TouchiEvents.rewrite_layout 改写布局，每个保险箱只渲染一次。
+        赤枭对抗优先级最高，可能抢先触发时（见 TouchiEvents.layout_deferred）保险箱先不改动，
+        同时渲染应用了事件的保险箱放在 deferred 中，揭晓时赤枭对抗没有触发就改用它。
+
+        返回的 prepared 中 empty 为 True 表示物资资源缺失、没有可以放置的物品，data 为空表示渲染失败，
+        error 为渲染失败的异常。
+        """
+        prepared = self._new_prepared(menggong_mode, grid_size, event_roll)
+        try:
+            # 传递自定义概率参数
+            custom_normal = self.normal_mode_drop_rates if self.experimental_custom_drop_rates else None
+            custom_menggong = self.menggong_mode_drop_rates if self.experimental_custom_drop_rates else None
+
+            def draw(use_menggong_probability):
+                return create_safe_render(
+                    use_menggong_probability, grid_size, time_multiplier, 0.7, False, self.enable_static_image,
+                    custom_normal, custom_menggong, output_format, self.animation_options,
+                    rewrite_layout=lambda placed, size: self.events.rewrite_layout(event_roll, placed, size)
+                )
+
+            # 系统补偿局使用六套模式概率；赤枭对抗还没确定时先按原来的概率抽取，
+            # 按抽出物品的总价值确定赤枭对抗不会参与判定后再按六套模式概率重新抽取
+            undecided = event_roll.chixiao_eligible is None and self.events.chixiao_may_preempt(event_roll)
+            compensation = not undecided and self.events.layout_event(event_roll) == "system_compensation"
+            spec, placed_items = draw(menggong_mode or compensation)
+            if (spec is not None and undecided and not menggong_mode
+                    and self.events.layout_event(event_roll) == "system_compensation"):
+                spec, placed_items = draw(True)
+
+            if spec is None:
+                prepared["empty"] = True
+                return prepared
+            prepared["spec"] = spec
+            prepared["placed_items"] = placed_items
+
+            if self.events.layout_deferred(event_roll):
+                prepared["deferred"] = self._prepare_deferred_box(prepared, output_format, draw)
+        except Exception as e:
+            logger.error(f"抽取保险箱物品失败: {type(e).__name__} {e}")
+            return prepared
+        boxes = [prepared] + ([prepared["deferred"]] if prepared["deferred"] else [])
+        await asyncio.gather(*(self._render_prepared(box) for box in boxes if box["spec"] is not None))
+        return prepared
+
+    def _prepare_deferred_box(self, prepared, output_format, draw):
+        """
+        赤枭对抗可能抢先触发时，按提前抽取的事件准备改动后的保险箱（和原保险箱一起渲染）。
+
+        系统补偿局按六套模式概率重新抽取；丢包撤离和路人鼠鼠改写原保险箱的物品。
+        事件不改变保险箱时（猛攻中的系统补偿局、路人鼠鼠没有金色物品）返回 None。
+        """
+        event_roll = prepared["event_roll"]
+        deferred = self._new_prepared(prepared["menggong_mode"], prepared["grid_size"], event_roll)
+        if event_roll.event_type == "system_compensation":
+            if prepared["menggong_mode"]:
+                return None
+            # 赤枭对抗已经确定可能触发，draw 中不会再改写布局
+            spec, placed_items = draw(True)
+        else:
+            placed_items, grid_size = self.events.apply_layout_event(
+                event_roll.event_type, event_roll, prepared["placed_items"], prepared["grid_size"]
+            )
+            if placed_items is prepared["placed_items"]:
+                return None
+            spec = build_layout_render_spec(placed_items, grid_size, 0.7, False, self.enable_static_image,
+                                            output_format, self.animation_options)
+        if spec is None:
+            deferred["empty"] = True
+            return deferred
+        deferred["spec"] = spec
+        deferred["placed_items"] = placed_items
+        return deferred
+
+    async def _render_prepared(self, prepared):
+        """
+        渲染已经抽好的保险箱。渲染队列已满或超时时直接失败；
+        进程池重建后仍然崩溃时改在本进程中渲染（有并发上限，见 RenderPool.run_in_process）
+        """
+        try:
+            try:
+                prepared["data"], prepared["extension"] = await self.render_pool.run(render_safe_spec, prepared["spec"])
+            except BrokenProcessPool:
+                logger.warning("渲染进程池不可用，在本进程中渲染保险箱")
+                prepared["data"], prepared["extension"] = await self.render_pool.run_in_process(
+                    render_safe_spec, prepared["spec"]
+                )
+        except Exception as e:
+            prepared["error"] = e
+            logger.error(f"渲染保险箱图片失败: {type(e).__name__} {e}")
+        return prepared
+
+    @staticmethod
+    def _safe_box_failure(prepared):
+        """保险箱没有生成图片时的结果：区分物资资源缺失和渲染失败"""
+        if prepared and prepared["empty"]:
+            message = "🎁保险箱物资资源缺失，暂时无法打开！"
+        elif prepared and isinstance(prepared["error"], RenderQueueFull):
+            message = "🎁开保险箱的鼠鼠太多了，请稍后再试！"
+        else:
+            message = "🎁打开时出了点问题！"
+        return {
+            'success': False,
+            'message': message,
+            'image_handle': None,
+            'has_event': False
+        }, None
+
+    async def send_delayed_safe_box(self, event, wait_time, user_id=None, menggong_mode=False, time_multiplier=1.0,
+                                    prepared_box=None):
+        """等待结束后发送保险箱图片并记录到数据库（prepared_box 为等待开始时启动的预渲染任务）"""
+        settlement = None
         try:
             await asyncio.sleep(wait_time)
 
@@ -529,50 +667,46 @@ class TouchiTools:
             # 清除等待状态
             if user_id in self.waiting_users:
                 del self.waiting_users[user_id]
-            economy_data = await self.get_user_economy_data(user_id)
-            if not economy_data:
-                return None, None
-
-            # 检查猛攻状态
-            current_time = int(time.time())
-            if economy_data["menggong_active"] and current_time < economy_data["menggong_end_time"]:
-                menggong_mode = True
-
-            loop = asyncio.get_running_loop()
-
-            # 默认使用用户当前的格子大小
-            used_grid_size = economy_data["grid_size"]
-
-            # 检查是否需要使用特殊模式（系统补偿局事件使用六套模式概率）
-            use_menggong_probability = menggong_mode
-
-            # 传递自定义概率参数
-            custom_normal = self.normal_mode_drop_rates if self.experimental_custom_drop_rates else None
-            custom_menggong = self.menggong_mode_drop_rates if self.experimental_custom_drop_rates else None
             delayed_event_message = None
 
-            safe_image_path, placed_items = await loop.run_in_executor(
-                None, generate_safe_image, use_menggong_probability, used_grid_size, time_multiplier, 0.7, False, self.enable_static_image,
-                custom_normal, custom_menggong
-            )
+            if prepared_box is None:
+                # 等待开始时没有拿到经济数据，没有预先渲染的保险箱
+                return self._safe_box_failure(None)
+            prepared = await prepared_box
 
-            if not safe_image_path or not os.path.exists(safe_image_path):
-                return {
-                    'success': False,
-                    'message': "🎁打开时出了点问题！",
-                    'image_path': None,
-                    'has_event': False
-                }, None
+            # 猛攻状态和格子大小按等待开始时的状态确定，揭晓时不再重新抽取或渲染
+            menggong_mode = prepared["menggong_mode"]
+            if not prepared["data"]:
+                return self._safe_box_failure(prepared)
 
+            placed_items = prepared["placed_items"]
             # 计算总价值
-            total_value = sum(item["item"].get("value", get_item_value(
-                os.path.splitext(os.path.basename(item["item"]["path"]))[0]
-            )) for item in placed_items)
+            total_value = get_items_value(placed_items)
 
-            # 检查概率事件（传递猛攻状态）
-            event_triggered, event_type, final_items, final_value, event_message, cooldown_multiplier, golden_item_path, event_emoji_path = await self.events.check_random_events(
-                event, user_id, placed_items, total_value, is_menggong_active=menggong_mode
+            # 本次保险箱的全部写操作（物品、仓库价值、事件、赤枭对抗、洲了个洲触发记录）先收集起来，最后一次性提交
+            settlement = self.db.settlement()
+
+            # 优先检查赤枭对抗（传递猛攻状态）
+            event_roll = prepared["event_roll"]
+            event_result = await self.events.check_chixiao_event(
+                event, user_id, total_value, is_menggong_active=menggong_mode,
+                event_roll=event_roll, settlement=settlement
             )
+            if event_result is None:
+                if prepared["deferred"] is not None:
+                    # 赤枭对抗没有触发，改用等待期间已经按提前抽取的事件渲染好的保险箱
+                    prepared = prepared["deferred"]
+                    if not prepared["data"]:
+                        return self._safe_box_failure(prepared)
+                    placed_items = prepared["placed_items"]
+                    total_value = get_items_value(placed_items)
+
+                # 检查其他概率事件
+                event_result = await self.events.check_random_events(
+                    event, user_id, placed_items, total_value, is_menggong_active=menggong_mode,
+                    event_roll=event_roll, settlement=settlement, include_chixiao=False
+                )
+            event_triggered, event_type, final_items, final_value, event_message, cooldown_multiplier, golden_item_path, event_emoji_path = event_result
             # 如果触发事件，先发送事件消息
             if event_triggered and event_message:
                 # 发送事件消息（文字+表情）
@@ -585,326 +719,25 @@ class TouchiTools:
 
                 delayed_event_message = event_chain
 
-                # 如果触发系统补偿局事件，需要重新生成图片使用六套模式概率
-                if event_triggered and event_type == "system_compensation":
-                    # 重新生成图片，使用六套模式概率
-                    custom_menggong = self.menggong_mode_drop_rates if self.experimental_custom_drop_rates else None
-                    safe_image_path, placed_items = await loop.run_in_executor(
-                        None, generate_safe_image, True, used_grid_size, time_multiplier, 0.7, False, self.enable_static_image,
-                        None, custom_menggong
-                    )
-
-                    # 重新计算总价值
-                    final_value = sum(item["item"].get("value", get_item_value(
-                        os.path.splitext(os.path.basename(item["item"]["path"]))[0]
-                    )) for item in placed_items)
-                    final_items = placed_items
-
-                # 如果触发丢包撤离事件，需要重新生成图片只显示小物品
-                elif event_triggered and event_type == "hunted_escape":
-                    # 使用过滤后的物品重新生成图片
-                    def generate_with_filtered_items():
-                        from .touchi import load_items, create_safe_layout, render_safe_layout_gif, get_highest_level, load_expressions
-                        from PIL import Image
-                        import os
-                        from datetime import datetime
-
-                        # 加载所有可用物品
-                        all_items = load_items()
-                        if not all_items:
-                            return None, []
-
-                        # 创建包含过滤后物品的特定物品列表
-                        specific_items = []
-
-                        # 添加过滤后的物品
-                        for filtered_item in final_items:
-                            item_name = filtered_item["item"]["base_name"]
-                            item_level = filtered_item["item"]["level"]
-                            for item in all_items:
-                                if item["base_name"] == item_name and item["level"] == item_level:
-                                    specific_items.append(item)
-                                    break
-
-                        # 使用当前格子大小重新布局
-                        from .touchi import place_items
-                        placed_items_new = place_items(specific_items, used_grid_size, used_grid_size, used_grid_size)
-
-                        # 生成图片 - 修复返回值接收
-                        result = render_safe_layout_gif(placed_items_new, 0, 0, used_grid_size, used_grid_size, used_grid_size)
-                        if not result or not result[0]:
-                            return None, []
-
-                        # 正确接收返回值：frames 和 total_frames
-                        safe_frames, total_frames = result
-
-                        # 加载表情图片
-                        expressions = load_expressions()
-                        if not expressions:
-                            return None, []
-
-                        highest_level = get_highest_level(placed_items_new)
-                        eating_path = expressions.get("eating")
-                        expression_map = {"gold": "happy", "red": "eat"}
-                        final_expression = expression_map.get(highest_level, "cry")
-                        final_expr_path = expressions.get(final_expression)
-
-                        if not eating_path or not final_expr_path:
-                            return None, []
-
-                        # 生成最终图片
-                        expression_size = used_grid_size * 100
-
-                        # 加载eating.gif帧
-                        eating_frames = []
-                        with Image.open(eating_path) as eating_gif:
-                            for frame_idx in range(eating_gif.n_frames):
-                                eating_gif.seek(frame_idx)
-                                eating_frame = eating_gif.convert("RGBA")
-                                eating_frame = eating_frame.resize((expression_size, expression_size), Image.LANCZOS)
-                                eating_frames.append(eating_frame.copy())
-
-                        # 加载最终表情
-                        with Image.open(final_expr_path).convert("RGBA") as final_expr_img:
-                            final_expr_img = final_expr_img.resize((expression_size, expression_size), Image.LANCZOS)
-
-                            # 生成最终帧
-                            final_frames = []
-                            for frame_idx, safe_frame in enumerate(safe_frames):
-                                # 修复：检查 safe_frame 是否是列表，如果是则取第一帧
-                                if isinstance(safe_frame, list):
-                                    if safe_frame:
-                                        safe_frame = safe_frame[0]
-                                    else:
-                                        continue
-
-                                final_img = Image.new("RGB", (expression_size + safe_frame.width, safe_frame.height), (50, 50, 50))
-
-                                if frame_idx == 0:
-                                    current_expr = final_expr_img
-                                else:
-                                    eating_frame_idx = (frame_idx - 1) % len(eating_frames)
-                                    current_expr = eating_frames[eating_frame_idx]
-
-                                if current_expr.mode == 'RGBA':
-                                    final_img.paste(current_expr, (0, 0), current_expr)
-                                else:
-                                    final_img.paste(current_expr, (0, 0))
-
-                                final_img.paste(safe_frame, (expression_size, 0))
-
-                                # 应用缩放
-                                new_width = int(final_img.width * 0.7)
-                                new_height = int(final_img.height * 0.7)
-                                final_img = final_img.resize((new_width, new_height), Image.LANCZOS)
-
-                                final_frames.append(final_img)
-
-                        # 保存GIF
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        from .touchi import output_dir
-                        output_path = os.path.join(output_dir, f"safe_{timestamp}.gif")
-
-                        if final_frames:
-                            final_frames[0].save(
-                                output_path,
-                                save_all=True,
-                                append_images=final_frames[1:],
-                                duration=150,
-                                loop=0
-                            )
-                            return output_path, placed_items_new
-                        else:
-                            return None, placed_items_new
-
-                    try:
-                        safe_image_path, placed_items = await loop.run_in_executor(None, generate_with_filtered_items)
-                    except Exception as e:
-                        logger.error(f"重新生成丢包撤离事件图片时出错: {e}")
-                        # 如果重新生成失败，使用原始图片
-                        pass
-
-                # 如果路人鼠鼠事件触发且有金色物品，添加金色物品并重新生成图片
-                if golden_item_path and event_type == "passerby_mouse":
-                    # 添加金色物品到物品列表开头，使用正确的格式
-                    golden_base_name, golden_price, golden_item_name = self._split_item_filename(golden_item_path)
-                    golden_item_value = golden_price if golden_price is not None else get_item_value(golden_base_name)
-                    golden_item = {
-                        "item": {
-                            "name": golden_item_name,
-                            "path": golden_item_path,
-                            "level": "gold",
-                            "base_name": golden_base_name,
-                            "value": golden_item_value
-                        }
-                    }
-                    # 将金色物品添加到final_items开头
-                    original_placed_items = list(placed_items)
-                    final_items = [golden_item] + list(final_items or [])
-
-                    # 使用最大格子重新生成图片，创建一个特殊的生成函数
-                    def generate_with_specific_items():
-                        from .touchi import load_items, create_safe_layout, render_safe_layout_gif, get_highest_level, load_expressions
-                        from PIL import Image
-                        import os
-                        from datetime import datetime
-
-                        # 加载所有可用物品
-                        all_items = load_items()
-                        if not all_items:
-                            return None, []
-
-                        # 创建包含金色物品的特定物品列表
-                        specific_items = []
-
-                        # 添加金色物品
-                        for item in all_items:
-                            if item["base_name"] == golden_base_name and item["level"] == "gold":
-                                specific_items.append(item)
-                                break
-
-                        # 添加其他已放置的物品
-                        for placed_item in original_placed_items:
-                            item_name = placed_item["item"]["base_name"]
-                            item_level = placed_item["item"]["level"]
-                            for item in all_items:
-                                if item["base_name"] == item_name and item["level"] == item_level:
-                                    specific_items.append(item)
-                                    break
-
-                        # 使用最大格子(7x7)重新布局
-                        from .touchi import place_items
-                        placed_items_new = place_items(specific_items, 7, 7, 7)
-
-                        # 生成图片
-                        result = render_safe_layout_gif(placed_items_new, 0, 0, 7, 7, 7)
-                        if not result or not result[0]:
-                            return None, []
-
-                        # 正确接收返回值：frames 和 total_frames
-                        safe_frames, total_frames = result
-
-                        # 加载表情图片
-                        expressions = load_expressions()
-                        if not expressions:
-                            return None, []
-
-                        highest_level = get_highest_level(placed_items_new)
-                        eating_path = expressions.get("eating")
-                        expression_map = {"gold": "happy", "red": "eat"}
-                        final_expression = expression_map.get(highest_level, "cry")
-                        final_expr_path = expressions.get(final_expression)
-
-                        if not eating_path or not final_expr_path:
-                            return None, []
-
-                        # 生成最终图片
-                        expression_size = 7 * 100  # 7x7格子
-
-                        # 加载eating.gif帧
-                        eating_frames = []
-                        with Image.open(eating_path) as eating_gif:
-                            for frame_idx in range(eating_gif.n_frames):
-                                eating_gif.seek(frame_idx)
-                                eating_frame = eating_gif.convert("RGBA")
-                                eating_frame = eating_frame.resize((expression_size, expression_size), Image.LANCZOS)
-                                eating_frames.append(eating_frame.copy())
-
-                        # 加载最终表情
-                        with Image.open(final_expr_path).convert("RGBA") as final_expr_img:
-                            final_expr_img = final_expr_img.resize((expression_size, expression_size), Image.LANCZOS)
-
-                            # 生成最终帧
-                            final_frames = []
-                            for frame_idx, safe_frame in enumerate(safe_frames):
-                                # 修复：检查 safe_frame 是否是列表，如果是则取第一帧
-                                if isinstance(safe_frame, list):
-                                    if safe_frame:
-                                        safe_frame = safe_frame[0]
-                                    else:
-                                        continue
-
-                                final_img = Image.new("RGB", (expression_size + safe_frame.width, safe_frame.height), (50, 50, 50))
-
-                                if frame_idx == 0:
-                                    current_expr = final_expr_img
-                                else:
-                                    eating_frame_idx = (frame_idx - 1) % len(eating_frames)
-                                    current_expr = eating_frames[eating_frame_idx]
-
-                                if current_expr.mode == 'RGBA':
-                                    final_img.paste(current_expr, (0, 0), current_expr)
-                                else:
-                                    final_img.paste(current_expr, (0, 0))
-
-                                final_img.paste(safe_frame, (expression_size, 0))
-
-                                # 应用缩放
-                                new_width = int(final_img.width * 0.7)
-                                new_height = int(final_img.height * 0.7)
-                                final_img = final_img.resize((new_width, new_height), Image.LANCZOS)
-
-                                final_frames.append(final_img)
-
-                        # 保存GIF
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        from .touchi import output_dir
-                        output_path = os.path.join(output_dir, f"safe_{timestamp}.gif")
-
-                        if final_frames:
-                            final_frames[0].save(
-                                output_path,
-                                save_all=True,
-                                append_images=final_frames[1:],
-                                duration=150,
-                                loop=0
-                            )
-                            return output_path, placed_items_new
-                        else:
-                            return None, placed_items_new
-
-                    try:
-                        safe_image_path, placed_items = await loop.run_in_executor(None, generate_with_specific_items)
-                    except Exception as e:
-                        logger.error(f"重新生成路人鼠鼠事件图片时出错: {e}")
-                        # 如果重新生成失败，使用原始图片
-                        pass
-
-                    # 重新计算总价值（包含金色物品）
-                    final_value = 0
-                    for item in final_items:
-                        if "item" in item:
-                            # 标准格式的物品
-                            item_data = item["item"]
-                            item_name = os.path.splitext(os.path.basename(item_data["path"]))[0]
-                            item_value = item_data.get("value", get_item_value(item_name))
-                        else:
-                            # 兼容旧格式
-                            item_name = os.path.splitext(os.path.basename(item.get("image_path", item.get("path", ""))))[0]
-                            item_value = item.get("value", get_item_value(item_name))
-                        final_value += item_value
+                # 系统补偿局、丢包撤离和路人鼠鼠在渲染前已经改写了保险箱，不需要重新生成图片
 
                 # Persist the event outcome exactly once.
                 settled_value = final_value
                 chixiao_loot_value = 0
                 chixiao_reward_value = 0
                 if event_type == "genius_fine":
-                    await self.add_items_to_collection_without_value_update(user_id, final_items)
+                    await self.add_items_to_collection_without_value_update(user_id, final_items, settlement=settlement)
                 elif event_type == "genius_kick":
                     pass
                 elif event_type == "chixiao_battle":
                     chixiao_reward_value = final_value
                     if chixiao_reward_value > 0:
                         chixiao_loot_value = total_value
-                        await self.add_items_to_collection(user_id, placed_items)
-                        await self._add_warehouse_value(user_id, chixiao_reward_value)
+                        await self.add_items_to_collection(user_id, placed_items, settlement=settlement)
+                        await self._add_warehouse_value(user_id, chixiao_reward_value, settlement=settlement)
                     settled_value = chixiao_loot_value + chixiao_reward_value
                 else:
-                    await self.add_items_to_collection(user_id, final_items)
-
-                if cooldown_multiplier and cooldown_multiplier != 1.0:
-                    self.next_touchi_wait_multipliers[user_id] = cooldown_multiplier
-                    # Store the multiplier for the next safe-box wait.
+                    await self.add_items_to_collection(user_id, final_items, settlement=settlement)
 
                 # 构建基础消息
                 message = "鼠鼠偷吃到了" if not menggong_mode else "鼠鼠猛攻获得了"
@@ -927,26 +760,7 @@ class TouchiTools:
                     zhou_message = "\n\n🎮 特殊事件触发！洲了个洲游戏开始！\n💰 游戏获胜可获得100万哈夫币奖励！\n📝 使用 '洲了个洲' 指令开始游戏"
 
                     # 记录触发事件到数据库（用于后续奖励发放）
-                    try:
-                        async with aiosqlite.connect(self.db_path) as db:
-                            # 创建洲游戏触发记录表（如果不存在）
-                            await db.execute("""
-                                CREATE TABLE IF NOT EXISTS zhou_trigger_events (
-                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                    user_id TEXT NOT NULL,
-                                    trigger_time INTEGER NOT NULL,
-                                    reward_claimed INTEGER DEFAULT 0
-                                )
-                            """)
-
-                            # 记录触发事件
-                            await db.execute(
-                                "INSERT INTO zhou_trigger_events (user_id, trigger_time) VALUES (?, ?)",
-                                (user_id, int(time.time()))
-                            )
-                            await db.commit()
-                    except Exception as e:
-                        logger.error(f"记录洲游戏触发事件时出错: {e}")
+                    self._queue_zhou_trigger(settlement, user_id)
 
                 # 构建最终消息
                 final_message = base_message
@@ -961,10 +775,17 @@ class TouchiTools:
                 if zhou_triggered:
                     final_message += zhou_message
 
+                # 物品、仓库价值、事件和触发记录在一个事务中提交
+                await settlement.commit()
+
+                # 结算成功后再记录下次偷吃的冷却倍率
+                if cooldown_multiplier and cooldown_multiplier != 1.0:
+                    self.next_touchi_wait_multipliers[user_id] = cooldown_multiplier
+
                 return {
                     'success': True,
                     'message': final_message,
-                    'image_path': safe_image_path if safe_image_path and os.path.exists(safe_image_path) else None,
+                    'image_handle': artifact_store.put(prepared["data"], prepared["extension"]),
                     'combined': True,
                     'zhou_triggered': zhou_triggered,
                     'has_event': event_triggered  # 标记是否有事件触发
@@ -975,33 +796,19 @@ class TouchiTools:
                final_message = f"{prefix}\n总价值: {final_value:,}"
 
                # 🔧 修复：确保无事件时也更新仓库价值
-               await self.add_items_to_collection(user_id, placed_items)
+               await self.add_items_to_collection(user_id, placed_items, settlement=settlement)
 
                # 洲了个洲彩蛋（2%概率）
                if random.random() < 0.02:
                    final_message += "\n\n🎮 特殊事件触发！洲了个洲游戏开始！\n💰 游戏获胜可获得100万哈夫币奖励！\n📝 使用 '洲了个洲' 指令开始游戏"
-                   try:
-                       async with aiosqlite.connect(self.db_path) as db:
-                           await db.execute("""
-                               CREATE TABLE IF NOT EXISTS zhou_trigger_events (
-                                   id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                   user_id TEXT NOT NULL,
-                                   trigger_time INTEGER NOT NULL,
-                                   reward_claimed INTEGER DEFAULT 0
-                               )
-                           """)
-                           await db.execute(
-                               "INSERT INTO zhou_trigger_events (user_id, trigger_time) VALUES (?, ?)",
-                               (user_id, int(time.time()))
-                           )
-                           await db.commit()
-                   except Exception as e:
-                       logger.error(f"记录洲游戏触发事件时出错: {e}")
+                   self._queue_zhou_trigger(settlement, user_id)
+
+               await settlement.commit()
 
                return {
                    'success': True,
                    'message': final_message,
-                   'image_path': safe_image_path if safe_image_path and os.path.exists(safe_image_path) else None,
+                   'image_handle': artifact_store.put(prepared["data"], prepared["extension"]),
                    'has_event': False
                }, None
 
@@ -1010,9 +817,30 @@ class TouchiTools:
             return {
                 'success': False,
                 'message': "🎁打开时出了点问题！",
-                'image_path': None,
+                'image_handle': None,
                 'has_event': False
             }, None
+        finally:
+            # 出错或提前返回时回滚没有提交的结算并释放写连接
+            if settlement is not None:
+                await settlement.close()
+
+    @staticmethod
+    def _queue_zhou_trigger(settlement, user_id):
+        """把洲了个洲触发记录加入结算（用于游戏获胜后发放奖励）"""
+        # 创建洲游戏触发记录表（如果不存在）
+        settlement.add("""
+            CREATE TABLE IF NOT EXISTS zhou_trigger_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                trigger_time INTEGER NOT NULL,
+                reward_claimed INTEGER DEFAULT 0
+            )
+        """)
+        settlement.add(
+            "INSERT INTO zhou_trigger_events (user_id, trigger_time) VALUES (?, ?)",
+            (user_id, int(time.time()))
+        )
 
     async def menggong_attack(self, event, custom_duration=None):
         """六套猛攻功能"""
@@ -1049,7 +877,7 @@ class TouchiTools:
             duration_seconds = int(base_duration * time_multiplier)
             menggong_end_time = current_time + duration_seconds
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute(
                     "UPDATE user_economy SET warehouse_value = warehouse_value - 3000000, menggong_active = 1, menggong_end_time = ? WHERE user_id = ?",
                     (menggong_end_time, user_id)
@@ -1066,7 +894,7 @@ class TouchiTools:
             base_message = f"🔥 六套猛攻激活！{duration_text}内提高红色和金色物品概率，不出现蓝色物品！\n消耗哈夫币: 3,000,000"
 
             # 发送猛攻激活专用gif图片
-            menggongzhong_image_path = os.path.join(self.biaoqing_dir, "menggongzhong.gif")
+            menggongzhong_image_path = resolve_asset_path(os.path.join(self.biaoqing_dir, "menggongzhong.gif"))
             if os.path.exists(menggongzhong_image_path):
                 chain = [
                     Plain(base_message),
@@ -1087,7 +915,7 @@ class TouchiTools:
         """延迟关闭猛攻状态"""
         try:
             await asyncio.sleep(delay)
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute(
                     "UPDATE user_economy SET menggong_active = 0, menggong_end_time = 0 WHERE user_id = ?",
                     (user_id,)
@@ -1104,7 +932,7 @@ class TouchiTools:
             duration_seconds = duration_minutes * 60
             menggong_end_time = current_time + duration_seconds
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 # 获取所有用户ID
                 cursor = await db.execute("SELECT user_id FROM user_economy")
                 user_ids = await cursor.fetchall()
@@ -1134,7 +962,7 @@ class TouchiTools:
     async def set_menggong_time_multiplier(self, multiplier):
         """设置六套时间倍率（管理员功能）"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 # 更新系统配置中的时间倍率
                 await db.execute(
                     "INSERT OR REPLACE INTO system_config (config_key, config_value) VALUES ('menggong_time_multiplier', ?)",
@@ -1151,7 +979,7 @@ class TouchiTools:
     async def get_menggong_time_multiplier(self):
         """获取当前六套时间倍率"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 cursor = await db.execute(
                     "SELECT config_value FROM system_config WHERE config_key = 'menggong_time_multiplier'"
                 )
@@ -1197,7 +1025,7 @@ class TouchiTools:
                             refund_amount += upgrade_costs[current_level + i]
 
                     # 修复数据并退回哈夫币
-                    async with aiosqlite.connect(self.db_path) as db:
+                    async with self.db.write() as db:
                         await db.execute(
                             "UPDATE user_economy SET warehouse_value = warehouse_value + ?, grid_size = ? WHERE user_id = ?",
                             (refund_amount, expected_grid_size, user_id)
@@ -1213,7 +1041,7 @@ class TouchiTools:
                     return
                 else:
                     # 如果当前格子大小小于预期，直接修复到正确大小
-                    async with aiosqlite.connect(self.db_path) as db:
+                    async with self.db.write() as db:
                         await db.execute(
                             "UPDATE user_economy SET grid_size = ? WHERE user_id = ?",
                             (expected_grid_size, user_id)
@@ -1260,7 +1088,7 @@ class TouchiTools:
                 )
                 return
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute(
                     "UPDATE user_economy SET warehouse_value = warehouse_value - ?, teqin_level = ?, grid_size = ? WHERE user_id = ?",
                     (upgrade_cost, new_level, new_grid_size, user_id)
@@ -1342,7 +1170,7 @@ class TouchiTools:
             # 获取群成员昵称映射
             nickname_map = await self._get_group_member_nicknames(event, group_id)
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 # 图鉴数量榜
                 cursor = await db.execute("""
                     SELECT user_id, COUNT(*) as item_count
@@ -1363,21 +1191,21 @@ class TouchiTools:
                 """)
                 warehouse_top = await cursor.fetchall()
 
-                # 构建排行榜消息
-                message = "🏆 鼠鼠榜 🏆\n\n"
+            # 构建排行榜消息
+            message = "🏆 鼠鼠榜 🏆\n\n"
 
-                # 图鉴数量榜
-                message += "📚 图鉴数量榜 TOP5:\n"
-                for i, (user_id, count) in enumerate(collection_top, 1):
-                    nickname = nickname_map.get(user_id, f"用户{user_id[:6]}")
-                    message += f"{i}. {nickname} - {count}个物品\n"
+            # 图鉴数量榜
+            message += "📚 图鉴数量榜 TOP5:\n"
+            for i, (user_id, count) in enumerate(collection_top, 1):
+                nickname = nickname_map.get(user_id, f"用户{user_id[:6]}")
+                message += f"{i}. {nickname} - {count}个物品\n"
 
-                message += "\n💰 仓库价值榜 TOP5:\n"
-                for i, (user_id, value) in enumerate(warehouse_top, 1):
-                    nickname = nickname_map.get(user_id, f"用户{user_id[:6]}")
-                    message += f"{i}. {nickname} - {value}哈夫币\n"
+            message += "\n💰 仓库价值榜 TOP5:\n"
+            for i, (user_id, value) in enumerate(warehouse_top, 1):
+                nickname = nickname_map.get(user_id, f"用户{user_id[:6]}")
+                message += f"{i}. {nickname} - {value}哈夫币\n"
 
-                yield event.plain_result(message)
+            yield event.plain_result(message)
 
         except Exception as e:
             logger.error(f"获取排行榜时出错: {str(e)}")
@@ -1411,7 +1239,7 @@ class TouchiTools:
 
             # 开启自动偷吃
             current_time = int(time.time())
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute(
                     "UPDATE user_economy SET auto_touchi_active = 1, auto_touchi_start_time = ? WHERE user_id = ?",
                     (current_time, user_id)
@@ -1476,7 +1304,7 @@ class TouchiTools:
                     task.cancel()
 
             # 更新数据库状态
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute(
                     "UPDATE user_economy SET auto_touchi_active = 0, auto_touchi_start_time = 0 WHERE user_id = ?",
                     (user_id,)
@@ -1518,6 +1346,7 @@ class TouchiTools:
             max_duration = 4 * 3600  # 4小时 = 14400秒 - 🔧 修复：应该是3600而不是3600
             base_interval = 600  # 基础间隔10分钟 = 600秒
             interval = base_interval / self.multiplier  # 应用冷却倍率
+            pending_layouts = {}  # 本轮自动偷吃预先批量抽取的保险箱
 
             while True:
                 # 检查是否超过4小时
@@ -1535,8 +1364,9 @@ class TouchiTools:
                 if not economy_data or not economy_data["auto_touchi_active"]:
                     break
 
-                # 执行自动偷吃
-                await self._perform_auto_touchi(user_id, economy_data)
+                # 执行自动偷吃（剩余时间内的保险箱一次抽取）
+                remaining = math.ceil((max_duration - (time.time() - start_time)) / interval)
+                await self._perform_auto_touchi(user_id, economy_data, pending_layouts, max(1, remaining))
 
         except asyncio.CancelledError:
             logger.info(f"用户 {user_id} 的自动偷吃任务被取消")
@@ -1555,10 +1385,15 @@ class TouchiTools:
         except Exception as e:
             logger.error(f"Failed to send auto touchi summary: {e}")
 
-    async def _perform_auto_touchi(self, user_id, economy_data):
-        """执行一次自动偷吃"""
+    async def _perform_auto_touchi(self, user_id, economy_data, pending_layouts=None, batch_size=1):
+        """
+        执行一次自动偷吃
+
+        pending_layouts 保存同一轮自动偷吃批量抽取的保险箱（按猛攻状态和格子大小区分），
+        用完或状态变化时再按 batch_size 一次抽取多个。
+        """
         try:
-            from .touchi import load_items, create_safe_layout
+            from .touchi import load_items, create_safe_layouts
 
             # 加载物品
             items = load_items()
@@ -1571,8 +1406,19 @@ class TouchiTools:
 
             # 创建保险箱布局（自动模式下概率调整）
             # 自动偷吃不使用自定义概率，使用默认概率
-            placed_items, _, _, _, _ = create_safe_layout(items, menggong_mode, economy_data["grid_size"], auto_mode=True, time_multiplier=1.0,
-                                                            custom_normal_rates=None, custom_menggong_rates=None)
+            key = (bool(menggong_mode), economy_data["grid_size"])
+            if pending_layouts is None:
+                pending_layouts = {}
+            if not pending_layouts.get(key):
+                # 猛攻状态或格子大小变化后，之前抽取的保险箱作废
+                pending_layouts.clear()
+                pending_layouts[key] = [
+                    layout[0] for layout in create_safe_layouts(
+                        items, batch_size, menggong_mode, economy_data["grid_size"], auto_mode=True,
+                        time_multiplier=1.0, custom_normal_rates=None, custom_menggong_rates=None
+                    )
+                ]
+            placed_items = pending_layouts[key].pop()
 
             if placed_items:
                 # 记录到数据库
@@ -1580,12 +1426,7 @@ class TouchiTools:
 
                 # 统计红色物品
                 red_items = [item for item in placed_items if item["item"]["level"] == "red"]
-                total_value = sum(
-                    item["item"].get("value", get_item_value(
-                        os.path.splitext(os.path.basename(item["item"]["path"]))[0]
-                    ))
-                    for item in placed_items
-                )
+                total_value = get_items_value(placed_items)
                 if user_id in self.auto_touchi_data:
                     auto_stats = self.auto_touchi_data[user_id]
                     auto_stats["red_items_count"] = auto_stats.get("red_items_count", 0) + len(red_items)
@@ -1607,7 +1448,7 @@ class TouchiTools:
             else:
                 grid_size = 2 + level  # 1级=3x3, 2级=4x4, 3级=5x5, 4级=6x6, 5级=7x7
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 # 更新系统配置
                 await db.execute(
                     "UPDATE system_config SET config_value = ? WHERE config_key = 'base_teqin_level'",
@@ -1637,56 +1478,53 @@ class TouchiTools:
         user_id = event.get_sender_id()
 
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # 获取用户最后一次偷吃的物品记录
-                cursor = await db.execute(
-                    "SELECT items_json, jianshi_index FROM user_last_touchi WHERE user_id = ?",
-                    (user_id,)
-                )
-                result = await cursor.fetchone()
+            # 获取用户最后一次偷吃的物品记录
+            result = await self.db.fetchone(
+                "SELECT items_json, jianshi_index FROM user_last_touchi WHERE user_id = ?",
+                (user_id,)
+            )
 
-                if not result:
-                    yield event.plain_result("🐭 你还没有偷吃过任何物品，无法检视")
-                    return
+            if not result:
+                yield event.plain_result("🐭 你还没有偷吃过任何物品，无法检视")
+                return
 
-                items_json, current_index = result
-                import json
-                items_list = json.loads(items_json)
+            items_json, current_index = result
+            import json
+            items_list = json.loads(items_json)
 
-                if not items_list:
-                    yield event.plain_result("🐭 没有可检视的物品或检视资源没有完整下载")
-                    return
+            if not items_list:
+                yield event.plain_result("🐭 没有可检视的物品或检视资源没有完整下载")
+                return
 
-                # 筛选出有对应检视gif的物品
-                jianshi_items = []
-                for item in items_list:
-                    unique_id = item['unique_id']
-                    gif_path = os.path.join(self.jianshi_dir, f"{unique_id}.gif")
-                    if os.path.exists(gif_path):
-                        jianshi_items.append({
-                            'item_name': item['item_name'],
-                            'unique_id': unique_id,
-                            'item_level': item['item_level'],
-                            'gif_path': gif_path
-                        })
-
-                if not jianshi_items:
-                    yield event.plain_result("🐭 最后一次偷吃的物品中没有可检视的物品，或检查检视资源是否完整下载")
-                    return
+            # 筛选出有对应检视gif的物品
+            jianshi_items = []
+            for item in items_list:
+                unique_id = item['unique_id']
+                gif_path = os.path.join(self.jianshi_dir, f"{unique_id}.gif")
+                if os.path.exists(gif_path):
+                    jianshi_items.append({
+                        'item_name': item['item_name'],
+                        'unique_id': unique_id,
+                        'item_level': item['item_level'],
+                        'gif_path': gif_path
+                    })
+
+            if not jianshi_items:
+                yield event.plain_result("🐭 最后一次偷吃的物品中没有可检视的物品，或检查检视资源是否完整下载")
+                return
 
-                # 获取当前要检视的物品（按顺序轮流）
-                item_to_show = jianshi_items[current_index % len(jianshi_items)]
+            # 获取当前要检视的物品（按顺序轮流）
+            item_to_show = jianshi_items[current_index % len(jianshi_items)]
 
-                # 更新检视索引，准备下次检视
-                next_index = (current_index + 1) % len(jianshi_items)
-                await db.execute(
-                    "UPDATE user_last_touchi SET jianshi_index = ? WHERE user_id = ?",
-                    (next_index, user_id)
-                )
-                await db.commit()
+            # 更新检视索引，准备下次检视
+            next_index = (current_index + 1) % len(jianshi_items)
+            await self.db.execute(
+                "UPDATE user_last_touchi SET jianshi_index = ? WHERE user_id = ?",
+                (next_index, user_id)
+            )
 
-                # 发送检视gif（仅发送gif，不附带文字）
-                yield event.image_result(item_to_show['gif_path'])
+            # 发送检视gif（仅发送gif，不附带文字）
+            yield event.image_result(item_to_show['gif_path'])
 
         except Exception as e:
             logger.error(f"检视物品时出错: {e}")
@@ -1,16 +1,16 @@
 import os
-import random
 import math
 import aiosqlite
-from PIL import Image, ImageDraw, ImageFont
-from datetime import datetime
+from PIL import Image, ImageDraw
 from astrbot.api import logger
+from .item_catalog import get_catalog
+from .sprite_cache import get_sprite
+from .output_spool import output_spool
+from .database import get_database
 
 # 定义路径
 script_dir = os.path.dirname(os.path.abspath(__file__))
 items_dir = os.path.join(script_dir, "items")
-output_dir = os.path.join(script_dir, "output")
-os.makedirs(output_dir, exist_ok=True)
 
 # 定义颜色常量
 BACKGROUND_COLOR = (40, 40, 45)  # 深灰背景色
@@ -49,78 +49,61 @@ def get_size(size_str):
 
 def place_items(items):
     """
-    计算所需网格大小并放置物品
+    使用天际线（skyline）算法一次性放置物品，支持旋转
     返回: (放置的物品列表, 网格宽度, 网格高度)
     """
-    # 计算总占用面积
+    if not items:
+        return [], 0, 0
+
+    # 计算总占用面积，宽度取接近正方形的值，且能放下最宽物品的较短边
     total_area = sum(item["grid_width"] * item["grid_height"] for item in items)
-    
-    # 计算初始网格大小 (正方形)
-    grid_size = max(5, math.ceil(math.sqrt(total_area * 1.5)))
-    
-    # 尝试放置物品，如果放不下则增加网格大小
-    while True:
-        grid = [[0] * grid_size for _ in range(grid_size)]
-        placed = []
-        
-        # 按等级优先级从高到低排序，相同等级再按面积从大到小排序
-        sorted_items = sorted(
-            items,
-            key=lambda x: (LEVEL_PRIORITY.get(x["level"], 0), x["grid_width"] * x["grid_height"]),
-            reverse=True
-        )
-        
-        # 尝试放置每个物品
-        for item in sorted_items:
-            orientations = [(item["grid_width"], item["grid_height"], False)]
-            if item["grid_width"] != item["grid_height"]:
-                orientations.append((item["grid_height"], item["grid_width"], True))
-            
-            placed_successfully = False
-            
-            # 尝试每个方向
-            for width, height, rotated in orientations:
-                if placed_successfully:
-                    break
-                    
-                # 按顺序遍历网格位置
-                for y in range(grid_size - height + 1):
-                    if placed_successfully:
-                        break
-                    for x in range(grid_size - width + 1):
-                        # 检查位置是否可用
-                        can_place = True
-                        for i in range(height):
-                            for j in range(width):
-                                if grid[y+i][x+j] != 0:
-                                    can_place = False
-                                    break
-                            if not can_place:
-                                break
-                        
-                        # 如果位置可用，放置物品
-                        if can_place:
-                            for i in range(height):
-                                for j in range(width):
-                                    grid[y+i][x+j] = 1
-                            
-                            placed.append({
-                                "item": item,
-                                "x": x,
-                                "y": y,
-                                "width": width,
-                                "height": height,
-                                "rotated": rotated
-                            })
-                            placed_successfully = True
-                            break
-        
-        # 检查是否所有物品都已放置
-        if len(placed) == len(items):
-            return placed, grid_size, grid_size
-        
-        # 如果放不下，增加网格大小
-        grid_size += 1
+    grid_width = max(
+        5,
+        math.ceil(math.sqrt(total_area * 1.2)),
+        max(min(item["grid_width"], item["grid_height"]) for item in items)
+    )
+
+    # 每一列当前的高度
+    skyline = [0] * grid_width
+    placed = []
+
+    # 按等级优先级从高到低排序，相同等级再按面积从大到小排序
+    sorted_items = sorted(
+        items,
+        key=lambda x: (LEVEL_PRIORITY.get(x["level"], 0), x["grid_width"] * x["grid_height"]),
+        reverse=True
+    )
+
+    for item in sorted_items:
+        orientations = [(item["grid_width"], item["grid_height"], False)]
+        if item["grid_width"] != item["grid_height"]:
+            orientations.append((item["grid_height"], item["grid_width"], True))
+
+        # 选择放置后顶部最低的位置，其次靠下、靠左
+        best = None
+        for width, height, rotated in orientations:
+            if width > grid_width:
+                continue
+            for x in range(grid_width - width + 1):
+                y = max(skyline[x:x + width])
+                score = (y + height, y, x)
+                if best is None or score < best[0]:
+                    best = (score, x, y, width, height, rotated)
+
+        _, x, y, width, height, rotated = best
+        for col in range(x, x + width):
+            skyline[col] = y + height
+
+        placed.append({
+            "item": item,
+            "x": x,
+            "y": y,
+            "width": width,
+            "height": height,
+            "rotated": rotated
+        })
+
+    return placed, grid_width, max(skyline)
 
 def render_tujian_image(placed_items, grid_width, grid_height, cell_size=100):
     # 计算图片大小 (移除文字区域后减小高度)
@@ -168,19 +151,15 @@ def render_tujian_image(placed_items, grid_width, grid_height, cell_size=100):
         
         # 添加物品图片
         try:
-            with Image.open(item["path"]).convert("RGBA") as item_img:
-                if placed["rotated"]:
-                    item_img = item_img.rotate(90, expand=True)
-                
-                # 缩放图片以适应格子
-                max_width = placed["width"] * cell_size - 20
-                max_height = placed["height"] * cell_size - 20
-                item_img.thumbnail((max_width, max_height), Image.LANCZOS)
-                
-                # 居中放置图片
-                paste_x = x0 + (placed["width"] * cell_size - item_img.width) // 2
-                paste_y = y0 + (placed["height"] * cell_size - item_img.height) // 2
-                tujian_img.paste(item_img, (paste_x, paste_y), item_img)
+            # 缩放图片以适应格子
+            max_width = placed["width"] * cell_size - 20
+            max_height = placed["height"] * cell_size - 20
+            item_img = get_sprite(item["path"], (max_width, max_height), placed["rotated"])
+            
+            # 居中放置图片
+            paste_x = x0 + (placed["width"] * cell_size - item_img.width) // 2
+            paste_y = y0 + (placed["height"] * cell_size - item_img.height) // 2
+            tujian_img.paste(item_img, (paste_x, paste_y), item_img)
         except Exception as e:
             logger.error(f"图鉴渲染：无法加载物品图片 {item['path']}, 错误: {e}")
             
@@ -202,66 +181,7 @@ def render_tujian_image(placed_items, grid_width, grid_height, cell_size=100):
 class TujianTools:
     def __init__(self, db_path):
         self.db_path = db_path
-        self.all_items = self._load_all_item_definitions()
-
-    def _load_all_item_definitions(self):
-        items = []
-        valid_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.bmp']
-        
-        # 定义要扫描的文件夹列表
-        directories_to_scan = [items_dir]
-        
-        # 添加 xinwuzi 文件夹到扫描列表
-        xinwuzi_dir = os.path.join(script_dir, "xinwuzi")
-        if os.path.exists(xinwuzi_dir):
-            directories_to_scan.append(xinwuzi_dir)
-        else:
-            logger.warning("图鉴工具：xinwuzi 文件夹不存在，只加载 items 文件夹的物资")
-        
-        # 扫描所有指定文件夹
-        for scan_dir in directories_to_scan:
-            if not os.path.exists(scan_dir):
-                logger.error(f"图鉴工具：文件夹 {scan_dir} 不存在！")
-                continue
-                
-            for filename in os.listdir(scan_dir):
-                file_path = os.path.join(scan_dir, filename)
-                if os.path.isfile(file_path) and any(filename.lower().endswith(ext) for ext in valid_extensions):
-                    item_name = os.path.splitext(filename)[0]
-                    parts = item_name.split('_')
-                    
-                    # 判断是否为新物资格式（等级_大小_名称_价格）
-                    if len(parts) >= 4 and parts[-1].isdigit():
-                        # 新物资格式：等级_大小_名称_价格
-                        level = parts[0].lower()
-                        size_str = parts[1]
-                        # 物品名称为除了等级、大小和价格之外的部分
-                        name_parts = parts[2:-1]
-                        # 构建基础名称（用于与数据库记录匹配）
-                        base_name = f"{level}_{size_str}_{'_'.join(name_parts)}"
-                    else:
-                        # 原有格式：等级_大小_名称
-                        if len(parts) >= 2:
-                            level = parts[0].lower()
-                            size_str = parts[1]
-                        else:
-                            level = "purple"
-                            size_str = "1x1"
-                        base_name = item_name
-                    
-                    width, height = get_size(size_str)
-                    items.append({
-                        "path": file_path,
-                        "name": item_name,
-                        "base_name": base_name,  # 添加基础名称用于匹配
-                        "level": level,
-                        "size": size_str,
-                        "grid_width": width,
-                        "grid_height": height
-                    })
-        
-        logger.info(f"图鉴工具：成功加载 {len(items)} 个物资定义（来自 {len(directories_to_scan)} 个文件夹）")
-        return items
+        self.db = get_database(db_path)
 
     async def generate_tujian(self, user_id: str):
         if not self.db_path:
@@ -269,7 +189,7 @@ class TujianTools:
         
         records = []
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.read() as db:
                 db.row_factory = aiosqlite.Row
                 async with db.execute(
                     "SELECT DISTINCT item_name FROM user_touchi_collection WHERE user_id = ?",
@@ -285,38 +205,22 @@ class TujianTools:
 
         user_item_names = {rec[0] for rec in records}
         
-        # 只加载金色和红色的物品，支持多种匹配方式
-        user_items_to_render = []
-        for item in self.all_items:
-            if item["level"] not in DISPLAY_LEVELS:
-                continue
-                
-            # 尝试多种匹配方式
-            match_found = False
-            
-            # 方式1：直接匹配完整名称
-            if item["name"] in user_item_names:
-                match_found = True
-            # 方式2：匹配基础名称（处理xinwuzi格式）
-            elif item.get("base_name", item["name"]) in user_item_names:
-                match_found = True
-            # 方式3：反向匹配（数据库中的名称是否匹配当前物品的任意名称）
-            else:
-                for db_item_name in user_item_names:
-                    # 检查数据库中的名称是否是当前物品的基础名称
-                    if db_item_name == item.get("base_name", item["name"]):
-                        match_found = True
-                        break
-                    # 检查是否为xinwuzi格式的物资（去掉价格部分）
-                    db_parts = db_item_name.split('_')
-                    if len(db_parts) >= 4 and db_parts[-1].isdigit():
-                        db_base_name = '_'.join(db_parts[:-1])  # 去掉价格部分
-                        if db_base_name == item.get("base_name", item["name"]):
-                            match_found = True
-                            break
-            
-            if match_found:
-                user_items_to_render.append(item)
+        # 只加载金色和红色的物品，通过物资目录索引匹配数据库记录
+        catalog = get_catalog()
+        matched = {}
+        for db_item_name in user_item_names:
+            # 数据库中可能是完整文件名，也可能是基础名称
+            item = catalog.get(db_item_name)
+            if item is None:
+                # 检查是否为xinwuzi格式的物资（去掉价格部分）
+                db_parts = db_item_name.split('_')
+                if len(db_parts) >= 4 and db_parts[-1].isdigit():
+                    item = catalog.get('_'.join(db_parts[:-1]))
+            if item is not None and item["level"] in DISPLAY_LEVELS:
+                matched[item["path"]] = item
+
+        # 保持物资目录中的顺序
+        user_items_to_render = [item for item in catalog.items if item["path"] in matched]
         
         logger.info(f"用户 {user_id} 的图鉴：找到 {len(user_items_to_render)} 个匹配的物资（从 {len(user_item_names)} 个数据库记录中）")
 
@@ -332,9 +236,8 @@ class TujianTools:
         # 渲染图鉴图片
         tujian_image = render_tujian_image(placed_items, grid_width, grid_height, cell_size=100)
 
-        # 保存图片
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_path = os.path.join(output_dir, f"tujian_{user_id}_{timestamp}.png")
+        # 保存图片（发送后由调用方 release，旧文件由输出目录的后台任务清理）
+        output_path = output_spool.allocate(f"tujian_{user_id}", ".png")
         tujian_image.save(output_path)
         
         logger.info(f"成功为用户 {user_id} 生成图鉴: {output_path}")
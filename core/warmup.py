@@ -0,0 +1,52 @@
+import asyncio
+import time
+from astrbot.api import logger
+
+
+class PluginWarmup:
+    """插件预热：注册完成后在后台加载物资目录、预加载图片并检查数据库表结构"""
+
+    def __init__(self):
+        self._steps = []
+        self._ready = None
+        self._task = None
+
+    def add_step(self, name, func):
+        """添加预热步骤，func 可以是协程函数，也可以是普通函数（放到线程池执行）"""
+        self._steps.append((name, func))
+
+    def start(self):
+        """启动后台预热任务，不阻塞插件加载"""
+        loop = asyncio.get_running_loop()
+        self._ready = loop.create_future()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def _run_step(self, name, func):
+        start = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func()
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, func)
+            logger.info(f"偷吃插件预热完成: {name}，耗时 {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"偷吃插件预热步骤 {name} 出错: {e}")
+
+    async def _run(self):
+        try:
+            await asyncio.gather(*(self._run_step(name, func) for name, func in self._steps))
+        finally:
+            if not self._ready.done():
+                self._ready.set_result(True)
+
+    @property
+    def is_ready(self):
+        return self._ready is not None and self._ready.done()
+
+    async def wait(self):
+        """命令在预热完成前到达时等待预热结束，之后直接返回"""
+        if self._ready is None or self._ready.done():
+            return
+        await asyncio.shield(self._ready)
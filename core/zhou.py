@@ -1,17 +1,21 @@
 import random
 import os
 import asyncio
-import aiosqlite
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime
 import json
 import math
+from .item_catalog import get_catalog
+from .sprite_cache import get_sprite
+from .output_spool import output_spool
+from .database import get_database
 
 class ZhouGame:
     """洲了个洲游戏类 - 基于羊了个羊的正确游戏规则"""
     
     def __init__(self, db_path, items_dir, output_dir):
         self.db_path = db_path
+        self.db = get_database(db_path)
         self.items_dir = items_dir
         self.output_dir = output_dir
         
@@ -51,7 +55,7 @@ class ZhouGame:
         
     async def init_game_tables(self):
         """初始化游戏数据库表"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.write() as db:
             # 群组游戏状态表
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS zhou_group_games (
@@ -92,11 +96,11 @@ class ZhouGame:
         """获取可用的物品图片 - 只选择1x1, 2x2, 3x3的物品"""
         items = []
         valid_sizes = ['1x1', '2x2', '3x3']
-        for filename in os.listdir(self.items_dir):
-            if filename.endswith('.png'):
-                # 检查文件名是否包含有效尺寸
-                if any(size in filename for size in valid_sizes):
-                    items.append(filename)
+        items_dir = os.path.abspath(self.items_dir)
+        for item in get_catalog().get_by_sizes(valid_sizes):
+            # 只使用本游戏物品目录中的png图片
+            if os.path.dirname(item["path"]) == items_dir and item["path"].endswith('.png'):
+                items.append(os.path.basename(item["path"]))
         return items
     
     def generate_layered_cards(self, difficulty=None):
@@ -575,7 +579,7 @@ class ZhouGame:
     
     async def save_game_state(self, user_id, game_state):
         """保存游戏状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.write() as db:
             game_data = json.dumps(game_state, ensure_ascii=False)
             await db.execute(
                 "INSERT OR REPLACE INTO zhou_games (user_id, game_data, updated_at) VALUES (?, ?, ?)",
@@ -585,7 +589,7 @@ class ZhouGame:
     
     async def load_game_state(self, user_id):
         """加载游戏状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.read() as db:
             cursor = await db.execute(
                 "SELECT game_data FROM zhou_games WHERE user_id = ?",
                 (user_id,)
@@ -657,7 +661,7 @@ class ZhouGame:
                 game_state['status'] = 'won'
                 await self.update_stats(user_id, True, game_state['score'])
                 # 发放哈夫币奖励
-                async with aiosqlite.connect(self.db_path) as db:
+                async with self.db.write() as db:
                     await self._check_and_reward_trigger_event(user_id, db, game_state)
             elif len(game_state['slot']) >= slot_size:
                 # 检查是否还有可消除的组合
@@ -837,39 +841,9 @@ class ZhouGame:
             print(f"使用移出卡槽时出错: {e}")
             return False, None, "移出卡槽失败，请稍后重试"
     
-    def cleanup_old_images(self, user_id, max_images=3):
-        """清理用户的旧游戏图片，保留最新的max_images张"""
-        try:
-            # 获取该用户的所有游戏图片
-            user_images = []
-            for filename in os.listdir(self.output_dir):
-                if filename.startswith(f"zhou_game_{user_id}_") and filename.endswith('.png'):
-                    file_path = os.path.join(self.output_dir, filename)
-                    # 获取文件修改时间
-                    mtime = os.path.getmtime(file_path)
-                    user_images.append((mtime, file_path, filename))
-            
-            # 按修改时间排序，最新的在前
-            user_images.sort(key=lambda x: x[0], reverse=True)
-            
-            # 删除超过限制数量的旧图片
-            if len(user_images) > max_images:
-                for _, file_path, filename in user_images[max_images:]:
-                    try:
-                        os.remove(file_path)
-                        print(f"已删除旧游戏图片: {filename}")
-                    except Exception as e:
-                        print(f"删除图片失败 {filename}: {e}")
-                        
-        except Exception as e:
-            print(f"清理旧图片时出错: {e}")
-    
     async def generate_game_image(self, user_id, game_state):
         """生成游戏图片"""
         try:
-            # 先清理旧图片
-            self.cleanup_old_images(user_id)
-            
             # 创建画布
             image = Image.new('RGB', self.BOARD_SIZE, (240, 248, 255))
             draw = ImageDraw.Draw(image)
@@ -964,10 +938,9 @@ class ZhouGame:
                 # 绘制物品图片
                 try:
                     if os.path.exists(card['image_path']):
-                        item_image = Image.open(card['image_path'])
                         # 放大物品图片显示，减少边距
                         item_size = (w - 16, h - 16)  # 从24改为16，放大物品显示
-                        item_image = item_image.resize(item_size, Image.Resampling.LANCZOS)
+                        item_image = get_sprite(card['image_path'], item_size, fit="stretch")
                         
                         # 居中粘贴物品图片
                         item_x = x + (w - item_size[0]) // 2
@@ -977,7 +950,6 @@ class ZhouGame:
                         if not card['clickable']:
                             # 创建半透明遮罩
                             overlay = Image.new('RGBA', item_size, (0, 0, 0, 120))
-                            item_image = item_image.convert('RGBA')
                             item_image = Image.alpha_composite(item_image, overlay)
                         
                         image.paste(item_image, (item_x, item_y), item_image if item_image.mode == 'RGBA' else None)
@@ -1071,9 +1043,8 @@ class ZhouGame:
                 # 绘制物品图片
                 try:
                     if os.path.exists(card['image_path']):
-                        item_image = Image.open(card['image_path'])
                         item_size = (w - 16, h - 16)  # 放大物品显示
-                        item_image = item_image.resize(item_size, Image.Resampling.LANCZOS)
+                        item_image = get_sprite(card['image_path'], item_size, fit="stretch")
                         item_x = x + (w - item_size[0]) // 2
                         item_y = y + (h - item_size[1]) // 2
                         image.paste(item_image, (item_x, item_y), item_image if item_image.mode == 'RGBA' else None)
@@ -1112,14 +1083,8 @@ class ZhouGame:
             
             # 游戏说明已移除
             
-            # 保存图片 - 使用游戏开始时间保持同一局游戏的文件名一致
-            game_start_time = game_state.get('game_start_time', datetime.now().strftime("%Y%m%d_%H%M%S"))
-            filename = f"zhou_game_{user_id}_{game_start_time}.png"
-            image_path = os.path.join(self.output_dir, filename)
-            
-            # 确保输出目录存在
-            os.makedirs(self.output_dir, exist_ok=True)
-            
+            # 保存图片 - 每次分配唯一文件名，发送后由调用方 release，旧图片由输出目录的后台任务清理
+            image_path = output_spool.allocate(f"zhou_game_{user_id}", ".png")
             image.save(image_path)
             print(f"游戏图片已保存到: {image_path}")
             
@@ -1133,7 +1098,7 @@ class ZhouGame:
     
     async def update_stats(self, user_id, won, score):
         """更新游戏统计"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.write() as db:
             # 获取当前统计
             cursor = await db.execute(
                 "SELECT games_played, games_won, best_score, total_score FROM zhou_stats WHERE user_id = ?",
@@ -1176,7 +1141,7 @@ class ZhouGame:
             
             if is_triggered:
                 # 偷吃触发的游戏，检查触发事件表
-                async with aiosqlite.connect(self.db_path) as db:
+                async with self.db.read() as db:
                     cursor = await db.execute(
                         "SELECT id FROM zhou_trigger_events WHERE user_id = ? AND reward_claimed = 0 ORDER BY trigger_time DESC LIMIT 1",
                         (user_id,)
@@ -1255,7 +1220,7 @@ class ZhouGame:
     
     async def get_game_stats(self, user_id):
         """获取游戏统计"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.read() as db:
             cursor = await db.execute(
                 "SELECT games_played, games_won, best_score, total_score FROM zhou_stats WHERE user_id = ?",
                 (user_id,)
@@ -1312,7 +1277,7 @@ class ZhouGame:
     
     async def save_group_game_state(self, group_id, game_state, players):
         """保存群组游戏状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.write() as db:
             game_data = json.dumps(game_state, ensure_ascii=False)
             players_data = json.dumps(players, ensure_ascii=False)
             
@@ -1324,7 +1289,7 @@ class ZhouGame:
     
     async def load_group_game_state(self, group_id):
         """加载群组游戏状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.read() as db:
             cursor = await db.execute(
                 "SELECT game_data, players FROM zhou_group_games WHERE group_id = ?",
                 (group_id,)
@@ -1,6 +1,4 @@
 import os
-import asyncio
-import aiosqlite  
 from datetime import datetime
 from astrbot.api.event import AstrMessageEvent
 from astrbot.api.star import Context, Star, register, StarTools
@@ -10,6 +8,13 @@ from .core.chixiao import ChixiaoSystem
 from .core.touchi_tools import TouchiTools
 from .core.tujian import TujianTools
 from .core.zhou import ZhouGame
+from .core.touchi import ensure_directories, warm_up_render_caches
+from .core.item_catalog import get_catalog
+from .core.warmup import PluginWarmup
+from .core.animation_output import AnimationOptions, AnimationFormatSelector
+from .core.render_pool import RenderPool
+from .core.output_spool import output_spool
+from .core.database import get_database, close_database
 
 
 
@@ -44,6 +49,13 @@ class Main(Star):
         
         # 读取静态图片配置
         self.enable_static_image = self.config.get("enable_static_image", False)
+
+        # 读取动图格式配置（gif/webp/apng，可按群单独设置）
+        self.animation_options = AnimationOptions.from_config(self.config)
+        self.animation_formats = AnimationFormatSelector.from_config(self.config)
+
+        # 保险箱渲染进程池（进程数、排队上限、超时均可配置，进程数为 0 时使用线程池）
+        self.render_pool = RenderPool.from_config(self.config, initializer=warm_up_render_caches)
         
         # 读取实验性概率调节配置（从 AstrBot 配置系统）
         self.experimental_custom_drop_rates = self.config.get("enable_custom_drop_rates", False)
@@ -83,9 +95,13 @@ class Main(Star):
         data_dir = os.path.join(astrbot_root, "data", "plugin_data", "astrbot_plugin_touchi")
         os.makedirs(data_dir, exist_ok=True)
         self.db_path = os.path.join(data_dir, "collection.db")
-        
-        # Initialize the database table
-        asyncio.create_task(self._initialize_database())
+
+        # 各子系统共用的数据库连接（一个写连接 + 读连接池，WAL 模式）
+        self.db = get_database(self.db_path)
+        self.db.configure(
+            readers=self.config.get("db_readers", 3),
+            busy_timeout=self.config.get("db_busy_timeout", 5000)
+        )
         
         # # 初始化转盘工具 - 改为独立调用
         # self.roulette_tools = RouletteTools(output_dir)
@@ -93,7 +109,6 @@ class Main(Star):
         # 初始化赤枢系统（必须在TouchiTools之前初始化）
         biaoqing_dir = os.path.join(os.path.dirname(__file__), "core", "biaoqing")
         self.chixiao_system = ChixiaoSystem(self.db_path, biaoqing_dir)
-        asyncio.create_task(self.chixiao_system.initialize_database())
         
         # Pass the database file PATH to the tools
         self.touchi_tools = TouchiTools(
@@ -102,6 +117,9 @@ class Main(Star):
             cd=5,
             db_path=self.db_path,
             enable_static_image=self.enable_static_image,
+            animation_options=self.animation_options,
+            animation_formats=self.animation_formats,
+            render_pool=self.render_pool,
             experimental_custom_drop_rates=self.experimental_custom_drop_rates,
             normal_mode_drop_rates=self.normal_mode_drop_rates,
             menggong_mode_drop_rates=self.menggong_mode_drop_rates,
@@ -115,10 +133,37 @@ class Main(Star):
         output_dir = os.path.join(os.path.dirname(__file__), "core", "output")
         self.zhou_game = ZhouGame(self.db_path, items_dir, output_dir)
 
+        # 后台预热：目录扫描、图片预加载和数据库表结构检查都不阻塞插件加载
+        self.warmup = PluginWarmup()
+        self.warmup.add_step("数据库表结构", self._initialize_database)
+        self.warmup.add_step("赤枢数据表", self.chixiao_system.initialize_database)
+        self.warmup.add_step("运行目录", ensure_directories)
+        self.warmup.add_step("物资目录与渲染缓存", self._warm_up_items)
+        self.warmup.start()
+
+        # 输出目录（保险箱、图鉴、洲了个洲、转盘图片）由后台任务按存放时间和总大小清理
+        output_spool.configure(
+            ttl=self.config.get("output_ttl", 600),
+            max_bytes=self.config.get("output_max_mb", 64) * 1024 * 1024
+        )
+        output_spool.start()
+
+    async def terminate(self):
+        """插件卸载时关闭渲染进程池、停止输出目录清理任务并关闭数据库连接"""
+        self.render_pool.shutdown()
+        output_spool.stop()
+        await close_database(self.db_path)
+
+    def _warm_up_items(self):
+        """在线程池中加载物资目录；保险箱在当前进程渲染时（线程池模式）同时预热物品图片和表情帧"""
+        get_catalog()
+        if self.render_pool.workers == 0:
+            warm_up_render_caches()
+
     async def _initialize_database(self):
         """Initializes the database and creates the table if it doesn't exist."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.write() as db:
                 await db.execute("""
                     CREATE TABLE IF NOT EXISTS user_touchi_collection (
                         user_id TEXT NOT NULL,
@@ -279,6 +324,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.get_touchi(event):
             yield result
 
@@ -291,12 +339,16 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             user_id = event.get_sender_id()
             result_path_or_msg = await self.tujian_tools.generate_tujian(user_id)
             
             if os.path.exists(result_path_or_msg):
                 yield event.image_result(result_path_or_msg)
+                output_spool.release(result_path_or_msg)
             else:
                 yield event.plain_result(result_path_or_msg)
         except Exception as e:
@@ -310,6 +362,9 @@ class Main(Star):
        if event.role != "admin":
            yield event.plain_result("❌ 此指令仅限管理员使用")
            return
+       
+       # 插件预热未完成时等待
+       await self.warmup.wait()
            
        try:
            plain_text = event.message_str.strip()
@@ -346,6 +401,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.menggong_attack(event):
             yield result
 
@@ -358,6 +416,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.upgrade_teqin(event):
             yield result
 
@@ -370,6 +431,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.get_warehouse_info(event):
             yield result
 
@@ -382,6 +446,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.get_leaderboard(event):
             yield result
 
@@ -394,6 +461,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.start_auto_touchi(event):
             yield result
 
@@ -406,6 +476,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.stop_auto_touchi(event):
             yield result
 
@@ -417,6 +490,9 @@ class Main(Star):
             yield event.plain_result("❌ 此指令仅限管理员使用")
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             plain_text = event.message_str.strip()
             args = plain_text.split()
@@ -444,6 +520,9 @@ class Main(Star):
         if event.role != "admin":
             yield event.plain_result("❌ 此指令仅限管理员使用")
             return
+        
+        # 插件预热未完成时等待
+        await self.warmup.wait()
             
         try:
             plain_text = event.message_str.strip()
@@ -691,6 +770,9 @@ class Main(Star):
             yield event.plain_result("❌ 此指令仅限管理员使用")
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             plain_text = event.message_str.strip()
             args = plain_text.split()
@@ -733,6 +815,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         async for result in self.touchi_tools.jianshi_items(event):
             yield result
     
@@ -815,6 +900,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             group_id = event.get_group_id()
             user_id = event.get_sender_id()
@@ -838,6 +926,7 @@ class Main(Star):
                 if os.path.exists(image_path):
                     print(f"[DEBUG] 主动游戏图片文件存在，准备发送: {image_path}")
                     yield event.image_result(image_path)
+                    output_spool.release(image_path)
                     yield event.plain_result(message)
                 else:
                     print(f"[DEBUG] 主动游戏图片文件不存在: {image_path}")
@@ -859,6 +948,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             plain_text = event.message_str.strip()
             args = plain_text.split()[1:]  # 去掉"拿"指令本身
@@ -889,6 +981,7 @@ class Main(Star):
             
             if success and image_path:
                 yield event.image_result(image_path)
+                output_spool.release(image_path)
                 if message:  # 只有在有消息时才发送文字提示
                     yield event.plain_result(message)
             else:
@@ -908,6 +1001,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             group_id = event.get_group_id()
             user_id = event.get_sender_id()
@@ -921,6 +1017,7 @@ class Main(Star):
             
             if success and image_path:
                 yield event.image_result(image_path)
+                output_spool.release(image_path)
                 if message:  # 只有在有消息时才发送文字提示
                     yield event.plain_result(message)
             else:
@@ -940,6 +1037,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             group_id = event.get_group_id()
             user_id = event.get_sender_id()
@@ -953,6 +1053,7 @@ class Main(Star):
             
             if success and image_path:
                 yield event.image_result(image_path)
+                output_spool.release(image_path)
                 if message:  # 只有在有消息时才发送文字提示
                     yield event.plain_result(message)
             else:
@@ -972,6 +1073,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             group_id = event.get_group_id()
             user_id = event.get_sender_id()
@@ -985,6 +1089,7 @@ class Main(Star):
             
             if success and image_path:
                 yield event.image_result(image_path)
+                output_spool.release(image_path)
                 if message:  # 只有在有消息时才发送文字提示
                     yield event.plain_result(message)
             else:
@@ -1004,6 +1109,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             user_id = event.get_sender_id()
             stats = await self.zhou_game.get_game_stats(user_id)
@@ -1036,6 +1144,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             user_id = event.get_sender_id()
             
@@ -1086,6 +1197,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             user_id = event.get_sender_id()
             success, message = await self.chixiao_system.cancel_chixiao(user_id)
@@ -1104,6 +1218,9 @@ class Main(Star):
                 yield event.plain_result(error_msg)
             return
         
+        # 插件预热未完成时等待
+        await self.warmup.wait()
+        
         try:
             group_id = event.get_group_id()
             
@@ -1158,21 +1275,16 @@ class Main(Star):
             try:
                 from .roulette_standalone import generate_roulette
                 
-                # 生成转盘
-                result = generate_roulette()
+                # 生成转盘（按群选择动图格式）
+                result = generate_roulette(self.animation_formats.format_for(event), self.animation_options)
                 
                 if result["success"]:
                     # 发送GIF
                     gif_path = result["gif_path"]
                     if os.path.exists(gif_path):
                         yield event.image_result(gif_path)
-                        
-                        # 成功发送后删除GIF
-                        try:
-                            os.remove(gif_path)
-                            logger.info(f"已删除转盘GIF: {gif_path}")
-                        except Exception as e:
-                            logger.warning(f"删除GIF文件失败: {e}")
+                        # 发送完成，文件由输出目录的后台任务清理
+                        output_spool.release(gif_path)
                     else:
                         yield event.plain_result("❌ 转盘GIF文件未找到")
                 else:
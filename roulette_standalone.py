@@ -2,10 +2,17 @@ import os
 import random
 import math
 from PIL import Image, ImageDraw, ImageFont
-from datetime import datetime
 import sys
 import logging
 
+try:
+    from .core.animation_output import encode_animation, FORMAT_EXTENSIONS
+    from .core.output_spool import output_spool
+except ImportError:
+    # 独立运行时插件目录就是脚本目录
+    from core.animation_output import encode_animation, FORMAT_EXTENSIONS
+    from core.output_spool import output_spool
+
 # 独立运行的日志配置
 class Logger:
     def __init__(self):
@@ -313,8 +320,8 @@ class RouletteWheel:
         # 如果地图不在约束中，从所有难度中随机选择
         return random.choice(self.wheel_configs[1]["items"])
     
-    def generate_roulette_gif(self):
-        """生成转盘GIF动画（使用PIL生成帧序列）"""
+    def generate_roulette_gif(self, output_format="gif", animation_options=None):
+        """生成转盘动画（使用PIL生成帧序列），output_format 为 gif/webp/apng"""
         try:
             # 为每个转盘生成随机的最终角度
             final_angles = []
@@ -473,27 +480,26 @@ class RouletteWheel:
                 
                 frames.append(canvas)
             
-            # 保存为GIF（使用PIL的save方法）
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            gif_path = os.path.join(self.output_dir, f"roulette_{timestamp}.gif")
-            
-            # 使用PIL保存GIF
-            frames[0].save(
-                gif_path,
-                save_all=True,
-                append_images=frames[1:],
+            # 保存动图（停止后的相同帧会合并），发送后由调用方 release，旧文件由输出目录的后台任务清理
+            data, output_format = encode_animation(
+                frames,
+                output_format,
                 duration=100,  # 每帧100ms
-                loop=0
+                loop=0,
+                options=animation_options
             )
+            gif_path = output_spool.allocate("roulette", FORMAT_EXTENSIONS[output_format])
+            with open(gif_path, "wb") as f:
+                f.write(data)
             
-            logger.info(f"转盘GIF已生成: {gif_path}")
+            logger.info(f"转盘动图已生成: {gif_path}")
             return gif_path, final_results
             
         except Exception as e:
             logger.error(f"生成转盘GIF失败: {e}")
             raise
 
-def generate_roulette():
+def generate_roulette(output_format="gif", animation_options=None):
     """独立函数：生成转盘并返回结果"""
     try:
         # 获取当前文件所在目录
@@ -504,7 +510,7 @@ def generate_roulette():
         roulette = RouletteWheel(output_dir)
         
         # 生成转盘GIF
-        gif_path, results = roulette.generate_roulette_gif()
+        gif_path, results = roulette.generate_roulette_gif(output_format, animation_options)
         
         # 构建结果消息
         result_message = "🎲 鼠鼠转盘结果 🎲\n\n"
@@ -0,0 +1,21 @@
+import os
+import sys
+
+# 与 benchmark_*.py 相同，直接导入插件目录下的 core 包
+plugin_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if plugin_dir not in sys.path:
+    sys.path.insert(0, plugin_dir)
+
+# 没有安装 AstrBot 时只提供 core 中用到的 astrbot.api.logger
+try:
+    import astrbot.api  # noqa: F401
+except ImportError:
+    import logging
+    import types
+
+    astrbot = types.ModuleType("astrbot")
+    astrbot_api = types.ModuleType("astrbot.api")
+    astrbot_api.logger = logging.getLogger("astrbot")
+    astrbot.api = astrbot_api
+    sys.modules["astrbot"] = astrbot
+    sys.modules["astrbot.api"] = astrbot_api
@@ -0,0 +1,71 @@
+import threading
+
+from core.artifact_store import ArtifactStore
+
+
+def test_put_get_release():
+    store = ArtifactStore()
+    handle = store.put(b"GIF89a", ".gif")
+    assert handle.endswith(".gif")
+    assert store.get(handle) == b"GIF89a"
+    assert store.extension(handle) == ".gif"
+    assert store.total_bytes == 6 and len(store) == 1
+
+    store.release(handle)
+    assert store.get(handle) is None
+    assert store.extension(handle) is None
+    assert len(store) == 0 and store.total_bytes == 0
+
+
+def test_handles_are_unique():
+    store = ArtifactStore()
+    handles = {store.put(b"x", ".png") for _ in range(1000)}
+    assert len(handles) == 1000
+
+
+def test_data_kept_until_every_reference_is_released():
+    store = ArtifactStore()
+    handle = store.put(b"data", ".webp")
+    assert store.acquire(handle)
+    assert store.acquire(handle)
+
+    store.release(handle)
+    store.release(handle)
+    assert store.get(handle) == b"data"
+
+    store.release(handle)
+    assert store.get(handle) is None
+
+
+def test_released_handle_cannot_be_acquired_and_extra_release_is_ignored():
+    store = ArtifactStore()
+    handle = store.put(b"data", ".gif")
+    other = store.put(b"other", ".gif")
+    store.release(handle)
+
+    assert not store.acquire(handle)
+    store.release(handle)
+    store.release(None)
+    store.release("")
+    assert store.get(other) == b"other" and len(store) == 1
+
+
+def test_concurrent_acquire_release():
+    store = ArtifactStore()
+    handle = store.put(b"data", ".gif")
+
+    def worker():
+        for _ in range(1000):
+            assert store.acquire(handle)
+            store.release(handle)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 其他线程的引用全部释放后，put 时的引用仍然保留
+    assert store.get(handle) == b"data"
+    store.release(handle)
+    assert len(store) == 0
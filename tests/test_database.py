@@ -0,0 +1,214 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from core.database import Database
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def open_database(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    await db.execute("CREATE TABLE economy (user_id TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)")
+    return db
+
+
+def test_write_is_reentrant_within_task(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            async with db.write() as outer:
+                await outer.execute("INSERT INTO economy (user_id, value) VALUES ('a', 1)")
+                # 同一任务内嵌套使用写连接不会死锁，共用外层的连接和事务
+                async with db.write() as inner:
+                    assert inner is outer
+                    await inner.execute("UPDATE economy SET value = value + 1 WHERE user_id = 'a'")
+                assert outer.in_transaction
+                await outer.commit()
+            assert await db.fetchone("SELECT value FROM economy WHERE user_id = 'a'") == (2,)
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_write_serializes_tasks_and_discards_uncommitted(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        order = []
+        try:
+            async def first():
+                async with db.write() as conn:
+                    order.append("first start")
+                    await conn.execute("INSERT INTO economy (user_id, value) VALUES ('a', 1)")
+                    await asyncio.sleep(0.05)
+                    order.append("first end")
+                    # 没有提交，离开时回滚
+
+            async def second():
+                await asyncio.sleep(0.01)
+                async with db.write() as conn:
+                    order.append("second")
+                    await conn.execute("INSERT INTO economy (user_id, value) VALUES ('b', 1)")
+                    await conn.commit()
+
+            await asyncio.gather(first(), second())
+            assert order == ["first start", "first end", "second"]
+            assert await db.fetchall("SELECT user_id FROM economy") == [("b",)]
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_readers_see_committed_wal_data(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            assert await db.fetchone("PRAGMA journal_mode") == ("wal",)
+            async with db.write() as conn:
+                await conn.execute("INSERT INTO economy (user_id, value) VALUES ('a', 5)")
+                # 提交前读连接看不到修改，也不会被写事务阻塞
+                assert await db.fetchone("SELECT value FROM economy WHERE user_id = 'a'") is None
+                await conn.commit()
+            assert await db.fetchone("SELECT value FROM economy WHERE user_id = 'a'") == (5,)
+
+            # 复用的读连接也能读到之后提交的数据
+            await db.execute("UPDATE economy SET value = 6 WHERE user_id = 'a'")
+            results = await asyncio.gather(*(
+                db.fetchone("SELECT value FROM economy WHERE user_id = 'a'") for _ in range(db.readers * 2)
+            ))
+            assert results == [(6,)] * (db.readers * 2)
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_settlement_commits_once(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            settlement = db.settlement()
+            settlement.add("INSERT OR IGNORE INTO economy (user_id) VALUES (?)", ("a",))
+            settlement.add("UPDATE economy SET value = value + ? WHERE user_id = ?", (3, "a"))
+            assert len(settlement) == 2
+            # 提交前没有写入
+            assert await db.fetchone("SELECT value FROM economy WHERE user_id = 'a'") is None
+            await settlement.commit()
+            assert len(settlement) == 0
+            assert await db.fetchone("SELECT value FROM economy WHERE user_id = 'a'") == (3,)
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_settlement_rolls_back_when_a_statement_fails(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            settlement = db.settlement()
+            settlement.add("INSERT INTO economy (user_id, value) VALUES (?, ?)", ("a", 1))
+            settlement.add("UPDATE economy SET value = value + 1 WHERE user_id = ?", ("a",))
+            settlement.add("INSERT INTO missing_table VALUES (1)")
+            with pytest.raises(Exception):
+                await settlement.commit()
+            assert await db.fetchall("SELECT * FROM economy") == []
+
+            # 写连接已经释放，之后的写操作正常执行
+            await db.execute("INSERT INTO economy (user_id, value) VALUES ('b', 1)")
+            assert await db.fetchall("SELECT user_id FROM economy") == [("b",)]
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_settlement_fetchone_holds_writer_until_commit(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        await db.execute("INSERT INTO economy (user_id, value) VALUES ('a', 10)")
+        try:
+            async def settle(delay):
+                settlement = db.settlement()
+                row = await settlement.fetchone("SELECT value FROM economy WHERE user_id = 'a'")
+                await asyncio.sleep(delay)
+                settlement.add("UPDATE economy SET value = 0 WHERE user_id = 'a'")
+                settlement.add("INSERT INTO economy (user_id, value) VALUES (?, ?)", (f"paid{delay}", row[0]))
+                await settlement.commit()
+                return row[0]
+
+            # 两个结算读取同一行：后一个要等前一个提交后才能读取，不会重复结算
+            paid = await asyncio.gather(settle(0.05), settle(0))
+            assert sorted(paid) == [0, 10]
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_settlement_close_releases_writer(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            settlement = db.settlement()
+            await settlement.fetchone("SELECT COUNT(*) FROM economy")
+            settlement.add("INSERT INTO economy (user_id, value) VALUES ('a', 1)")
+            await settlement.close()
+            await asyncio.wait_for(db.execute("INSERT INTO economy (user_id, value) VALUES ('b', 1)"), 1)
+            assert await db.fetchall("SELECT user_id FROM economy") == [("b",)]
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_nested_write_inside_settlement_commits_with_it(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            settlement = db.settlement()
+            await settlement.fetchone("SELECT COUNT(*) FROM economy")
+            # 结算占用写连接时，同一任务内的其他写操作不能单独提交
+            await db.execute("INSERT INTO economy (user_id, value) VALUES ('a', 1)")
+            settlement.add("INSERT INTO economy (user_id, value) VALUES ('b', 1)")
+            await settlement.close()
+            assert await db.fetchall("SELECT * FROM economy") == []
+
+            await settlement.fetchone("SELECT COUNT(*) FROM economy")
+            await db.execute("INSERT INTO economy (user_id, value) VALUES ('a', 1)")
+            settlement.add("INSERT INTO economy (user_id, value) VALUES ('b', 1)")
+            await settlement.commit()
+            assert await db.fetchall("SELECT user_id FROM economy ORDER BY user_id") == [("a",), ("b",)]
+        finally:
+            await db.close()
+
+    run(main())
+
+
+def test_nested_rollback_inside_settlement_fails_it(tmp_path):
+    async def main():
+        db = await open_database(tmp_path)
+        try:
+            settlement = db.settlement()
+            await settlement.fetchone("SELECT COUNT(*) FROM economy")
+            async with db.write() as conn:
+                await conn.execute("INSERT INTO economy (user_id, value) VALUES ('a', 1)")
+                await conn.rollback()
+            settlement.add("INSERT INTO economy (user_id, value) VALUES ('b', 1)")
+            with pytest.raises(RuntimeError):
+                await settlement.commit()
+            assert await db.fetchall("SELECT * FROM economy") == []
+
+            # 写连接已经释放，之后的写操作正常提交
+            await db.execute("INSERT INTO economy (user_id, value) VALUES ('c', 1)")
+            assert await db.fetchall("SELECT user_id FROM economy") == [("c",)]
+        finally:
+            await db.close()
+
+    run(main())
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from core import item_catalog as catalog_module
+from core.item_catalog import ItemCatalog, CHECK_INTERVAL
+
+
+class Clock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # 只替换物资目录模块中的 time，事件循环仍使用真实时钟
+    monkeypatch.setattr(catalog_module, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_sync_callers_refresh_inline(tmp_path, clock):
+    (tmp_path / "blue_1x1_a_100.png").write_bytes(b"")
+    catalog = ItemCatalog([("items", str(tmp_path))])
+    assert [item["stem"] for item in catalog.ensure_loaded().items] == ["blue_1x1_a_100"]
+
+    (tmp_path / "gold_2x1_b_200.png").write_bytes(b"")
+    # 检查间隔内不扫描目录
+    assert len(catalog.ensure_loaded().items) == 1
+    clock.now += CHECK_INTERVAL
+    assert catalog.ensure_loaded().get_value("gold_2x1_b") == 200
+
+
+def test_event_loop_callers_only_read_memory(tmp_path, clock, monkeypatch):
+    (tmp_path / "blue_1x1_a_100.png").write_bytes(b"")
+    catalog = ItemCatalog([("items", str(tmp_path))]).ensure_loaded()
+    (tmp_path / "gold_2x1_b_200.png").write_bytes(b"")
+    clock.now += CHECK_INTERVAL
+
+    stat_threads = set()
+    stat_dir = catalog_module._stat_dir
+
+    def recording_stat_dir(path):
+        stat_threads.add(threading.get_ident())
+        return stat_dir(path)
+
+    monkeypatch.setattr(catalog_module, "_stat_dir", recording_stat_dir)
+
+    async def main():
+        loop_thread = threading.get_ident()
+        # 事件循环中的查询立即返回内存中的目录，目录检查在后台线程中进行
+        assert len(catalog.ensure_loaded().items) == 1
+        for _ in range(100):
+            if catalog.get("gold_2x1_b"):
+                break
+            await asyncio.sleep(0.01)
+        assert catalog.get_value("gold_2x1_b") == 200
+        assert stat_threads and loop_thread not in stat_threads
+
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from core import output_spool as spool_module
+from core.output_spool import OutputSpool, MAX_HOLD
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(spool_module.time, "time", clock)
+    return clock
+
+
+def write(path, size=10):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_allocate_returns_unique_paths(tmp_path, clock):
+    spool = OutputSpool(directory=str(tmp_path))
+    paths = {spool.allocate("safe", ".gif") for _ in range(100)}
+    assert len(paths) == 100
+    assert all(os.path.dirname(path) == str(tmp_path) and path.endswith(".gif") for path in paths)
+
+
+def test_file_is_kept_until_released_and_ttl_passes(tmp_path, clock):
+    spool = OutputSpool(directory=str(tmp_path), ttl=60)
+    path = write(spool.allocate("safe", ".gif"))
+
+    # 还在发送中（没有 release）时不删除
+    clock.now += 120
+    assert spool.sweep() == 0 and os.path.exists(path)
+
+    spool.release(path)
+    clock.now += 30
+    assert spool.sweep() == 0 and os.path.exists(path)
+
+    clock.now += 31
+    assert spool.sweep() == 1
+    assert not os.path.exists(path)
+    assert len(spool) == 0
+
+
+def test_acquire_needs_matching_release(tmp_path, clock):
+    spool = OutputSpool(directory=str(tmp_path), ttl=0)
+    path = write(spool.allocate("tujian", ".png"))
+    assert spool.acquire(path)
+
+    spool.release(path)
+    assert spool.sweep() == 0 and os.path.exists(path)
+
+    spool.release(path)
+    assert spool.sweep() == 1 and not os.path.exists(path)
+
+    # 已经清理的文件不能再 acquire，多余的 release 不报错
+    assert not spool.acquire(path)
+    spool.release(path)
+    spool.release(None)
+
+
+def test_size_cap_removes_oldest_released_first(tmp_path, clock):
+    spool = OutputSpool(directory=str(tmp_path), ttl=3600, max_bytes=15)
+    held = write(spool.allocate("held", ".gif"))
+    paths = []
+    for _ in range(3):
+        path = write(spool.allocate("safe", ".gif"))
+        spool.release(path)
+        paths.append(path)
+        clock.now += 1
+
+    # 已释放的文件共 30 字节，超出上限 15：从最早释放的开始删除，正在使用的文件不删除
+    assert spool.sweep() == 2
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
+    assert os.path.exists(held)
+    assert spool.total_bytes == 10
+
+
+def test_unreleased_file_is_reclaimed_after_max_hold(tmp_path, clock):
+    spool = OutputSpool(directory=str(tmp_path), ttl=60)
+    path = write(spool.allocate("safe", ".gif"))
+    clock.now += MAX_HOLD - 1
+    assert spool.sweep() == 0
+    clock.now += 1
+    assert spool.sweep() == 1 and not os.path.exists(path)
+
+
+def test_first_sweep_adopts_leftover_files(tmp_path, clock):
+    old = write(str(tmp_path / "safe_old.gif"))
+    recent = write(str(tmp_path / "safe_recent.gif"))
+    os.utime(old, (clock.now - 120, clock.now - 120))
+    os.utime(recent, (clock.now - 10, clock.now - 10))
+
+    spool = OutputSpool(directory=str(tmp_path), ttl=60)
+    assert spool.sweep() == 1
+    assert not os.path.exists(old) and os.path.exists(recent)
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from core.touchi import place_items
+
+SIZES = [(1, 1), (1, 2), (2, 1), (1, 3), (3, 1), (2, 2), (2, 3), (3, 2), (3, 3), (1, 4), (4, 1), (2, 4), (4, 2)]
+LEVELS = ["blue", "purple", "gold", "red"]
+REGIONS = [(2, 1), (3, 1), (4, 1), (4, 2), (4, 3), (4, 4), (5, 5), (6, 6), (7, 7)]
+
+
+def random_items(rng, count):
+    items = []
+    for i in range(count):
+        width, height = rng.choice(SIZES)
+        items.append({"name": f"item_{i}", "grid_width": width, "grid_height": height, "level": rng.choice(LEVELS)})
+    return items
+
+
+def reference_place_items(items, grid_width, grid_height, total_grid_size=2):
+    """原来逐格检查的放置方式，作为位掩码放置的对照"""
+    grid = [0] * (grid_width * grid_height)
+    placed = []
+    sorted_items = items.copy()
+    random.shuffle(sorted_items)
+
+    for item in sorted_items:
+        orientations = [(item["grid_width"], item["grid_height"], False)]
+        if item["grid_width"] != item["grid_height"]:
+            orientations.append((item["grid_height"], item["grid_width"], True))
+
+        placed_success = False
+        for y in range(grid_height):
+            for x in range(grid_width):
+                for width, height, rotated in orientations:
+                    if x + width > total_grid_size or y + height > total_grid_size:
+                        continue
+                    cells = [(x + j, y + i) for i in range(height) for j in range(width)
+                             if x + j < grid_width and y + i < grid_height]
+                    if any(grid[cy * grid_width + cx] for cx, cy in cells):
+                        continue
+                    for cx, cy in cells:
+                        grid[cy * grid_width + cx] = 1
+                    placed.append({"item": item, "x": x, "y": y, "width": width, "height": height,
+                                   "rotated": rotated})
+                    placed_success = True
+                    break
+                if placed_success:
+                    break
+            if placed_success:
+                break
+    return placed
+
+
+def region_cells(placed, grid_width, grid_height):
+    """物品在放置格子内占用的格子（超出放置格子的部分不占位）"""
+    return [
+        (x, y)
+        for x in range(placed["x"], min(placed["x"] + placed["width"], grid_width))
+        for y in range(placed["y"], min(placed["y"] + placed["height"], grid_height))
+    ]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_place_items_valid(seed):
+    rng = random.Random(seed)
+    region_width, region_height = rng.choice(REGIONS)
+    total_grid_size = max(region_width, region_height, rng.randint(2, 7))
+    items = random_items(rng, rng.randint(0, 20))
+
+    placed_items = place_items(items, region_width, region_height, total_grid_size)
+
+    occupied = set()
+    for placed in placed_items:
+        width, height = placed["item"]["grid_width"], placed["item"]["grid_height"]
+        assert (placed["width"], placed["height"]) == ((height, width) if placed["rotated"] else (width, height))
+        # 左上角在放置格子内，整体不超出总格子
+        assert 0 <= placed["x"] < region_width and 0 <= placed["y"] < region_height
+        assert placed["x"] + placed["width"] <= total_grid_size
+        assert placed["y"] + placed["height"] <= total_grid_size
+        cells = region_cells(placed, region_width, region_height)
+        assert occupied.isdisjoint(cells)
+        occupied.update(cells)
+
+    assert len({id(placed["item"]) for placed in placed_items}) == len(placed_items)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_place_items_matches_reference(seed):
+    rng = random.Random(seed)
+    region_width, region_height = rng.choice(REGIONS)
+    total_grid_size = max(region_width, region_height, rng.randint(2, 7))
+    items = random_items(rng, rng.randint(0, 20))
+
+    random.seed(seed)
+    expected = reference_place_items(items, region_width, region_height, total_grid_size)
+    random.seed(seed)
+    actual = place_items(items, region_width, region_height, total_grid_size)
+
+    key = lambda placed: (placed["item"]["name"], placed["x"], placed["y"], placed["width"], placed["height"],
+                          placed["rotated"])
+    assert [key(placed) for placed in actual] == [key(placed) for placed in expected]
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from core import sprite_cache as sprite_module
+from core.sprite_cache import PrebuiltAssets, MANIFEST_NAME, MANIFEST_VERSION, MANIFEST_CHECK_INTERVAL, asset_key
+
+
+class Clock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sprite_module.time, "monotonic", clock)
+    return clock
+
+
+def write_manifest(directory, source, built_name):
+    built_path = os.path.join(directory, built_name)
+    with open(built_path, "wb") as f:
+        f.write(b"built")
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "sources": {asset_key(source): sprite_module.source_signature(source)},
+        "files": {asset_key(source): built_name}
+    }
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return built_path
+
+
+def test_rebuilt_manifest_is_picked_up_without_restart(tmp_path, clock):
+    source = tmp_path / "source.png"
+    source.write_bytes(b"source")
+    prebuilt = PrebuiltAssets(str(tmp_path))
+    # 还没有构建时使用原文件
+    assert prebuilt.file(str(source)) is None
+
+    first = write_manifest(str(tmp_path), str(source), "first.png")
+    clock.now += MANIFEST_CHECK_INTERVAL
+    assert prebuilt.file(str(source)) == first
+
+    second = write_manifest(str(tmp_path), str(source), "second.png")
+    os.utime(os.path.join(tmp_path, MANIFEST_NAME), ns=(1, 1))
+    # 检查间隔内继续使用已经读取的清单
+    assert prebuilt.file(str(source)) == first
+    clock.now += MANIFEST_CHECK_INTERVAL
+    assert prebuilt.file(str(source)) == second
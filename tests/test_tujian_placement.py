@@ -0,0 +1,90 @@
+import math
+import random
+
+import pytest
+
+from core.tujian import place_items, LEVEL_PRIORITY
+
+SIZES = [(1, 1), (1, 2), (2, 1), (1, 3), (3, 1), (2, 2), (2, 3), (3, 2), (3, 3), (1, 4), (4, 1), (2, 4), (4, 2)]
+
+
+def random_items(rng, count):
+    items = []
+    for _ in range(count):
+        width, height = rng.choice(SIZES)
+        items.append({"grid_width": width, "grid_height": height, "level": rng.choice(["red", "gold"])})
+    return items
+
+
+def reference_place_items(items):
+    """原来的逐格放置方式（正方形网格，放不下时扩大），作为天际线放置的对照"""
+    total_area = sum(item["grid_width"] * item["grid_height"] for item in items)
+    grid_size = max(5, math.ceil(math.sqrt(total_area * 1.5)))
+    sorted_items = sorted(
+        items,
+        key=lambda x: (LEVEL_PRIORITY.get(x["level"], 0), x["grid_width"] * x["grid_height"]),
+        reverse=True
+    )
+    while True:
+        grid = [[0] * grid_size for _ in range(grid_size)]
+        placed = 0
+        for item in sorted_items:
+            orientations = [(item["grid_width"], item["grid_height"])]
+            if item["grid_width"] != item["grid_height"]:
+                orientations.append((item["grid_height"], item["grid_width"]))
+            done = False
+            for width, height in orientations:
+                for y in range(grid_size - height + 1):
+                    for x in range(grid_size - width + 1):
+                        if all(grid[y + i][x + j] == 0 for i in range(height) for j in range(width)):
+                            for i in range(height):
+                                for j in range(width):
+                                    grid[y + i][x + j] = 1
+                            done = True
+                            break
+                    if done:
+                        break
+                if done:
+                    break
+            placed += done
+        if placed == len(items):
+            return grid_size, grid_size
+        grid_size += 1
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_place_items_valid(seed):
+    rng = random.Random(seed)
+    items = random_items(rng, rng.randint(1, 60))
+
+    placed_items, grid_width, grid_height = place_items(items)
+
+    # 全部物品都放下，每个物品只放一次
+    assert len(placed_items) == len(items)
+    assert {id(placed["item"]) for placed in placed_items} == {id(item) for item in items}
+
+    occupied = set()
+    for placed in placed_items:
+        width, height = placed["item"]["grid_width"], placed["item"]["grid_height"]
+        assert (placed["width"], placed["height"]) == ((height, width) if placed["rotated"] else (width, height))
+        assert 0 <= placed["x"] and placed["x"] + placed["width"] <= grid_width
+        assert 0 <= placed["y"] and placed["y"] + placed["height"] <= grid_height
+        cells = {(x, y) for x in range(placed["x"], placed["x"] + placed["width"])
+                 for y in range(placed["y"], placed["y"] + placed["height"])}
+        assert occupied.isdisjoint(cells)
+        occupied |= cells
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_place_items_not_larger_than_reference(seed):
+    rng = random.Random(seed)
+    items = random_items(rng, rng.randint(1, 60))
+
+    _, grid_width, grid_height = place_items(items)
+    reference_width, reference_height = reference_place_items(items)
+
+    assert grid_width * grid_height <= reference_width * reference_height
+
+
+def test_place_items_empty():
+    assert place_items([]) == ([], 0, 0)